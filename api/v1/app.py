@@ -2,16 +2,25 @@
 """Route module for the API
 """
 from os import getenv
+import json
+import logging
+from time import perf_counter
+import click
 from flask import Flask, jsonify, abort, request, g
 from flask_cors import CORS
 from flask_babel import Babel, _
 from flasgger import Swagger
+from werkzeug.http import parse_cookie
 from api.v1.routes import app_routes
 from api.v1.auth import auth, require_auth
 from config import Config
-from models import storage
+from models import storage, leaderboard, QuizStats, UserStats
+from models.engine.instrumentation import start_collecting, stop_collecting
+from models.engine.regrade import regrade_quiz
 
 
+sql_log = logging.getLogger("quizquickie.sql")
+
 app = Flask(__name__)
 app.register_blueprint(app_routes)
 app.config.from_object(Config)
@@ -46,6 +55,68 @@ def close_connection(s):
     storage.close()
 
 
+@app.before_request
+def collect_queries():
+    """count and time the SQL statements of the request"""
+    g.query_stats, g.query_stats_token = start_collecting()
+    g.request_start = perf_counter()
+
+
+@app.after_request
+def report_queries(response):
+    """log the SQL statements of the request, and add them to a debug
+    header when QQ_SQL_DEBUG is set"""
+    stats = g.pop("query_stats", None)
+    if stats is None:
+        return response
+    stop_collecting(g.pop("query_stats_token"))
+    line = {
+        "method": request.method,
+        "endpoint": request.endpoint,
+        "status": response.status_code,
+        "ms": round((perf_counter() - g.request_start) * 1000, 3),
+        **stats.as_dict(),
+    }
+    if stats.n_plus_one:
+        sql_log.warning(json.dumps(line))
+    else:
+        sql_log.info(json.dumps(line))
+    if getenv("QQ_SQL_DEBUG"):
+        response.headers["X-QQ-Queries"] = stats.header()
+    return response
+
+
+def client_key():
+    """identify the client of a request for read-your-writes routing"""
+    return (
+        request.cookies.get(getenv("SESSION_NAME", "session_id"))
+        or request.headers.get("Authorization")
+        or request.remote_addr
+    )
+
+
+@app.before_request
+def route_reads():
+    """send GET requests to a read replica unless the client wrote recently"""
+    if not getattr(storage, "replicas", None):
+        return
+    storage.read_only(
+        request.method == "GET" and not storage.wrote_recently(client_key())
+    )
+
+
+@app.after_request
+def track_writes(response):
+    """open the read-your-writes window of a client that wrote"""
+    if getattr(storage, "replicas", None) and storage.has_written():
+        storage.mark_write(client_key())
+        for cookie in response.headers.getlist("Set-Cookie"):
+            session_id = parse_cookie(cookie).get(getenv("SESSION_NAME", "session_id"))
+            if session_id:
+                storage.mark_write(session_id)
+    return response
+
+
 @app.before_request
 def auth_handler():
     """Auth handler function"""
@@ -90,6 +161,40 @@ def not_found(error) -> str:
     return jsonify({"error": _("unexpected")}), 500
 
 
+@app.cli.command("rebuild-quiz-stats")
+@click.argument("quiz_id", type=int, required=False)
+def rebuild_quiz_stats(quiz_id=None):
+    """recompute the quiz_stats rollups from the quiz attempts"""
+    with storage.transaction() as session:
+        rows = QuizStats.rebuild(session, quiz_id)
+    click.echo(f"rebuilt the stats of {rows} quizzes")
+
+
+@app.cli.command("reconcile-user-stats")
+@click.argument("user_ids", type=int, nargs=-1)
+def reconcile_user_stats(user_ids=()):
+    """recompute the user_stats profile counters, fixing any drift"""
+    with storage.transaction() as session:
+        rows = UserStats.reconcile(session, user_ids or None)
+    click.echo(f"reconciled the stats of {rows} users")
+
+
+@app.cli.command("regrade-quiz")
+@click.argument("quiz_id", type=int)
+def regrade_quiz_command(quiz_id):
+    """rescore the attempts of a quiz against its current answer key"""
+    with storage.transaction() as session:
+        report = regrade_quiz(session, quiz_id)
+        if report is not None and report.changed and leaderboard is not None:
+            leaderboard.touch(session)
+    if report is None:
+        raise click.ClickException(f"no quiz with id {quiz_id}")
+    click.echo(
+        f"regraded {report.attempts} attempts of quiz {quiz_id},"
+        f" {report.changed} changed score"
+    )
+
+
 if __name__ == "__main__":
     host = getenv("API_HOST")
     port = getenv("API_PORT")
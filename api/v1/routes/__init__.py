@@ -13,4 +13,5 @@ from api.v1.routes.user_quizzes import *
 from api.v1.routes.profiles import *
 from api.v1.routes.quizzes import *
 from api.v1.routes.groups import *
+from api.v1.routes.autocomplete import *
 from api.v1.routes.test_only_route import *
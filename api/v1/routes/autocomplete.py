@@ -0,0 +1,95 @@
+from flask import jsonify, request, g, abort
+from flask_babel import _
+from flasgger import swag_from
+
+from api.v1.routes import app_routes
+from api.v1.schemas import json_validate
+from api.v1.schemas.autocomplete import (
+    AUTOCOMPLETE_GETTER_SCHEMA,
+    AUTOCOMPLETE_STATS_GETTER_SCHEMA,
+)
+from models import storage, autocomplete, Group, User
+
+AUTOCOMPLETE_KINDS = {
+    "users": (User.user_name, "user_id", "user_name"),
+    "groups": (Group.title, "group_id", "title"),
+}
+
+
+@app_routes.route("/autocomplete", methods=["GET"], strict_slashes=False)
+@swag_from("documentation/autocomplete/autocomplete_getter.yml")
+def autocomplete_getter():
+    """GET /api/v1/autocomplete
+    Return:
+      - on success: respond with the best user names or group titles
+        matching the query
+      - on error: respond with 400, 422 error codes
+    """
+    req = dict(request.args)
+    if request.content_type == "application/json":
+        req.update(request.json)
+    SCHEMA = AUTOCOMPLETE_GETTER_SCHEMA
+    error_response = json_validate(req, SCHEMA)
+    if error_response is not None:
+        return error_response
+
+    kind = req["kind"] if req.get("kind", None) else "users"
+    limit = int(req["limit"]) if req.get("limit", None) else 10
+    if kind not in AUTOCOMPLETE_KINDS:
+        return jsonify({"error": _("invalid", data=_("kind"))}), 422
+    if not 0 < limit <= 50:
+        return jsonify({"error": _("invalid", data=_("limit"))}), 422
+    field, id_key, name_key = AUTOCOMPLETE_KINDS[kind]
+
+    try:
+        matches = None
+        if autocomplete is not None:
+            matches = autocomplete.search(kind, req["query"], limit)
+        if matches is None:
+            # the index is over its memory bound, fall back to a prefix scan
+            model = field.class_
+            prefix = (
+                req["query"]
+                .replace("\\", "\\\\")
+                .replace("%", "\\%")
+                .replace("_", "\\_")
+            )
+            matches = (
+                storage.query(model.id, field)
+                .filter(field.like(f"{prefix}%", escape="\\"))
+                .order_by(field)
+                .limit(limit)
+                .all()
+            )
+        return (
+            jsonify({kind: [{id_key: id, name_key: name} for id, name in matches]}),
+            200,
+        )
+    except Exception as e:
+        print(f"[{e.__class__.__name__}]: {e}")
+        abort(500)
+
+
+@app_routes.route("/autocomplete/stats", methods=["GET"], strict_slashes=False)
+@swag_from("documentation/autocomplete/autocomplete_stats_getter.yml")
+def autocomplete_stats_getter():
+    """GET /api/v1/autocomplete/stats
+    Return:
+      - on success: respond with the size and memory footprint of the
+        autocomplete indexes
+      - on error: respond with 401 error codes
+    """
+    req = dict(request.args)
+    if request.content_type == "application/json":
+        req.update(request.json)
+    SCHEMA = AUTOCOMPLETE_STATS_GETTER_SCHEMA
+    error_response = json_validate(req, SCHEMA)
+    if error_response is not None:
+        return error_response
+
+    user: User = getattr(g, "user", None)
+    if user is None:
+        return jsonify({"error": _("unauthorized")}), 401
+    if autocomplete is None:
+        return jsonify({}), 200
+    return jsonify(autocomplete.stats()), 200
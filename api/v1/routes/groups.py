@@ -2,6 +2,7 @@ from datetime import datetime
 from flask import jsonify, request, g, abort
 from flask_babel import _
 from flasgger import swag_from
+from sqlalchemy.orm import selectinload
 
 from api.v1.routes import app_routes
 from api.v1.schemas import json_validate
@@ -9,10 +10,28 @@ from api.v1.schemas.groups import (
     GROUP_GETTER_SCHEMA,
     GROUP_ONE_USERS_GETTER_SCHEMA,
     GROUP_ONE_QUIZZES_GETTER_SCHEMA,
+    GROUP_ONE_STATS_DISTRIBUTION_GETTER_SCHEMA,
+)
+from models import (
+    storage,
+    leaderboard,
+    Group,
+    Ownership,
+    QuizAttempt,
+    Quiz,
+    QuizStats,
+    User,
+    UserSession,
 )
-from models import storage, Group, QuizAttempt, Quiz, User
 from models.base import time_fmt
+from models.engine.leaderboard import WINDOWS, week_start
 from models.engine.relational_storage import paginate
+from models.engine.score_sketch import (
+    DEFAULT_QUANTILES,
+    ScoreDistribution,
+    merge_distributions,
+)
+from models.engine.search import search_groups
 
 
 @app_routes.route("/group", methods=["GET"], strict_slashes=False)
@@ -34,11 +53,16 @@ def group_getter():
     page = int(req["page"]) if req.get("page", None) else None
     page_size = int(req["page_size"]) if req.get("page_size", None) else None
     title_query = req["query"] if req.get("query", None) else None
+    cursor = req.get("cursor", None)
+    with_total = req.get("with_total", None)
+    count = req.get("count", None)
 
     try:
-        query = storage.query(Group)
+        query = storage.query(Group).options(
+            selectinload(Group.ownership).selectinload(Ownership.user)
+        )
         if title_query:
-            query = query.where(Group.title.like(f"%{title_query}%"))
+            query = search_groups(query, title_query, ranked=cursor is None)
         try:
             return (
                 paginate(
@@ -52,13 +76,18 @@ def group_getter():
                         "owner_id": group.ownership.user_id,
                         "owner_name": group.ownership.user.user_name,
                     },
+                    cursor=cursor,
+                    with_total=with_total,
+                    count=count,
+                    keyset=(Group.title, Group.id),
                 ),
                 200,
             )
         except ValueError as e:
             data = (
                 e.args[0]
-                if e.args and e.args[0] in ("page", "page_size")
+                if e.args
+                and e.args[0] in ("page", "page_size", "cursor", "sort_by", "count")
                 else "request"
             )
             return jsonify({"error": _("invalid", data=_(data))}), 422
@@ -90,14 +119,66 @@ def group_one_users_getter(group_id):
     page = int(req["page"]) if req.get("page", None) else None
     page_size = int(req["page_size"]) if req.get("page_size", None) else None
     username_query = req["query"] if req.get("query", None) else None
+    window = req["window"] if req.get("window", None) else "all"
+    if window not in WINDOWS:
+        return jsonify({"error": _("invalid", data=_("window"))}), 422
 
     from sqlalchemy import func, and_
 
     try:
-        group = storage.query(Group).get(group_id)
+        group = storage.get(Group, group_id)
         if group is None:
             return jsonify({"error": _("not_found", data=_("group"))}), 404
 
+        if (
+            leaderboard is not None
+            and sort_by in (None, "score")
+            and not username_query
+            and not status
+        ):
+            # rankings come straight from the ordered group leaderboard
+            def ranked_users(entries):
+                ids = [user_id for user_id, score in entries]
+                users = storage.get_many(User, ids)
+                active = {
+                    user_id
+                    for (user_id,) in storage.query(UserSession.user_id)
+                    .filter(UserSession.user_id.in_(ids))
+                    .distinct()
+                }
+                return [
+                    {
+                        "user_id": u.id,
+                        "user_name": u.user_name,
+                        "status": "active" if u.id in active else "away",
+                        "score": score,
+                    }
+                    for u, (user_id, score) in zip(users, entries)
+                    if u is not None
+                ]
+
+            try:
+                return (
+                    leaderboard.paginate(
+                        "users",
+                        page,
+                        page_size,
+                        ranked_users,
+                        min_score,
+                        max_score,
+                        group_id,
+                        window,
+                    ),
+                    200,
+                )
+            except ValueError as e:
+                data = (
+                    e.args[0]
+                    if e.args and e.args[0] in ("page", "page_size")
+                    else "request"
+                )
+                return jsonify({"error": _("invalid", data=_(data))}), 422
+
         # return jsonify({'error': _('unauthorized')}), 403
         query = (
             storage.query(User, func.sum(QuizAttempt.score))
@@ -107,7 +188,10 @@ def group_one_users_getter(group_id):
             .join(Quiz, QuizAttempt.quiz_id == Quiz.id)  # Join QuizAttempt with Quiz
             .where(Quiz.group_id == group_id)  # Filter by the Quiz group ID
             .group_by(User.id)  # Group by User ID
+            .options(selectinload(User.user_sessions))
         )
+        if window == "week":
+            query = query.where(QuizAttempt.created_at >= week_start())
         filters = []
         if username_query:
             filters.append(
@@ -175,7 +259,7 @@ def group_one_quizzes_getter(group_id):
     difficulty = int(req["difficulty"]) if req.get("difficulty", None) else None
 
     try:
-        if storage.query(Group).get(group_id) is None:
+        if storage.get(Group, group_id) is None:
             return jsonify({"error": _("not_found", data=_("group"))}), 404
         query = storage.query(Quiz).where(Quiz.group_id == group_id)
 
@@ -235,3 +319,47 @@ def group_one_quizzes_getter(group_id):
     except Exception as e:
         print(f"[{e.__class__.__name__}]: {e}")
         abort(500)
+
+
+@app_routes.route(
+    "/group/<int:group_id>/stats/distribution", methods=["GET"], strict_slashes=False
+)
+@swag_from("documentation/groups/group_one_stats_distribution_getter.yml")
+def group_one_stats_distribution_getter(group_id):
+    """GET /api/v1/group/<int:group_id>/stats/distribution
+    Return:
+      - on success: respond with the score percentiles and histogram of all
+        the quizzes of the group, merged
+      - on error: respond with 404 error codes
+    """
+    req = dict(request.args)
+    if request.content_type == "application/json":
+        req.update(request.json)
+    SCHEMA = GROUP_ONE_STATS_DISTRIBUTION_GETTER_SCHEMA
+    error_response = json_validate(req, SCHEMA)
+    if error_response is not None:
+        return error_response
+    quantiles = req.get("quantiles", None) or DEFAULT_QUANTILES
+
+    try:
+        if storage.get(Group, group_id) is None:
+            return jsonify({"error": _("not_found", data=_("group"))}), 404
+        rows = (
+            storage.query(QuizStats.distribution)
+            .join(Quiz, Quiz.id == QuizStats.quiz_id)
+            .where(Quiz.group_id == group_id, QuizStats.distribution.is_not(None))
+            .all()
+        )
+        try:
+            distribution = merge_distributions(
+                ScoreDistribution.loads(blob) for blob, in rows
+            )
+        except ValueError as e:
+            if e.args != ("bins",):
+                raise
+            # the quizzes were sketched with different histogram bins
+            return jsonify({"error": _("invalid", data=_("request"))}), 422
+        return jsonify({"quizzes": len(rows), **distribution.to_dict(quantiles)}), 200
+    except Exception as e:
+        print(f"[{e.__class__.__name__}]: {e}")
+        abort(500)
@@ -10,9 +10,10 @@ from api.v1.schemas.profiles import (
     PROFILE_ONE_GETTER_SCHEMA,
     PROFILE_ONE_QUIZ_GETTER_SCHEMA,
 )
-from models import storage, Group, Ownership, Quiz, QuizAttempt, User, group_user
+from models import storage, Quiz, User, UserStats
 from models.base import time_fmt
 from models.engine.relational_storage import paginate
+from models.engine.search import search_quizzes
 
 
 @app_routes.route("/profile", methods=["GET"], strict_slashes=False)
@@ -34,6 +35,9 @@ def profile_getter():
     page = int(req["page"]) if req.get("page", None) else None
     page_size = int(req["page_size"]) if req.get("page_size", None) else None
     username_query = req.get("query", None)
+    cursor = req.get("cursor", None)
+    with_total = req.get("with_total", None)
+    count = req.get("count", None)
 
     try:
         query = storage.query(User.id, User.user_name).order_by(User.user_name.asc())
@@ -48,11 +52,20 @@ def profile_getter():
                 page,
                 page_size,
                 lambda u: {"user_id": u[0], "user_name": u[1]},
+                cursor=cursor,
+                with_total=with_total,
+                count=count,
+                keyset=(User.user_name, User.id),
             ),
             200,
         )
     except ValueError as e:
-        data = e.args[0] if e.args and e.args[0] in ("page", "page_size") else "request"
+        data = (
+            e.args[0]
+            if e.args
+            and e.args[0] in ("page", "page_size", "cursor", "sort_by", "count")
+            else "request"
+        )
         return jsonify({"error": _("invalid", data=_(data))}), 422
     except Exception as e:
         print(f"[{e.__class__.__name__}]: {e}")
@@ -76,31 +89,27 @@ def profile_one_getter(user_id):
         return error_response
 
     try:
-        from sqlalchemy import func, and_, label
-
-        user: User = storage.query(User).where(User.id == user_id).one_or_none()
-        if user is None:
-            return jsonify({"error": _("not_found", data=_("user"))}), 404
-        u_data = storage.query(
-            func.count(Ownership),
-            func.count(Quiz),
-            func.count(group_user.c.group_id),
-            func.count(QuizAttempt),
-        ).filter(
-            Ownership.user_id == user_id,
-            Quiz.user_id == user_id,
-            group_user.c.user_id == user_id,
-            QuizAttempt.user_id == user_id,
-            QuizAttempt.score == func.sum(Quiz.questions.points),
+        profile = (
+            storage.query(User.user_name, UserStats)
+            .outerjoin(UserStats, UserStats.id == User.id)
+            .where(User.id == user_id)
+            .one_or_none()
         )
+        if profile is None:
+            return jsonify({"error": _("not_found", data=_("user"))}), 404
+        user_name, stats = profile
+        if stats is None:
+            stats = UserStats(
+                owned_groups=0, created_quizzes=0, subscribed_groups=0, solved_quizzes=0
+            )
         return (
             jsonify(
                 {
-                    "user_name": user.user_name,
-                    "owned_groups": u_data[0],
-                    "created_quizzes": u_data[1],
-                    "subscribed_groups": u_data[2],
-                    "solved_quizzes": u_data[3],
+                    "user_name": user_name,
+                    "owned_groups": stats.owned_groups,
+                    "created_quizzes": stats.created_quizzes,
+                    "subscribed_groups": stats.subscribed_groups,
+                    "solved_quizzes": stats.solved_quizzes,
                 }
             ),
             200,
@@ -134,13 +143,14 @@ def profile_one_quiz_getter(user_id):
     title_query = req["query"] if req.get("query", None) else None
 
     try:
-        owner = storage.query(User).get(user_id)
+        owner = storage.get(User, user_id)
         if owner is None:
             return jsonify({"error": _("not_found", data=_("user"))}), 404
 
         query = storage.query(Quiz).filter(Quiz.user_id == user_id)
         if title_query:
-            query = query.where(Quiz.title.like(f"%{title_query}%"))
+            # relevance comes first unless another order was asked for
+            query = search_quizzes(query, title_query, ranked=sort_by is None)
         if difficulty:
             query = query.where(Quiz.difficulty == difficulty)
         if category:
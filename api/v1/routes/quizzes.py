@@ -2,6 +2,7 @@ from datetime import datetime
 from flask import jsonify, request, g, abort
 from flask_babel import _
 from flasgger import swag_from
+from sqlalchemy import func
 
 from api.v1.routes import app_routes
 from api.v1.schemas import json_validate
@@ -9,10 +10,21 @@ from api.v1.schemas.quizzes import (
     QUIZ_GETTER_SCHEMA,
     QUIZ_ONE_GETTER_SCHEMA,
     QUIZ_ONE_STATS_GETTER_SCHEMA,
+    QUIZ_ONE_STATS_DISTRIBUTION_GETTER_SCHEMA,
+)
+from api.v1.utils import async_view
+from models import (
+    async_storage,
+    storage,
+    Question,
+    Quiz,
+    QuizStats,
 )
-from models import storage, Question, Quiz, QuizAttempt, User
 from models.base import time_fmt
+from models.engine.quiz_content import build_quiz_content, quiz_content_query
 from models.engine.relational_storage import paginate
+from models.engine.score_sketch import DEFAULT_QUANTILES, ScoreDistribution
+from models.engine.search import search_quizzes
 
 
 @app_routes.route("/quiz", methods=["GET"], strict_slashes=False)
@@ -38,6 +50,9 @@ def quiz_getter():
     page = int(req["page"]) if req.get("page", None) else None
     page_size = int(req["page_size"]) if req.get("page_size", None) else None
     title_query = req["query"] if req.get("query", None) else None
+    cursor = req.get("cursor", None)
+    with_total = req.get("with_total", None)
+    count = req.get("count", None)
 
     try:
         query = storage.query(Quiz)
@@ -48,14 +63,17 @@ def quiz_getter():
             query = query.filter(Quiz.group_id == None)
 
         if title_query:
-            query = query.filter(Quiz.title.like(f"%{title_query}%"))
+            # relevance comes first unless another order was asked for
+            query = search_quizzes(
+                query, title_query, ranked=cursor is None and sort_by is None
+            )
         if category:
             query = query.filter(Quiz.category == category)
         if difficulty:
             if not 1 < difficulty < 5:
                 return jsonify({"error": _("invalid", data=_("difficulty"))}), 422
             query = query.filter(Quiz.difficulty == difficulty)
-        if sort_by in (
+        if sort_by not in (
             "title",
             "category",
             "difficulty",
@@ -64,9 +82,8 @@ def quiz_getter():
             "start",
             "end",
         ):
-            query = query.order_by(getattr(Quiz, sort_by))
-        else:
-            query = query.order_by(Quiz.title)
+            sort_by = "title"
+        query = query.order_by(getattr(Quiz, sort_by))
         return (
             paginate(
                 "quizzes",
@@ -84,13 +101,22 @@ def quiz_getter():
                     "end": datetime.strftime(q.end, time_fmt),
                     "group_id": q.group_id,
                 },
+                cursor=cursor,
+                with_total=with_total,
+                count=count,
+                keyset=(getattr(Quiz, sort_by), Quiz.id),
             ),
             200,
         )
 
         # return jsonify({'error': _('not_found', data=_('category'))}), 404
     except ValueError as e:
-        data = e.args[0] if e.args and e.args[0] in ("page", "page_size") else "request"
+        data = (
+            e.args[0]
+            if e.args
+            and e.args[0] in ("page", "page_size", "cursor", "sort_by", "count")
+            else "request"
+        )
         return jsonify({"error": _("invalid", data=_(data))}), 422
     except Exception as e:
         print(f"[{e.__class__.__name__}]: {e}")
@@ -98,8 +124,9 @@ def quiz_getter():
 
 
 @app_routes.route("/quiz/<int:quiz_id>", methods=["GET"], strict_slashes=False)
+@async_view
 @swag_from("documentation/quizzes/quiz_one_getter.yml")
-def quiz_one_getter(quiz_id):
+async def quiz_one_getter(quiz_id):
     """GET /api/v1/quiz/<int:quiz_id>
     Return:
       - on success: respond with the quiz's list of questions
@@ -114,31 +141,13 @@ def quiz_one_getter(quiz_id):
         return error_response
 
     try:
-        if (
-            storage.query(Quiz)
-            .filter(Quiz.id == quiz_id, Quiz.group_id == None)
-            .one_or_none()
-            is None
-        ):
+        quiz = build_quiz_content(
+            await async_storage.execute(quiz_content_query(quiz_id))
+        )
+        if quiz is None or quiz.group_id is not None:
             return jsonify({"error": _("not_found", data=_("quiz"))}), 404
 
-        questions = []
-        for q in (
-            storage.query(Question)
-            .where(Question.quiz_id == quiz_id)
-            .order_by(Question.order)
-            .all()
-        ):
-            questions.append(
-                {
-                    "statement": q.statement,
-                    "points": q.points,
-                    "type": q.type,
-                    "options": [ans.text for ans in q.answers],
-                }
-            )
-
-        return jsonify({"questions": questions}), 200
+        return jsonify(quiz.to_dict()), 200
         # return jsonify({'error': _('deleted', data=_('quiz'))}), 410
     except Exception as e:
         print(f"[{e.__class__.__name__}]: {e}")
@@ -161,29 +170,22 @@ def quiz_one_stats_getter(quiz_id):
     if error_response is not None:
         return error_response
 
-    from sqlalchemy import func, distinct
-
     try:
-        if (
-            storage.query(Quiz)
-            .filter(Quiz.id == quiz_id, Quiz.group_id == None)
-            .one_or_none()
-            is None
-        ):
+        quiz = storage.get(Quiz, quiz_id)
+        if quiz is None or quiz.group_id is not None:
             return jsonify({"error": _("not_found", data=_("quiz"))}), 404
-        stats = storage.query(
-            func.max(QuizAttempt.score),
-            func.min(QuizAttempt.score),
-            func.avg(QuizAttempt.score),
-            func.count(distinct(Quiz.user_id)),
-        ).where(QuizAttempt.quiz_id == quiz_id)
+        stats = storage.search(QuizStats, quiz_id=quiz_id)
+        stats = stats[0] if stats else QuizStats(quiz_id=quiz_id, attempts=0)
         return (
             jsonify(
                 {
-                    "max_score": stats[0],
-                    "min_score": stats[1],
-                    "average_score": stats[2],
-                    "attempts": stats[3],
+                    "max_score": stats.max_score,
+                    "min_score": stats.min_score,
+                    "average_score": stats.average_score,
+                    "score_stddev": stats.score_stddev,
+                    "attempts": stats.attempts,
+                    "users": stats.users or 0,
+                    "full_scores": stats.full_scores or 0,
                 }
             ),
             200,
@@ -191,3 +193,42 @@ def quiz_one_stats_getter(quiz_id):
     except Exception as e:
         print(f"[{e.__class__.__name__}]: {e}")
         abort(500)
+
+
+@app_routes.route(
+    "/quiz/<int:quiz_id>/stats/distribution", methods=["GET"], strict_slashes=False
+)
+@swag_from("documentation/quizzes/quiz_one_stats_distribution_getter.yml")
+def quiz_one_stats_distribution_getter(quiz_id):
+    """GET /api/v1/quiz/<int:quiz_id>/stats/distribution
+    Return:
+      - on success: respond with the score percentiles and histogram of the quiz
+      - on error: respond with 404 error codes
+    """
+    req = dict(request.args)
+    if request.content_type == "application/json":
+        req.update(request.json)
+    SCHEMA = QUIZ_ONE_STATS_DISTRIBUTION_GETTER_SCHEMA
+    error_response = json_validate(req, SCHEMA)
+    if error_response is not None:
+        return error_response
+    quantiles = req.get("quantiles", None) or DEFAULT_QUANTILES
+
+    try:
+        quiz = storage.get(Quiz, quiz_id)
+        if quiz is None or quiz.group_id is not None:
+            return jsonify({"error": _("not_found", data=_("quiz"))}), 404
+        stats = storage.search(QuizStats, quiz_id=quiz_id)
+        if stats and stats[0].distribution is not None:
+            distribution = stats[0].score_distribution
+        else:
+            points = (
+                storage.query(func.sum(Question.points))
+                .where(Question.quiz_id == quiz_id)
+                .scalar()
+            )
+            distribution = ScoreDistribution(points=points or 0)
+        return jsonify(distribution.to_dict(quantiles)), 200
+    except Exception as e:
+        print(f"[{e.__class__.__name__}]: {e}")
+        abort(500)
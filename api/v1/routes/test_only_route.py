@@ -15,7 +15,7 @@ def test_command(command):
     r = request.json
     match command:
         case "reload":
-            storage.reload()
+            storage.reload(reset=True)
             return jsonify({}), 200
         case "users":
             user_ids = []
@@ -136,31 +136,31 @@ def test_command(command):
 
         case "sub_groups":
             user_id = int(r["user_id"])
-            user: User = storage.query(User).get(user_id)
+            user: User = storage.get(User, user_id)
 
             r = r["body"]
             for req in r:
                 group_id = int(req["id"])
-                group: Group = storage.query(Group).get(group_id)
+                group: Group = storage.get(Group, group_id)
                 group.users.append(user)
                 storage.save()
             return jsonify({}), 200
 
         case "unsub_groups":
             user_id = int(r["user_id"])
-            user: User = storage.query(User).get(user_id)
+            user: User = storage.get(User, user_id)
 
             r = r["body"]
             for req in r:
                 group_id = int(req["id"])
-                group: Group = storage.query(Group).get(group_id)
+                group: Group = storage.get(Group, group_id)
                 group.users.remove(user)
                 storage.save()
             return jsonify({}), 204
         case "add_quizzes":
             user_id = int(r["user_id"])
             group_id = int(r["group_id"])
-            user: User = storage.query(User).get(user_id)
+            user: User = storage.get(User, user_id)
 
             r = r["body"]
             for req in r:
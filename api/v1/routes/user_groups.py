@@ -15,7 +15,16 @@ from api.v1.schemas.user_groups import (
     USER_GROUP_ONE_USERS_POSTER_SCHEMA,
     USER_GROUP_ONE_USERS_DELETER_SCHEMA,
 )
-from models import storage, Group, Ownership, User, Quiz, QuizAttempt, group_user
+from models import (
+    storage,
+    leaderboard,
+    Group,
+    Ownership,
+    User,
+    Quiz,
+    QuizAttempt,
+    group_user,
+)
 from models.base import time_fmt
 from models.engine.relational_storage import paginate
 
@@ -272,7 +281,7 @@ def user_group_one_users_getter(group_id):
     page_size = int(req["page_size"]) if req.get("page_size", None) else None
     query = req["query"] if req.get("query", None) else None
 
-    from sqlalchemy import func, distinct, and_
+    from sqlalchemy import func, distinct
 
     try:
         group = (
@@ -288,37 +297,41 @@ def user_group_one_users_getter(group_id):
             return jsonify({"error": _("not_found", data=_("group"))}), 404
 
         query = (
-            storage.query(
-                User,
-                func.sum(QuizAttempt.score).label("total_score"),
-                func.count(distinct(QuizAttempt.quiz_id)).label("attempt_count"),
-            )
-            .outerjoin(QuizAttempt, User.id == QuizAttempt.user_id)
-            .outerjoin(
-                Quiz, and_(Quiz.id == QuizAttempt.quiz_id, Quiz.group_id == group_id)
-            )
-            .join(group_user, and_(group_user.c.user_id == User.id))
+            storage.query(User)
+            .join(group_user, group_user.c.user_id == User.id)
             .filter(group_user.c.group_id == group_id)
-            .group_by(User.id)
             .order_by(User.user_name)
         )
 
         try:
-            return (
-                paginate(
-                    "users",
-                    query,
-                    page,
-                    page_size,
-                    lambda u: {
-                        "user_id": u[0].id,
-                        "user_name": u[0].user_name,
-                        "total_score": u[1] if u[1] else 0,
-                        "attempted_quizzes": u[2],
-                    },
-                ),
-                200,
-            )
+            result = paginate("users", query, page, page_size, lambda u: u)
+            members = result["users"]
+            ids = [u.id for u in members]
+            # only the members of the page are looked up
+            columns = [QuizAttempt.user_id, func.count(distinct(QuizAttempt.quiz_id))]
+            if leaderboard is None:
+                columns.append(func.sum(QuizAttempt.score))
+            totals = {
+                row[0]: row[1:]
+                for row in storage.query(*columns)
+                .join(Quiz, Quiz.id == QuizAttempt.quiz_id)
+                .filter(Quiz.group_id == group_id, QuizAttempt.user_id.in_(ids))
+                .group_by(QuizAttempt.user_id)
+            }
+            if leaderboard is not None:
+                scores = leaderboard.scores(ids, group_id)
+            else:
+                scores = [(totals.get(i) or (0, 0))[1] or 0 for i in ids]
+            result["users"] = [
+                {
+                    "user_id": u.id,
+                    "user_name": u.user_name,
+                    "total_score": score,
+                    "attempted_quizzes": (totals.get(u.id) or (0,))[0],
+                }
+                for u, score in zip(members, scores)
+            ]
+            return result, 200
         except ValueError as e:
             data = (
                 e.args[0]
@@ -367,15 +380,16 @@ def user_group_one_users_poster(group_id):
         if group is None:
             return jsonify({"error": _("not_found", data=_("group"))}), 404
 
-        for sub in users:
-            sub_id = int(sub["user_id"])
-            sub: User = storage.query(User).get(sub_id)
-            if sub is None:
-                return jsonify({"error": _("not_found", data=_("user"))}), 404
+        subs = storage.get_many(User, [int(sub["user_id"]) for sub in users])
+        if None in subs:
+            return jsonify({"error": _("not_found", data=_("user"))}), 404
 
-            if sub in group.users:
+        members = set(group.users)
+        for sub in subs:
+            if sub in members:
                 return jsonify({"error": _("duplicate", data=_("user"))}), 409
             group.users.append(sub)
+            members.add(sub)
         storage.save()
         return jsonify({}), 200
     except Exception as e:
@@ -421,12 +435,13 @@ def user_group_one_users_deleter(group_id):
 
         print(group.users)
         print(users)
-        for sub in users:
-            sub_id = int(sub["user_id"])
-            sub: User = storage.query(User).get(sub_id)
-            if sub is None or sub not in group.users:
+        subs = storage.get_many(User, [int(sub["user_id"]) for sub in users])
+        members = set(group.users)
+        for sub in subs:
+            if sub is None or sub not in members:
                 return jsonify({"error": _("not_found", data=_("user"))}), 404
             group.users.remove(sub)
+            members.remove(sub)
         print(group.users)
         storage.save()
         return jsonify({}), 204
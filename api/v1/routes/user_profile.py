@@ -16,10 +16,13 @@ from api.v1.schemas.user_profile import (
 )
 from models import (
     storage,
+    answer_keys,
+    leaderboard,
     Group,
     Quiz,
     User,
     QuizAttempt,
+    QuizStats,
     Question,
     Answer,
     UserAnswer,
@@ -138,6 +141,9 @@ def user_profile_quiz_one_attempts_getter(quiz_id):
     page = int(req["page"]) if req.get("page", None) else None
     page_size = int(req["page_size"]) if req.get("page_size", None) else None
     quiz_query = req["query"] if req.get("query", None) else None
+    cursor = req.get("cursor", None)
+    with_total = req.get("with_total", None)
+    count = req.get("count", None)
 
     from sqlalchemy import and_
 
@@ -151,7 +157,7 @@ def user_profile_quiz_one_attempts_getter(quiz_id):
         ):
             return jsonify({"error": _("not_found", data=_("quiz"))}), 404
 
-        if storage.query(Quiz).get(quiz_id).end < datetime.now():
+        if storage.get(Quiz, quiz_id).end < datetime.now():
             return jsonify({"error": _("quiz time has ended")}), 403
 
         query = storage.query(QuizAttempt).filter_by(quiz_id=quiz_id, user_id=user.id)
@@ -173,13 +179,18 @@ def user_profile_quiz_one_attempts_getter(quiz_id):
                         "time": datetime.strftime(a.created_at, time_fmt),
                         "score": a.score,
                     },
+                    cursor=cursor,
+                    with_total=with_total,
+                    count=count,
+                    keyset=(QuizAttempt.created_at, QuizAttempt.id),
                 ),
                 200,
             )
         except ValueError as e:
             data = (
                 e.args[0]
-                if e.args and e.args[0] in ("page", "page_size")
+                if e.args
+                and e.args[0] in ("page", "page_size", "cursor", "sort_by", "count")
                 else "request"
             )
             return jsonify({"error": _("invalid", data=_(data))}), 422
@@ -212,34 +223,46 @@ def user_profile_quiz_one_attempts_poster(quiz_id):
     answers = req["answers"]
 
     try:
-        quiz = storage.query(Quiz).get(quiz_id)
+        key = answer_keys.get(storage, quiz_id)
 
-        if quiz is None:
+        if key is None:
             return jsonify({"error": _("not_found", data=_("quiz"))}), 404
 
-        if len(answers) != len(quiz.questions):
+        if len(answers) != len(key.question_ids):
             return jsonify({"error": _("invalid", data=_("answer option"))}), 404
 
-        attempt = storage.new(QuizAttempt(score=0, quiz_id=quiz_id, user_id=user.id))
-
-        total_score = 0
-        full_score = True
-        correct_answers = []
-        for ans, q in zip(answers, quiz.questions):
-            for a in ans["options"]:
-                storage.new(
-                    UserAnswer(attempt_id=attempt.id, answer=a, question_id=q.id)
-                ).save()
-            correct_answer = set(a.order for a in q.answers if a.correct)
-            if correct_answer == set(ans["options"]):
-                total_score += q.points
-            else:
-                full_score = False
-            correct_answers.append({"options": list(correct_answer)})
-
-        attempt.score = total_score
-        attempt.full_score = full_score
-        attempt.save()
+        total_score, full_score, correct_answers = key.grade(
+            [ans["options"] for ans in answers]
+        )
+        with storage.transaction():
+            attempt = storage.new(
+                QuizAttempt(
+                    score=total_score,
+                    full_score=full_score,
+                    quiz_id=quiz_id,
+                    user_id=user.id,
+                )
+            )
+            # flush for the attempt id, then insert every answer in one batch
+            storage.save()
+            storage.insert_many(
+                UserAnswer,
+                [
+                    {"attempt_id": attempt.id, "question_id": question_id, "answer": a}
+                    for ans, question_id in zip(answers, key.question_ids)
+                    for a in ans["options"]
+                ],
+            )
+            QuizStats.record(
+                storage.session,
+                quiz_id,
+                total_score,
+                full_score,
+                user.id,
+                sum(key.points),
+            )
+        if leaderboard is not None:
+            leaderboard.record(attempt.id, user.id, total_score, key.group_id)
 
         return (
             jsonify({"score": total_score, "correct_answers": correct_answers}),
@@ -320,7 +343,7 @@ def user_profile_group_poster():
     group_id = int(req["group_id"])
 
     try:
-        group: Group = storage.query(Group).get(group_id)
+        group: Group = storage.get(Group, group_id)
         if group is None:
             return jsonify({"error": _("not_found", data=_("group"))}), 404
         if user in group.users:
@@ -357,15 +380,12 @@ def user_profile_group_one_deleter(group_id):
         return jsonify({"error": _("unauthorized")}), 401
 
     try:
-        group: Group = storage.query(Group).get(group_id)
+        group: Group = storage.get(Group, group_id)
         if group is None:
             return jsonify({"error": _("not_found", data=_("group"))}), 404
         if user not in group.users:
             return jsonify({"error": _("user not subscribed to group")}), 409
-        subscription = storage.query(group_user).filter_by(
-            group_id=group_id, user_id=user.id
-        )
-        subscription.delete()
+        group.users.remove(user)
         storage.save()
         return jsonify({}), 204
         # return jsonify({"error": _("deleted", data=_("group"))}), 410
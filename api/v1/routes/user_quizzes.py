@@ -18,9 +18,42 @@ from api.v1.schemas.user_quizzes import (
     USER_QUIZ_ONE_STATS_ATTEMPTS_GETTER_SCHEMA,
     USER_QUIZ_ONE_STATS_QUESTION_ONE_GETTER_SCHEMA,
 )
-from models import storage, Group, Question, Quiz, QuizAttempt, User, Ownership, Answer
+from models import (
+    storage,
+    answer_keys,
+    leaderboard,
+    question_stats,
+    Group,
+    Question,
+    Quiz,
+    QuizAttempt,
+    User,
+    UserAnswer,
+    Ownership,
+    Answer,
+)
 from models.base import time_fmt
+from models.engine.question_bulk import (
+    delete_questions,
+    insert_questions,
+    lock_quiz_content,
+    merge_questions,
+    next_order,
+    question_error,
+    replace_questions,
+)
+from models.engine.quiz_content import load_quiz_content
+from models.engine.regrade import regrade_quiz
 from models.engine.relational_storage import paginate
+from models.engine.search import search_quizzes
+
+
+def rescore_quiz(session, quiz_id: int):
+    """rescore the attempts of a quiz whose questions were deleted with
+    their answers, refreshing the leaderboards when a score moved"""
+    report = regrade_quiz(session, quiz_id)
+    if report.changed and leaderboard is not None:
+        leaderboard.touch(session)
 
 
 @app_routes.route("/user/quiz", methods=["GET"], strict_slashes=False)
@@ -50,7 +83,8 @@ def user_quiz_getter():
     try:
         query = storage.query(Quiz).where(Quiz.user_id == user.id)
         if title_query:
-            query = query.where(Quiz.title.like(f"%{title_query}%"))
+            # relevance comes first unless another order was asked for
+            query = search_quizzes(query, title_query, ranked=sort_by is None)
 
         if difficulty:
             query = query.where(Quiz.difficulty == difficulty)
@@ -339,7 +373,7 @@ def user_quiz_one_deleter(quiz_id):
             is None
         ):
             return jsonify({"error": _("not_found", data=_("quiz"))}), 404
-        storage.delete(storage.query(Quiz).get(quiz_id))
+        storage.delete(storage.get(Quiz, quiz_id))
         storage.save()
         return jsonify({}), 204
     except Exception as e:
@@ -370,33 +404,11 @@ def user_quiz_one_question_getter(quiz_id):
         return jsonify({"error": _("unauthorized")}), 401
 
     try:
-        if (
-            storage.query(Quiz)
-            .where(Quiz.user_id == user.id)
-            .where(Quiz.id == quiz_id)
-            .one_or_none()
-            is None
-        ):
+        quiz = load_quiz_content(storage, quiz_id)
+        if quiz is None or quiz.user_id != user.id:
             return jsonify({"error": _("not_found", data=_("quiz"))}), 404
 
-        questions = []
-        for q in (
-            storage.query(Question)
-            .where(Question.quiz_id == quiz_id)
-            .order_by(Question.order)
-            .all()
-        ):
-            questions.append(
-                {
-                    "statement": q.statement,
-                    "points": q.points,
-                    "type": q.type,
-                    "options": [ans.text for ans in q.answers],
-                    "correct_answer": [ans.order for ans in q.answers if ans.correct],
-                }
-            )
-
-        return jsonify({"questions": questions}), 200
+        return jsonify(quiz.to_dict(with_answer=True)), 200
 
     except Exception as e:
         print(f"[{e.__class__.__name__}]: {e}")
@@ -428,53 +440,26 @@ def user_quiz_one_question_poster(quiz_id):
     questions = req["questions"]
 
     try:
-        if (
-            storage.query(Quiz)
-            .where(Quiz.user_id == user.id)
-            .where(Quiz.id == quiz_id)
-            .one_or_none()
-            is None
-        ):
-            return jsonify({"error": _("not_found", data=_("quiz"))}), 404
+        for q in questions:
+            error = question_error(q)
+            if error is not None:
+                return jsonify({"error": _("invalid", data=_(error))}), 422
 
-        question_ids = []
-        for i, q in enumerate(questions):
-            cor = q["correct_answer"]
-            if q["type"] not in ("TFQ", "SCQ", "MCQ"):
-                return jsonify({"error": _("invalid", data=_("type"))}), 422
+        with storage.transaction() as session:
+            # the row lock keeps the appended orders unique to this request
             if (
-                (q["type"] in ("TFQ", "SCQ") and len(cor) != 1)
-                or (q["type"] == "MCQ" and len(cor) >= len(q["options"]))
-                or (q["type"] == "TFQ" and cor[0] > 1)
-                or (
-                    q["type"] == ("SCQ", "MCQ")
-                    and any(a > len(q["options"]) for a in cor)
-                )
+                storage.query(Quiz.id)
+                .where(Quiz.user_id == user.id)
+                .where(Quiz.id == quiz_id)
+                .with_for_update()
+                .one_or_none()
+                is None
             ):
-                return jsonify({"error": _("invalid", data=_("answer option"))}), 422
-            q_id = (
-                storage.new(
-                    Question(
-                        order=i,
-                        statement=q["statement"],
-                        points=q["points"],
-                        type=q["type"],
-                        quiz_id=quiz_id,
-                    )
-                )
-                .save()
-                .id
+                return jsonify({"error": _("not_found", data=_("quiz"))}), 404
+            question_ids = insert_questions(
+                session, quiz_id, questions, next_order(session, quiz_id)
             )
-            question_ids.append(q_id)
-            for i, ans in enumerate(q["options"]):
-                storage.new(
-                    Answer(
-                        text=ans,
-                        order=i,
-                        correct=(i in q["correct_answer"]),
-                        question_id=q_id,
-                    )
-                ).save()
+            answer_keys.touch(session, [quiz_id])
         return jsonify([{"question_id": q_id} for q_id in question_ids]), 201
     except Exception as e:
         print(f"[{e.__class__.__name__}]: {e}")
@@ -506,12 +491,34 @@ def user_quiz_one_question_putter(quiz_id):
     questions = req["questions"]
 
     try:
-        if True:  # Stub for 200 response
-            return jsonify({}), 200
-        if True:  # Stub for 422 response
-            return jsonify({"error": _("invalid", data=_("answer option"))}), 422
-        if True:  # Stub for 404 response
-            return jsonify({"error": _("not_found", data=_("quiz"))}), 404
+        try:
+            with storage.transaction() as session:
+                content = lock_quiz_content(session, quiz_id, user.id)
+                if content is None:
+                    return jsonify({"error": _("not_found", data=_("quiz"))}), 404
+                stored = {q.id for q in content.questions}
+                if any(
+                    q["question_id"] not in stored
+                    for q in questions
+                    if q.get("question_id") is not None
+                ):
+                    return jsonify({"error": _("not_found", data=_("question"))}), 404
+
+                question_ids, key_changed = replace_questions(
+                    session, content, merge_questions(content, questions)
+                )
+                if key_changed:
+                    answer_keys.touch(session, [quiz_id])
+                if not stored <= set(question_ids):
+                    rescore_quiz(session, quiz_id)
+        except ValueError as e:
+            data = (
+                e.args[0]
+                if e.args and e.args[0] in ("question", "type", "options")
+                else "answer option"
+            )
+            return jsonify({"error": _("invalid", data=_(data))}), 422
+        return jsonify([{"question_id": id} for id in question_ids]), 200
     except Exception as e:
         print(f"[{e.__class__.__name__}]: {e}")
         abort(500)
@@ -538,13 +545,23 @@ def user_quiz_one_question_deleter(quiz_id):
     user: User = getattr(g, "user", None)
     if user is None:
         return jsonify({"error": _("unauthorized")}), 401
-    questions = req["questions"]
+    question_ids = {q["question_id"] for q in req["questions"]}
+    if not question_ids:
+        return jsonify({}), 204
 
     try:
-        if True:  # Stub for 204 response
-            return jsonify({}), 204
-        if True:  # Stub for 404 response
-            return jsonify({"error": _("not_found", data=_("quiz"))}), 404
+        with storage.transaction() as session:
+            content = lock_quiz_content(session, quiz_id, user.id)
+            if content is None:
+                return jsonify({"error": _("not_found", data=_("quiz"))}), 404
+            stored = {q.id for q in content.questions}
+            if not question_ids <= stored:
+                return jsonify({"error": _("not_found", data=_("question"))}), 404
+
+            delete_questions(session, question_ids)
+            answer_keys.touch(session, [quiz_id])
+            rescore_quiz(session, quiz_id)
+        return jsonify({}), 204
     except Exception as e:
         print(f"[{e.__class__.__name__}]: {e}")
         abort(500)
@@ -574,6 +591,9 @@ def user_quiz_one_stats_attempts_getter(quiz_id):
     page = int(req["page"]) if req.get("page", None) else None
     page_size = int(req["page_size"]) if req.get("page_size", None) else None
     title_query = req["query"] if req.get("query", None) else None
+    cursor = req.get("cursor", None)
+    with_total = req.get("with_total", None)
+    count = req.get("count", None)
 
     from sqlalchemy import and_
 
@@ -608,13 +628,18 @@ def user_quiz_one_stats_attempts_getter(quiz_id):
                         "time": a.created_at,
                         "points": a.score,
                     },
+                    cursor=cursor,
+                    with_total=with_total,
+                    count=count,
+                    keyset=(QuizAttempt.created_at, QuizAttempt.id),
                 ),
                 200,
             )
         except ValueError as e:
             data = (
                 e.args[0]
-                if e.args and e.args[0] in ("page", "page_size")
+                if e.args
+                and e.args[0] in ("page", "page_size", "cursor", "sort_by", "count")
                 else "request"
             )
             return jsonify({"error": _("invalid", data=_(data))}), 422
@@ -648,47 +673,78 @@ def user_quiz_one_stats_question_one_getter(quiz_id, question_id):
         return jsonify({"error": _("unauthorized")}), 401
     page = int(req["page"]) if req.get("page", None) else None
     page_size = int(req["page_size"]) if req.get("page_size", None) else None
-    query = req["query"] if req.get("query", None) else None
+    title_query = req["query"] if req.get("query", None) else None
+    cursor = req.get("cursor", None)
+    with_total = req.get("with_total", None)
+    count = req.get("count", None)
 
     try:
-        if True:  # Stub for 200 response
-            return (
-                jsonify(
-                    {
-                        "total_pages": "int",
-                        "total_question_answers": "int",
-                        "next": "int",
-                        "prev": "int",
-                        "question_answers": [
-                            {"correct_answers": "int", "wrong_answers": ["int"]}
-                        ],
-                    }
-                ),
-                200,
+        if (
+            storage.query(Question.id)
+            .join(Quiz, Quiz.id == Question.quiz_id)
+            .where(Quiz.user_id == user.id, Quiz.id == quiz_id)
+            .where(Question.id == question_id)
+            .one_or_none()
+            is None
+        ):
+            return jsonify({"error": _("not_found", data=_("question"))}), 404
+        stats = question_stats.get(storage, quiz_id, question_id)
+
+        query = (
+            storage.query(
+                QuizAttempt.id,
+                QuizAttempt.user_id,
+                User.user_name,
+                QuizAttempt.created_at,
             )
-        if True:  # Stub for 404 response
-            return jsonify({"error": _("not_found", data=_("quiz"))}), 404
-        if True:  # Stub for 422 response
-            return jsonify({"error": _("invalid", data=_("page_size"))}), 422
-
-        query = storage.query()
+            .join(User, User.id == QuizAttempt.user_id)
+            .where(QuizAttempt.quiz_id == quiz_id)
+            .order_by(QuizAttempt.created_at, QuizAttempt.id)
+        )
+        if title_query:
+            query = query.where(User.user_name.like(f"%{title_query}%"))
         try:
-            return (
-                paginate(
-                    "question_answers",
-                    query,
-                    req.get("page", None),
-                    req.get("page_size", None),
-                ),
-                200,
+            result = paginate(
+                "question_answers",
+                query,
+                page,
+                page_size,
+                apply=lambda a: {
+                    "attempt_id": a.id,
+                    "user_id": a.user_id,
+                    "user_name": a.user_name,
+                    "time": a.created_at,
+                },
+                cursor=cursor,
+                with_total=with_total,
+                count=count,
+                keyset=(QuizAttempt.created_at, QuizAttempt.id),
             )
         except ValueError as e:
             data = (
                 e.args[0]
-                if e.args and e.args[0] in ("page", "page_size")
+                if e.args
+                and e.args[0] in ("page", "page_size", "cursor", "sort_by", "count")
                 else "request"
             )
             return jsonify({"error": _("invalid", data=_(data))}), 422
+
+        # the chosen options of the whole page come from one query
+        answers = {a["attempt_id"]: [] for a in result["question_answers"]}
+        if answers:
+            for attempt_id, answer in storage.query(
+                UserAnswer.attempt_id, UserAnswer.answer
+            ).where(
+                UserAnswer.question_id == question_id,
+                UserAnswer.attempt_id.in_(answers),
+            ):
+                answers[attempt_id].append(answer)
+        for a in result["question_answers"]:
+            options = sorted(answers[a["attempt_id"]])
+            a["options"] = options
+            a["correct"] = tuple(options) == stats.correct_options
+        result.update(stats.to_dict())
+        return jsonify(result), 200
     except Exception as e:
         print(f"[{e.__class__.__name__}]: {e}")
         abort(500)
@@ -0,0 +1,13 @@
+"""JSON request validation schemas for the autocomplete endpoints
+"""
+
+AUTOCOMPLETE_GETTER_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "query": {"type": "string"},
+        "kind": {"type": ["string", "null"]},
+        "limit": {"type": ["integer", "null"]},
+    },
+    "required": ["query"],
+}
+AUTOCOMPLETE_STATS_GETTER_SCHEMA = {"type": "object", "properties": {}, "required": []}
@@ -6,6 +6,9 @@ GROUP_GETTER_SCHEMA = {
     "properties": {
         "page": {"type": ["integer", "null"]},
         "page_size": {"type": ["integer", "null"]},
+        "cursor": {"type": ["string", "null"]},
+        "with_total": {"type": ["boolean", "null"]},
+        "count": {"type": ["string", "null"]},
         "query": {"type": ["string", "null"]},
     },
     "required": [],
@@ -20,6 +23,7 @@ GROUP_ONE_USERS_GETTER_SCHEMA = {
         "page": {"type": ["integer", "null"]},
         "page_size": {"type": ["integer", "null"]},
         "query": {"type": ["string", "null"]},
+        "window": {"type": ["string", "null"]},
     },
     "required": [],
 }
@@ -35,3 +39,13 @@ GROUP_ONE_QUIZZES_GETTER_SCHEMA = {
     },
     "required": [],
 }
+GROUP_ONE_STATS_DISTRIBUTION_GETTER_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "quantiles": {
+            "type": ["array", "null"],
+            "items": {"type": "number", "minimum": 0, "maximum": 1},
+        },
+    },
+    "required": [],
+}
@@ -6,6 +6,9 @@ PROFILE_GETTER_SCHEMA = {
     "properties": {
         "page": {"type": ["integer", "null"]},
         "page_size": {"type": ["integer", "null"]},
+        "cursor": {"type": ["string", "null"]},
+        "with_total": {"type": ["boolean", "null"]},
+        "count": {"type": ["string", "null"]},
         "query": {"type": ["string", "null"]},
     },
     "required": [],
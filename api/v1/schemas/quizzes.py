@@ -10,9 +10,22 @@ QUIZ_GETTER_SCHEMA = {
         "group_id": {"type": ["integer", "null"]},
         "page": {"type": ["integer", "null"]},
         "page_size": {"type": ["integer", "null"]},
+        "cursor": {"type": ["string", "null"]},
+        "with_total": {"type": ["boolean", "null"]},
+        "count": {"type": ["string", "null"]},
         "query": {"type": ["string", "null"]},
     },
     "required": [],
 }
 QUIZ_ONE_GETTER_SCHEMA = {"type": "object", "properties": {}, "required": []}
 QUIZ_ONE_STATS_GETTER_SCHEMA = {"type": "object", "properties": {}, "required": []}
+QUIZ_ONE_STATS_DISTRIBUTION_GETTER_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "quantiles": {
+            "type": ["array", "null"],
+            "items": {"type": "number", "minimum": 0, "maximum": 1},
+        },
+    },
+    "required": [],
+}
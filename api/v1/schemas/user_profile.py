@@ -17,6 +17,9 @@ USER_PROFILE_QUIZ_ONE_ATTEMPTS_GETTER_SCHEMA = {
     "properties": {
         "page": {"type": ["integer", "null"]},
         "page_size": {"type": ["integer", "null"]},
+        "cursor": {"type": ["string", "null"]},
+        "with_total": {"type": ["boolean", "null"]},
+        "count": {"type": ["string", "null"]},
         "query": {"type": ["string", "null"]},
     },
     "required": [],
@@ -82,7 +82,7 @@ USER_QUIZ_ONE_QUESTION_PUTTER_SCHEMA = {
             "items": {
                 "type": "object",
                 "properties": {
-                    "question_id": {"type": "integer"},
+                    "question_id": {"type": ["integer", "null"]},
                     "statement": {"type": ["string", "null"]},
                     "points": {"type": ["integer", "null"]},
                     "type": {"type": ["string", "null"]},
@@ -92,7 +92,7 @@ USER_QUIZ_ONE_QUESTION_PUTTER_SCHEMA = {
                         "items": {"type": "integer"},
                     },
                 },
-                "required": ["question_id"],
+                "required": [],
             },
         }
     },
@@ -117,6 +117,9 @@ USER_QUIZ_ONE_STATS_ATTEMPTS_GETTER_SCHEMA = {
     "properties": {
         "page": {"type": ["integer", "null"]},
         "page_size": {"type": ["integer", "null"]},
+        "cursor": {"type": ["string", "null"]},
+        "with_total": {"type": ["boolean", "null"]},
+        "count": {"type": ["string", "null"]},
         "query": {"type": ["string", "null"]},
     },
     "required": [],
@@ -126,6 +129,9 @@ USER_QUIZ_ONE_STATS_QUESTION_ONE_GETTER_SCHEMA = {
     "properties": {
         "page": {"type": ["integer", "null"]},
         "page_size": {"type": ["integer", "null"]},
+        "cursor": {"type": ["string", "null"]},
+        "with_total": {"type": ["boolean", "null"]},
+        "count": {"type": ["string", "null"]},
         "query": {"type": ["string", "null"]},
     },
     "required": [],
@@ -0,0 +1,22 @@
+""" API Utilities
+"""
+
+from functools import wraps
+from models import async_storage
+
+
+def async_view(view):
+    """run a coroutine view on the event loop of the async storage, with
+    its own session closed once the view returns"""
+
+    async def run(*args, **kwargs):
+        try:
+            return await view(*args, **kwargs)
+        finally:
+            await async_storage.close()
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        return async_storage.run(run(*args, **kwargs))
+
+    return wrapper
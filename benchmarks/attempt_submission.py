@@ -0,0 +1,105 @@
+#!/usr/bin/python3
+"""Measure quiz attempt submissions through the API
+
+Users log in once and then submit full attempts to a quiz in a loop
+through the Flask test client, on a fresh SQLite database. Run with:
+
+    python -m benchmarks.attempt_submission [seconds] [questions] [users]
+"""
+import logging
+import os
+import sys
+from tempfile import TemporaryDirectory
+from time import monotonic
+
+
+def prepare(storage, questions: int, users: int) -> int:
+    """create the users and a quiz of multiple choice questions with four
+    options each, returning the quiz id"""
+    from bcrypt import gensalt, hashpw
+    from models.answer import Answer
+    from models.question import Question
+    from models.quiz import Quiz
+    from models.user import User
+
+    storage.reload(reset=True)
+    password = hashpw(b"pw", gensalt())
+    owner = storage.new(User(email="owner@x.com", password=password, user_name="o"))
+    for i in range(users):
+        storage.new(User(email=f"u{i}@x.com", password=password, user_name=f"u{i}"))
+    storage.save()
+    quiz = storage.new(
+        Quiz(
+            title="bench",
+            category="bench",
+            difficulty=1,
+            points=questions,
+            user_id=owner.id,
+        )
+    )
+    storage.save()
+    for i in range(questions):
+        question = storage.new(Question(f"q{i}", quiz.id, 1, "MCQ", i))
+        storage.save()
+        for order in range(4):
+            storage.new(Answer(f"a{order}", order, question.id, order % 2 == 0))
+    storage.save()
+    storage.close()
+    return quiz.id
+
+
+def run(seconds: float, questions: int, users: int) -> dict:
+    """submit attempts for `seconds` on a fresh database"""
+    with TemporaryDirectory() as tmp:
+        os.environ["QQ_DB"] = os.path.join(tmp, "bench")
+        os.environ.setdefault("AUTH", "SESSION_AUTH")
+        os.environ.setdefault("SESSION_NAME", "session_id")
+        from api.v1.app import app
+        from models import storage
+        from models.engine.instrumentation import collect_queries
+
+        # one log line per request would dominate the timings
+        logging.getLogger("quizquickie.sql").setLevel(logging.WARNING)
+
+        quiz_id = prepare(storage, questions, users)
+        clients = []
+        for i in range(users):
+            client = app.test_client()
+            client.post(
+                "/api/v1/auth/login", json={"email": f"u{i}@x.com", "password": "pw"}
+            )
+            clients.append(client)
+
+        url = f"/api/v1/user/profile/quiz/{quiz_id}/attempts"
+        # a full score and a partly wrong attempt, two options per question
+        bodies = [
+            {"answers": [{"options": [0, 2]}] * questions},
+            {"answers": [{"options": [i % 4, (i + 1) % 4]} for i in range(questions)]},
+        ]
+        count = errors = 0
+        with collect_queries() as stats:
+            deadline = monotonic() + seconds
+            while monotonic() < deadline:
+                response = clients[count % users].post(url, json=bodies[count % 2])
+                if response.status_code != 200:
+                    errors += 1
+                count += 1
+        storage.dispose()
+    return {
+        "submissions": count / seconds,
+        "errors": errors,
+        "queries": stats.count / max(count, 1),
+    }
+
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    questions = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    users = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    result = run(seconds, questions, users)
+    print(f"{seconds}s, {questions} questions, {users} users")
+    print(f"{'submissions/s':>14} {'queries/submission':>19} {'errors':>7}")
+    print(
+        f"{result['submissions']:>14.1f} {result['queries']:>19.1f}"
+        f" {result['errors']:>7}"
+    )
@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+"""Compare the SQLite profiles on a mixed read/write workload
+
+Writer threads submit quiz attempts while reader threads page through
+them, each thread on its own session like a request would. Run with:
+
+    python -m benchmarks.sqlite_profile [seconds] [writers] [readers]
+"""
+import sys
+from collections import Counter
+from os import path
+from tempfile import TemporaryDirectory
+from threading import Barrier, Thread
+from time import monotonic
+from models.engine.relational_storage import RelationalStorage
+from models.quiz import Quiz
+from models.quiz_attempt import QuizAttempt
+from models.user import User
+
+
+def prepare(storage: RelationalStorage, users: int = 20, quizzes: int = 20):
+    """create the users and quizzes the attempts are submitted to"""
+    storage.reload(reset=True)
+    owner = storage.new(User(email="owner@x.com", password=b"pw", user_name="owner"))
+    for i in range(users):
+        storage.new(User(email=f"u{i}@x.com", password=b"pw", user_name=f"user{i}"))
+    storage.save()
+    for i in range(quizzes):
+        storage.new(
+            Quiz(
+                title=f"quiz {i}",
+                category="bench",
+                difficulty=1,
+                points=10,
+                user_id=owner.id,
+            )
+        )
+    storage.save()
+    storage.close()
+
+
+def run(profile: str, seconds: float, writers: int, readers: int) -> dict:
+    """run the workload on a fresh database opened with a profile"""
+    with TemporaryDirectory() as tmp:
+        storage = RelationalStorage(
+            f"sqlite:///{path.join(tmp, 'bench.db')}",
+            replicas=[],
+            sqlite_profile=profile,
+        )
+        prepare(storage)
+        # one counter per thread, summed once they are joined
+        counters = [Counter() for _ in range(writers + readers)]
+        start = Barrier(writers + readers + 1)
+        deadline = []
+
+        def writer(n: int):
+            counts = counters[n]
+            start.wait()
+            i = 0
+            while monotonic() < deadline[0]:
+                i += 1
+                try:
+                    storage.new(
+                        QuizAttempt(
+                            quiz_id=1 + i % 20,
+                            user_id=2 + (n + i) % 20,
+                            score=i % 11,
+                            full_score=i % 11 == 10,
+                        )
+                    )
+                    storage.save()
+                    counts["writes"] += 1
+                except Exception:
+                    storage.cleanup()
+                    counts["errors"] += 1
+            storage.close()
+
+        def reader(n: int):
+            counts = counters[writers + n]
+            start.wait()
+            i = 0
+            while monotonic() < deadline[0]:
+                i += 1
+                try:
+                    storage.query(QuizAttempt).filter_by(
+                        quiz_id=1 + (n + i) % 20
+                    ).order_by(QuizAttempt.created_at.desc()).limit(50).all()
+                    storage.close()
+                    counts["reads"] += 1
+                except Exception:
+                    storage.cleanup()
+                    counts["errors"] += 1
+            storage.close()
+
+        threads = [Thread(target=writer, args=(n,)) for n in range(writers)]
+        threads += [Thread(target=reader, args=(n,)) for n in range(readers)]
+        for thread in threads:
+            thread.start()
+        deadline.append(monotonic() + seconds)
+        start.wait()
+        for thread in threads:
+            thread.join()
+        storage.dispose()
+    counts = sum(counters, Counter())
+    return {key: counts[key] / seconds for key in ("writes", "reads", "errors")}
+
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    writers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    readers = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+    print(f"{seconds}s, {writers} writers, {readers} readers")
+    print(f"{'profile':<12} {'writes/s':>10} {'reads/s':>10} {'errors/s':>10}")
+    for profile in ("default", "performance"):
+        result = run(profile, seconds, writers, readers)
+        print(
+            f"{profile:<12} {result['writes']:>10.1f} {result['reads']:>10.1f}"
+            f" {result['errors']:>10.1f}"
+        )
@@ -18,9 +18,12 @@ class Config:
         "/api/v1/quiz",
         "/api/v1/quiz/<int:quiz_id>",
         "/api/v1/quiz/<int:quiz_id>/stats",
+        "/api/v1/quiz/<int:quiz_id>/stats/distribution",
         "/api/v1/group",
         "/api/v1/group/<int:group_id>/users",
         "/api/v1/group/<int:group_id>/quizzes",
+        "/api/v1/group/<int:group_id>/stats/distribution",
+        "/api/v1/autocomplete",
     ]
     SQLALCHEMY_DATABASE_URI = "sqlite:///quizquickie.db"
     SQLALCHEMY_TRACK_MODIFICATIONS = False
@@ -1,4 +1,11 @@
+from os import getenv
 from models.engine.relational_storage import RelationalStorage
+from models.engine.async_relational_storage import AsyncRelationalStorage
+from models.engine.cache_storage import CacheStorage
+from models.engine.autocomplete import Autocomplete
+from models.engine.answer_keys import AnswerKeyCache
+from models.engine.question_stats import QuestionStatsCache
+from models.engine.leaderboard import Leaderboard
 from models.user import User
 from models.group import Group
 from models.group_user import group_user
@@ -7,6 +14,8 @@ from models.user_session import UserSession
 from models.question import Question
 from models.answer import Answer
 from models.quiz_attempt import QuizAttempt
+from models.quiz_stats import QuizStats
+from models.user_stats import UserStats
 from models.user_answer import UserAnswer
 from models.ownership import Ownership
 from bcrypt import hashpw, gensalt
@@ -19,12 +28,28 @@ classes = {
     "question": Question,
     "answer": Answer,
     "quiz_attempt": QuizAttempt,
+    "quiz_stats": QuizStats,
+    "user_stats": UserStats,
     "user_answer": UserAnswer,
     "ownership": Ownership,
 }
 
+if getenv("QQ_DB_ENGINE") == "MONGO":
+    # the routes build SQLAlchemy queries through storage.query(), which
+    # DocumentStorage cannot serve
+    raise ValueError("QQ_DB_ENGINE=MONGO cannot serve the API, use SQLITE or MYSQL")
+
 storage = RelationalStorage()
 storage.reload()
+async_storage = AsyncRelationalStorage()
+leaderboard = Leaderboard()
+if getenv("QQ_CACHE"):
+    storage = CacheStorage(storage)
+autocomplete = Autocomplete()
+autocomplete.build(storage)
+
+answer_keys = AnswerKeyCache()
+question_stats = QuestionStatsCache()
 
 # if storage.query(User).where(User.user_name == 'admin').one_or_none() is None:
 # 	admin = storage.new(User(email='admin@quizquickie.com', password=hashpw('admin'.encode(), gensalt()), user_name='admin')).save()
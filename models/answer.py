@@ -1,4 +1,4 @@
-from sqlalchemy import Column, ForeignKey, BOOLEAN, Integer, String
+from sqlalchemy import Column, ForeignKey, BOOLEAN, Index, Integer, String
 from sqlalchemy.orm import relationship
 from models.base import BaseModel, Base
 
@@ -7,6 +7,7 @@ class Answer(Base, BaseModel):
     """Answer DB model class"""
 
     __tablename__ = "answer"
+    __table_args__ = (Index("ix_answer_question_id_order", "question_id", "order"),)
 
     def __init__(self, text, order, question_id, correct, **kwargs):
         """initialize a Answer instance"""
@@ -1,6 +1,7 @@
 from datetime import datetime, timezone
-from sqlalchemy import Column, Integer, DateTime, func
+from sqlalchemy import Column, Integer, DateTime, func, inspect
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import make_transient_to_detached
 
 time_fmt = "%Y-%m-%dT%H:%M:%S.%f"
 
@@ -56,6 +57,22 @@ class BaseModel:
         """return a dictionary containing all keys/values of the instance"""
         return self.to_safe_dict(self.__dict__)
 
+    def column_state(self) -> dict:
+        """return the raw column values of the instance"""
+        return {
+            attr.key: getattr(self, attr.key)
+            for attr in inspect(self).mapper.column_attrs
+        }
+
+    @classmethod
+    def from_column_state(cls, state: dict):
+        """rebuild a detached instance from its raw column values"""
+        obj = inspect(cls).class_manager.new_instance()
+        for key, value in state.items():
+            setattr(obj, key, value)
+        make_transient_to_detached(obj)
+        return obj
+
     def to_safe_dict(self, obj_dict) -> dict:
         """remove private fields from the instance"""
         if "created_at" in obj_dict:
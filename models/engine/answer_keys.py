@@ -0,0 +1,201 @@
+#!/usr/bin/python3
+"""Answer key cache Module
+
+The correct options of every question of a quiz are compiled into
+bitmasks, so grading a submission is a few integer comparisons. Compiled
+keys are cached per quiz with the quiz's `content_version`. Committed
+changes to the questions or answers of a quiz, or to its group, drop its
+key in this process and increment its `content_version`, which other
+processes check once their copy is older than QQ_ANSWER_KEY_TTL seconds.
+"""
+from array import array
+from collections import OrderedDict
+from os import getenv
+from threading import Lock
+from time import monotonic
+from typing import Iterable, List, NamedTuple, Sequence, Tuple
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+from models.engine.quiz_content import QuizContent, load_quiz_content
+
+
+def option_mask(options: Sequence[int], count: int = None) -> int:
+    """the bitmask of a set of option orders, or -1 for an order outside
+    the `count` options of the question"""
+    mask = 0
+    for order in options:
+        # checked before shifting, a client sent order sizes the integer
+        if order < 0 or (count is not None and order >= count):
+            return -1
+        mask |= 1 << order
+    return mask
+
+
+def mask_options(mask: int) -> List[int]:
+    """the option orders of a bitmask"""
+    return [i for i in range(mask.bit_length()) if mask >> i & 1]
+
+
+class AnswerKey(NamedTuple):
+    """the compiled answer key of a quiz"""
+
+    quiz_id: int
+    version: int
+    group_id: int
+    question_ids: array
+    points: array
+    masks: Sequence[int]
+    option_counts: array
+
+    def grade(self, answers: Sequence[Sequence[int]]) -> Tuple[int, bool, list]:
+        """score the options chosen for each question, in question order;
+        return the score, whether it is a full score and the correct
+        options of every question"""
+        score = 0
+        full_score = True
+        for options, points, mask, count in zip(
+            answers, self.points, self.masks, self.option_counts
+        ):
+            if option_mask(options, count) == mask:
+                score += points
+            else:
+                full_score = False
+        return score, full_score, [{"options": mask_options(m)} for m in self.masks]
+
+
+def compile_answer_key(content: QuizContent) -> AnswerKey:
+    """compile the answer key of a quiz's content"""
+    masks = [
+        option_mask(a.order for a in q.options if a.correct) for q in content.questions
+    ]
+    return AnswerKey(
+        content.id,
+        content.version,
+        content.group_id,
+        array("q", (q.id for q in content.questions)),
+        array("q", (q.points for q in content.questions)),
+        # orders past 63 do not fit the unsigned 64 bit array
+        array("Q", masks) if all(m < 1 << 64 for m in masks) else tuple(masks),
+        array("q", (len(q.options) for q in content.questions)),
+    )
+
+
+class AnswerKeyCache:
+    """compiled answer keys of the most recently graded quizzes"""
+
+    def __init__(self, max_entries: int = None, ttl: float = None):
+        """initialise an empty cache"""
+        if max_entries is None:
+            max_entries = int(getenv("QQ_ANSWER_KEY_CACHE_SIZE", 1024))
+        if ttl is None:
+            ttl = float(getenv("QQ_ANSWER_KEY_TTL", 60))
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._keys = OrderedDict()
+        self._lock = Lock()
+        self._changed_key = f"answer_keys_{id(self)}"
+        self._bumps_key = f"answer_key_bumps_{id(self)}"
+        sa.event.listen(Session, "before_flush", self._collect)
+        sa.event.listen(Session, "after_flush", self._bump)
+        sa.event.listen(Session, "after_commit", self._invalidate)
+        sa.event.listen(Session, "after_soft_rollback", self._discard)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def get(self, storage, quiz_id: int) -> AnswerKey:
+        """the answer key of a quiz, compiled from the database of a storage
+        when it is not cached, or None if there is no such quiz"""
+        from models.quiz import Quiz
+
+        with self._lock:
+            entry = self._keys.get(quiz_id)
+            if entry is not None:
+                self._keys.move_to_end(quiz_id)
+        if entry is not None:
+            key, checked = entry
+            if monotonic() - checked < self.ttl:
+                return key
+            version = storage.session.execute(
+                sa.select(Quiz.content_version).where(Quiz.id == quiz_id)
+            ).scalar()
+            if version == key.version:
+                self._store(key)
+                return key
+
+        content = load_quiz_content(storage, quiz_id)
+        if content is None:
+            self.invalidate(quiz_id)
+            return None
+        key = compile_answer_key(content)
+        self._store(key)
+        return key
+
+    def _store(self, key: AnswerKey):
+        with self._lock:
+            self._keys[key.quiz_id] = (key, monotonic())
+            self._keys.move_to_end(key.quiz_id)
+            while len(self._keys) > self.max_entries:
+                self._keys.popitem(last=False)
+
+    def invalidate(self, quiz_id: int):
+        """drop the key of a quiz"""
+        with self._lock:
+            self._keys.pop(quiz_id, None)
+
+    def clear(self):
+        """drop every key"""
+        with self._lock:
+            self._keys.clear()
+
+    def touch(self, session: Session, quiz_ids: Iterable[int]):
+        """give a new version to quizzes whose questions or answers were
+        written outside the ORM, dropping their keys once committed"""
+        from models.quiz import Quiz
+
+        quiz_ids = set(quiz_ids)
+        if not quiz_ids:
+            return
+        session.execute(
+            sa.update(Quiz)
+            .where(Quiz.id.in_(quiz_ids))
+            .values(content_version=Quiz.content_version + 1)
+            .execution_options(synchronize_session=False)
+        )
+        session.info.setdefault(self._changed_key, set()).update(quiz_ids)
+
+    def _collect(self, session: Session, flush_context, instances):
+        """find the quizzes whose questions or answers are about to change"""
+        from sqlalchemy.orm import attributes
+        from models.answer import Answer
+        from models.question import Question
+        from models.quiz import Quiz
+
+        changed = set()
+        with session.no_autoflush:
+            for obj in session.new | session.dirty | session.deleted:
+                if isinstance(obj, Question):
+                    changed.add(obj.quiz_id)
+                elif isinstance(obj, Answer):
+                    question = obj.question or session.get(Question, obj.question_id)
+                    if question is not None:
+                        changed.add(question.quiz_id)
+                elif isinstance(obj, Quiz) and obj not in session.new:
+                    session.info.setdefault(self._changed_key, set()).add(obj.id)
+                    if attributes.get_history(obj, "group_id").has_changes():
+                        changed.add(obj.id)
+        changed.discard(None)
+        session.info.setdefault(self._bumps_key, set()).update(changed)
+
+    def _bump(self, session: Session, flush_context):
+        """give the quizzes whose content changed a new version"""
+        self.touch(session, session.info.pop(self._bumps_key, ()))
+
+    def _invalidate(self, session: Session):
+        for quiz_id in session.info.pop(self._changed_key, ()):
+            self.invalidate(quiz_id)
+
+    def _discard(self, session: Session, previous_transaction):
+        if previous_transaction.parent is None:
+            session.info.pop(self._changed_key, None)
+            session.info.pop(self._bumps_key, None)
@@ -0,0 +1,210 @@
+#!/usr/bin/python3
+"""AsyncRelationalStorage class Module
+"""
+from asyncio import current_task, new_event_loop, run_coroutine_threadsafe
+from collections.abc import Callable, Coroutine
+from contextlib import asynccontextmanager
+from threading import Lock, Thread
+from typing import Any
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import (
+    AsyncSession,
+    async_scoped_session,
+    async_sessionmaker,
+    create_async_engine,
+)
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
+from models.engine.instrumentation import instrument
+from models.engine.relational_storage import (
+    RelationalStorage,
+    WriteTracker,
+    apply_sqlite_pragmas,
+    database_url,
+    sqlite_pragmas,
+)
+
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "mysql": "mysql+aiomysql"}
+
+
+def async_database_url(url: str = None) -> sa.URL:
+    """the database url with its driver swapped for an asyncio one"""
+    url = sa.engine.make_url(url or database_url())
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+
+class AsyncRelationalStorage(WriteTracker):
+    """interacts with the SQL database from coroutines
+
+    Every asyncio task gets its own session. A connection must not outlive
+    the event loop it was opened in, so coroutines using the storage run
+    on its own long-lived loop, through `run`, and share a connection pool
+    there.
+    """
+
+    _engine = None
+    _session = None
+
+    def __init__(self, url: str = None, sqlite_profile: str = None):
+        """initialise the storage engine instance"""
+        url = async_database_url(url)
+        # aiosqlite defaults to opening a connection per checkout
+        options = {"poolclass": AsyncAdaptedQueuePool}
+        if url.get_backend_name() == "sqlite" and url.database in (
+            None,
+            "",
+            ":memory:",
+        ):
+            # every connection to :memory: is a new empty database
+            options["poolclass"] = StaticPool
+        self._engine = create_async_engine(url, **options)
+        self._loop = None
+        self._loop_lock = Lock()
+        if url.get_backend_name() == "sqlite":
+            apply_sqlite_pragmas(
+                self._engine.sync_engine, sqlite_pragmas(sqlite_profile)
+            )
+        instrument(self._engine.sync_engine)
+        # session events go to the synchronous class behind AsyncSession, one
+        # per storage so each reports only its own commits
+        sync_session_class = type("AsyncStorageSession", (Session,), {})
+        session_factory = async_sessionmaker(
+            self._engine,
+            expire_on_commit=False,
+            sync_session_class=sync_session_class,
+        )
+        self._session = async_scoped_session(session_factory, scopefunc=current_task)
+        self._track_writes(self._engine.sync_engine, sync_session_class)
+
+    def run(self, coroutine: Coroutine) -> Any:
+        """run a coroutine on the storage's event loop, in a copy of the
+        caller's context, and return its result"""
+        with self._loop_lock:
+            if self._loop is None:
+                # started on first use, so forked workers each get their own
+                self._loop = new_event_loop()
+                Thread(target=self._loop.run_forever, daemon=True).start()
+        return run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    @property
+    def session(self) -> AsyncSession:
+        """the database session of the current task"""
+        return self._session()
+
+    def new(self, obj):
+        """add the object to the current database session"""
+        if obj is not None:
+            self._session.add(obj)
+        return obj
+
+    async def update(self, obj):
+        """merge the object into the current database session"""
+        if obj is not None:
+            await self._session.merge(obj)
+        return obj
+
+    async def delete(self, obj):
+        """delete from the current database session obj if not None"""
+        if obj is not None:
+            await self._session.delete(obj)
+        return obj
+
+    async def save(self):
+        """commit all changes of the current database session, or only
+        flush them when called inside an open unit of work"""
+        if self._session().info.get("unit_of_work"):
+            await self._session.flush()
+        else:
+            await self._session.commit()
+
+    async def cleanup(self):
+        """rollback the changes that happened in the transaction"""
+        await self._session.rollback()
+
+    async def reload(self, reset: bool = False) -> bool:
+        """bootstrap the database schema, see `RelationalStorage.reload`"""
+        async with self._engine.begin() as conn:
+            return await conn.run_sync(
+                lambda sync_conn: RelationalStorage.bootstrap(sync_conn, reset)
+            )
+
+    async def close(self):
+        """close and discard the session of the current task"""
+        await self._session.remove()
+
+    async def dispose(self):
+        """close every pooled connection of the engine"""
+        await self._engine.dispose()
+
+    @asynccontextmanager
+    async def transaction(self):
+        """open an explicit unit of work on the current task's session
+
+        The changes are committed once when the outermost block exits and
+        rolled back if it raises; `save()` calls made inside only flush.
+        """
+        session: AsyncSession = self._session()
+        if session.info.get("unit_of_work"):
+            yield session
+            return
+        session.info["unit_of_work"] = True
+        try:
+            yield session
+            await session.commit()
+        except BaseException:
+            await session.rollback()
+            raise
+        finally:
+            session.info.pop("unit_of_work", None)
+
+    async def run_sync(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """run a function taking a synchronous Session on the current
+        task's session, to reuse the synchronous query helpers"""
+        return await self._session().run_sync(fn, *args, **kwargs)
+
+    async def execute(self, statement, *args, **kwargs) -> sa.Result:
+        """execute a statement on the current task's session"""
+        return await self._session.execute(statement, *args, **kwargs)
+
+    async def scalars(self, statement, *args, **kwargs) -> sa.ScalarResult:
+        """execute a statement and return its first column"""
+        return await self._session.scalars(statement, *args, **kwargs)
+
+    async def get(self, cls, id):
+        """
+        Returns the object based on the class and its ID, or
+        None if not found
+        """
+        from models import classes
+
+        if cls not in classes.values():
+            return None
+        return await self._session.get(cls, id)
+
+    async def search(self, cls, **kwargs):
+        """Search for a matching class instance"""
+        return (await self.scalars(sa.select(cls).filter_by(**kwargs))).all()
+
+    async def count(self, cls=None):
+        """count the number of objects in storage"""
+        from models import classes
+
+        if not cls:
+            counts = [await self.count(clas) for clas in classes.values()]
+            return sum(counts)
+        if cls not in classes.values():
+            return 0
+        return (
+            await self.execute(sa.select(sa.func.count()).select_from(cls))
+        ).scalar_one()
+
+    async def all(self, cls=None):
+        """query on the current database session"""
+        from models import classes
+
+        new_dict = {}
+        for clss in classes:
+            if cls is None or cls is classes[clss] or cls is clss:
+                for obj in await self.search(classes[clss]):
+                    new_dict[f"{obj.__class__.__name__}.{obj.id}"] = obj
+        return new_dict
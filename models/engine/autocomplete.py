@@ -0,0 +1,264 @@
+#!/usr/bin/python3
+"""Autocomplete index Module
+
+User names and group titles are kept in memory, indexed by prefix and by
+trigram, so search-as-you-type never reaches the database. The indexes
+follow the committed session changes of their models and are rebuilt
+every QQ_AUTOCOMPLETE_REFRESH seconds to catch the writes of other
+processes, in the background while the previous indexes keep serving.
+"""
+from bisect import bisect_left
+from heapq import nsmallest
+from os import getenv
+from sys import getsizeof
+from threading import Lock, RLock, Thread
+from time import monotonic
+from typing import Dict, Iterable, List, Set, Tuple
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+
+def trigrams(text: str) -> Set[str]:
+    """the 3 character substrings of a text"""
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    """substring index of short names, keyed by their trigrams and kept
+    sorted for prefix lookups"""
+
+    def __init__(self, max_entries: int = None):
+        """initialise an empty index holding at most `max_entries` names"""
+        if max_entries is None:
+            max_entries = int(getenv("QQ_AUTOCOMPLETE_MAX_ENTRIES", 100000))
+        self.max_entries = max_entries
+        self.complete = True
+        self._names: Dict[int, str] = {}
+        self._folded: Dict[int, str] = {}
+        self._sorted: List[Tuple[str, int]] = []
+        self._grams: Dict[str, Set[int]] = {}
+        self._lock = RLock()
+
+    def __len__(self):
+        return len(self._names)
+
+    def load(self, rows: Iterable[Tuple[int, str]]):
+        """replace the content of the index with (id, name) rows; over the
+        bound the index is left empty and marked incomplete"""
+        with self._lock:
+            self._names, self._folded, self._grams = {}, {}, {}
+            self._sorted = []
+            self.complete = True
+            for id, name in rows:
+                if len(self._names) >= self.max_entries:
+                    self._overflow()
+                    return
+                self._add(id, name)
+            self._sorted.sort()
+
+    def _overflow(self):
+        self._names, self._folded, self._grams = {}, {}, {}
+        self._sorted = []
+        self.complete = False
+
+    def _add(self, id: int, name: str):
+        folded = name.casefold()
+        self._names[id] = name
+        self._folded[id] = folded
+        self._sorted.append((folded, id))
+        for gram in trigrams(folded):
+            self._grams.setdefault(gram, set()).add(id)
+
+    def add(self, id: int, name: str):
+        """index a name, replacing the previous name of the id"""
+        with self._lock:
+            if not self.complete:
+                return
+            if self._names.get(id) == name:
+                return
+            self.remove(id)
+            if len(self._names) >= self.max_entries:
+                self._overflow()
+                return
+            folded = name.casefold()
+            self._names[id] = name
+            self._folded[id] = folded
+            self._sorted.insert(bisect_left(self._sorted, (folded, id)), (folded, id))
+            for gram in trigrams(folded):
+                self._grams.setdefault(gram, set()).add(id)
+
+    def remove(self, id: int):
+        """drop the name of an id"""
+        with self._lock:
+            folded = self._folded.pop(id, None)
+            if folded is None:
+                return
+            del self._names[id]
+            del self._sorted[bisect_left(self._sorted, (folded, id))]
+            for gram in trigrams(folded):
+                ids = self._grams[gram]
+                ids.discard(id)
+                if not ids:
+                    del self._grams[gram]
+
+    def search(self, text: str, k: int = 10) -> List[Tuple[int, str]]:
+        """the (id, name) of the k best names containing the text: prefix
+        matches first, then earlier, then shorter matches"""
+        text = text.casefold().strip()
+        if not text or k < 1:
+            return []
+        with self._lock:
+            if len(text) < 3:
+                # too short for trigrams, only prefixes are looked up
+                start = bisect_left(self._sorted, (text,))
+                found = []
+                for folded, id in self._sorted[start : start + k]:
+                    if not folded.startswith(text):
+                        break
+                    found.append((id, self._names[id]))
+                return found
+
+            postings = []
+            for gram in trigrams(text):
+                ids = self._grams.get(gram)
+                if not ids:
+                    return []
+                postings.append(ids)
+            postings.sort(key=len)
+            candidates = postings[0].intersection(*postings[1:])
+            ranked = nsmallest(
+                k,
+                (
+                    (folded.find(text) != 0, folded.find(text), len(folded), folded, id)
+                    for id in candidates
+                    for folded in (self._folded[id],)
+                    if text in folded
+                ),
+            )
+            return [(entry[-1], self._names[entry[-1]]) for entry in ranked]
+
+    def memory(self) -> int:
+        """approximate number of bytes held by the index"""
+        with self._lock:
+            size = sum(getsizeof(d) for d in (self._names, self._folded, self._grams))
+            size += sum(getsizeof(n) for n in self._names.values())
+            size += sum(getsizeof(f) for f in self._folded.values())
+            size += getsizeof(self._sorted) + sum(getsizeof(t) for t in self._sorted)
+            size += sum(getsizeof(g) + getsizeof(s) for g, s in self._grams.items())
+            return size
+
+    def stats(self) -> dict:
+        """the size of the index"""
+        with self._lock:
+            return {
+                "entries": len(self._names),
+                "trigrams": len(self._grams),
+                "bytes": self.memory(),
+                "max_entries": self.max_entries,
+                "complete": self.complete,
+            }
+
+
+class Autocomplete:
+    """the autocomplete indexes of the user names and group titles"""
+
+    def __init__(self, max_entries: int = None, refresh: float = None):
+        """initialise empty indexes; `build` fills them"""
+        from models.group import Group
+        from models.user import User
+
+        if refresh is None:
+            refresh = float(getenv("QQ_AUTOCOMPLETE_REFRESH", 300))
+        self.refresh = refresh
+        self.fields = {"users": User.user_name, "groups": Group.title}
+        self.max_entries = max_entries
+        self.indexes = {kind: TrigramIndex(max_entries) for kind in self.fields}
+        self._storage = None
+        self._built_at = None
+        self._refreshing = Lock()
+        self._changes_lock = Lock()
+        # changes committed while a build reads the database, or None
+        self._replay = None
+        self._key = f"autocomplete_{id(self)}"
+        sa.event.listen(Session, "after_flush", self._collect)
+        sa.event.listen(Session, "after_commit", self._apply)
+        sa.event.listen(Session, "after_soft_rollback", self._discard)
+
+    def build(self, storage, close: bool = True):
+        """fill new indexes from the database of a storage and swap them in,
+        closing its session afterwards unless told otherwise"""
+        self._storage = storage
+        with self._changes_lock:
+            self._replay = []
+        indexes = {kind: TrigramIndex(self.max_entries) for kind in self.fields}
+        try:
+            for kind, field in self.fields.items():
+                indexes[kind].load(storage.query(field.class_.id, field))
+            with self._changes_lock:
+                # the commits the database reads may have missed
+                for kind, id, name in self._replay:
+                    self._change(indexes[kind], id, name)
+                self.indexes = indexes
+                self._built_at = monotonic()
+        finally:
+            with self._changes_lock:
+                self._replay = None
+            if close:
+                storage.close()
+
+    def _refresh(self):
+        try:
+            self.build(self._storage)
+        finally:
+            self._refreshing.release()
+
+    def search(self, kind: str, text: str, k: int = 10) -> List[Tuple[int, str]]:
+        """the (id, name) of the k best matches of the text among the users
+        or groups, or None when the index is over its bound; stale indexes
+        are rebuilt by one background thread while they keep serving"""
+        if (
+            self._storage is not None
+            and self.refresh
+            and monotonic() - self._built_at > self.refresh
+            and self._refreshing.acquire(blocking=False)
+        ):
+            Thread(target=self._refresh, name="autocomplete", daemon=True).start()
+        index = self.indexes[kind]
+        return index.search(text, k) if index.complete else None
+
+    def stats(self) -> dict:
+        """the size of every index"""
+        return {kind: index.stats() for kind, index in self.indexes.items()}
+
+    def _collect(self, session: Session, flush_context):
+        """remember the names written by a flush until they are committed"""
+        changes = session.info.setdefault(self._key, [])
+        for kind, field in self.fields.items():
+            model, name = field.class_, field.key
+            for obj in session.new.union(session.dirty):
+                if isinstance(obj, model):
+                    changes.append((kind, obj.id, getattr(obj, name)))
+            for obj in session.deleted:
+                if isinstance(obj, model):
+                    changes.append((kind, obj.id, None))
+
+    def _apply(self, session: Session):
+        changes = session.info.pop(self._key, [])
+        if not changes:
+            return
+        with self._changes_lock:
+            for kind, id, name in changes:
+                self._change(self.indexes[kind], id, name)
+            if self._replay is not None:
+                self._replay.extend(changes)
+
+    @staticmethod
+    def _change(index: TrigramIndex, id: int, name: str):
+        if name is None:
+            index.remove(id)
+        else:
+            index.add(id, name)
+
+    def _discard(self, session: Session, previous_transaction):
+        if previous_transaction.parent is None:
+            session.info.pop(self._key, None)
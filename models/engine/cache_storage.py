@@ -0,0 +1,248 @@
+#!/usr/bin/python3
+"""CacheStorage class Module
+"""
+from collections import OrderedDict
+from os import getenv
+from threading import Lock
+from time import monotonic
+import pickle
+from sqlalchemy import inspect
+from sqlalchemy.orm.util import identity_key
+
+
+class MemoryCacheBackend:
+    """in-process LRU cache with a time to live on every entry"""
+
+    def __init__(self, max_entries: int = None):
+        """initialise an empty cache"""
+        if max_entries is None:
+            max_entries = int(getenv("QQ_CACHE_MAX_ENTRIES", 10000))
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = Lock()
+
+    def get(self, key: str):
+        """return the value of a key, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value, ttl: int):
+        """store the value of a key for ttl seconds"""
+        with self._lock:
+            self._entries[key] = (monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def generation(self, name: str) -> int:
+        """return the current generation of a table"""
+        return self._generations.get(name, 0)
+
+    def bump(self, name: str):
+        """move a table to a new generation, orphaning its cached entries"""
+        with self._lock:
+            self._generations[name] = self._generations.get(name, 0) + 1
+
+    def clear(self):
+        """drop every cached entry"""
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisCacheBackend:
+    """cache shared by every process through a Redis server"""
+
+    def __init__(self, client=None, prefix: str = "qq:"):
+        """initialise the cache on a Redis client"""
+        if client is None:
+            from redis import Redis
+
+            client = Redis.from_url(getenv("QQ_REDIS_URL", "redis://localhost:6379/0"))
+        self._client = client
+        self.prefix = prefix
+
+    def get(self, key: str):
+        """return the value of a key, or None if missing or expired"""
+        value = self._client.get(self.prefix + key)
+        return None if value is None else pickle.loads(value)
+
+    def set(self, key: str, value, ttl: int):
+        """store the value of a key for ttl seconds"""
+        self._client.set(self.prefix + key, pickle.dumps(value), ex=ttl)
+
+    def generation(self, name: str) -> int:
+        """return the current generation of a table"""
+        return int(self._client.get(f"{self.prefix}gen:{name}") or 0)
+
+    def bump(self, name: str):
+        """move a table to a new generation, orphaning its cached entries"""
+        self._client.incr(f"{self.prefix}gen:{name}")
+
+    def clear(self):
+        """drop every cached entry"""
+        keys = list(self._client.scan_iter(f"{self.prefix}*"))
+        if keys:
+            self._client.delete(*keys)
+
+
+def cache_backend(name: str = None):
+    """create the cache backend selected by QQ_CACHE"""
+    if name is None:
+        name = getenv("QQ_CACHE", "MEMORY")
+    if name == "REDIS":
+        return RedisCacheBackend()
+    return MemoryCacheBackend()
+
+
+class CacheStorage:
+    """read-through object cache in front of a RelationalStorage
+
+    Primary-key lookups, searches and counts are served from the cache
+    backend. Entries are keyed by the generation of their table, which is
+    bumped once a write to that table is committed, so a reader can not
+    cache a row it read before the commit under the new generation.
+    """
+
+    def __init__(self, storage, backend=None, ttl: int = None):
+        """initialise the cache in front of a storage engine"""
+        self._storage = storage
+        self._backend = backend if backend is not None else cache_backend()
+        self.ttl = ttl if ttl is not None else int(getenv("QQ_CACHE_TTL", 300))
+        storage.add_write_listener(self._invalidate)
+
+    def __getattr__(self, name):
+        """forward everything else to the wrapped storage engine"""
+        return getattr(self._storage, name)
+
+    def _invalidate(self, tables):
+        """bump the generation of the committed tables, or of all of them"""
+        if tables is None:
+            from models import classes
+
+            tables = [cls.__tablename__ for cls in classes.values()]
+        for table in tables:
+            self._backend.bump(table)
+
+    def _generation(self, cls) -> int:
+        return self._backend.generation(cls.__tablename__)
+
+    def _key(self, cls, *parts, generation: int = None) -> str:
+        """build a cache key under a generation of a table, the current one
+        by default"""
+        if generation is None:
+            generation = self._generation(cls)
+        return ":".join([cls.__tablename__, str(generation)] + [str(p) for p in parts])
+
+    def _attach(self, cls, state: dict):
+        """turn a cached column state into an instance of the session; an
+        instance already in the session is returned as is, so its pending
+        changes are kept"""
+        session = self._storage.session
+        obj = session.identity_map.get(identity_key(cls, state["id"]))
+        if obj is not None:
+            return obj
+        return session.merge(cls.from_column_state(state), load=False)
+
+    def _remember(self, obj, generation: int):
+        """cache the column state of an instance loaded under `generation`,
+        taken before the read so a commit racing it leaves the entry in an
+        old generation"""
+        if inspect(obj).modified:
+            return
+        key = self._key(type(obj), obj.id, generation=generation)
+        self._backend.set(key, obj.column_state(), self.ttl)
+
+    def new(self, obj):
+        """add the object to the current database session"""
+        return self._storage.new(obj)
+
+    def update(self, obj):
+        """merge the object into the current database session"""
+        return self._storage.update(obj)
+
+    def delete(self, obj):
+        """delete the object from the current database session"""
+        return self._storage.delete(obj)
+
+    def save(self):
+        """commit all changes of the current database session"""
+        self._storage.save()
+
+    def get(self, cls, id):
+        """return the object of a class with the given id, or None"""
+        generation = self._generation(cls)
+        state = self._backend.get(self._key(cls, id, generation=generation))
+        if state is not None:
+            return self._attach(cls, state)
+        obj = self._storage.get(cls, id)
+        if obj is not None:
+            self._remember(obj, generation)
+        return obj
+
+    def get_many(self, cls, ids, chunk_size: int = None) -> list:
+        """return the objects of many ids in input order, None for misses"""
+        ids = list(ids)
+        found = {}
+        generation = self._generation(cls)
+        for id in dict.fromkeys(ids):
+            state = self._backend.get(self._key(cls, id, generation=generation))
+            if state is not None:
+                found[id] = self._attach(cls, state)
+        missing = [id for id in dict.fromkeys(ids) if id not in found]
+        if missing:
+            for obj in self._storage.get_many(cls, missing, chunk_size):
+                if obj is not None:
+                    self._remember(obj, generation)
+                    found[obj.id] = obj
+        return [found.get(id) for id in ids]
+
+    def search(self, cls, **kwargs):
+        """search for the matching class instances"""
+        generation = self._generation(cls)
+        key = self._key(
+            cls, "search", repr(sorted(kwargs.items())), generation=generation
+        )
+        ids = self._backend.get(key)
+        if ids is not None:
+            objs = [self.get(cls, id) for id in ids]
+            if None not in objs:
+                return objs
+        objs = self._storage.search(cls, **kwargs)
+        for obj in objs:
+            self._remember(obj, generation)
+        self._backend.set(key, [obj.id for obj in objs], self.ttl)
+        return objs
+
+    def count(self, cls=None):
+        """count the number of objects in storage"""
+        from models import classes
+
+        if not cls:
+            return sum(self.count(clas) for clas in classes.values())
+        if cls not in classes.values():
+            return 0
+        key = self._key(cls, "count")
+        count = self._backend.get(key)
+        if count is None:
+            count = self._storage.count(cls)
+            self._backend.set(key, count, self.ttl)
+        return count
+
+    def all(self, cls=None):
+        """return all the objects of a class, or of every class"""
+        from models import classes
+
+        new_dict = {}
+        for clss in classes:
+            if cls is None or cls is classes[clss] or cls is clss:
+                for obj in self.search(classes[clss]):
+                    new_dict[f"{obj.__class__.__name__}.{obj.id}"] = obj
+        return new_dict
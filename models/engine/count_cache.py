@@ -0,0 +1,147 @@
+#!/usr/bin/python3
+"""CountCache class Module
+"""
+from os import getenv
+from threading import Lock
+from time import monotonic
+from typing import Iterable, Tuple
+import sqlalchemy as sa
+from sqlalchemy.orm import Query
+from sqlalchemy.sql.util import find_tables
+
+COUNT_MODES = ("exact", "cached", "estimated")
+
+
+class CountCache:
+    """short-lived cache of listing counts, dropped when a write to a table
+    they read from commits
+
+    Only the writes committed by this process drop counts; those of other
+    processes show up once the counts expire, after QQ_COUNT_CACHE_TTL
+    seconds.
+    """
+
+    def __init__(self, ttl: float = None, max_entries: int = 1024):
+        """initialise an empty count cache"""
+        if ttl is None:
+            ttl = float(getenv("QQ_COUNT_CACHE_TTL", 5))
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = Lock()
+
+    def get(self, key):
+        """return the cached count of a key, or None if missing or expired"""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < monotonic():
+            return None
+        return entry[2]
+
+    def set(self, key, tables: Iterable[str], count: int):
+        """cache the count of a key read from the given tables"""
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                now = monotonic()
+                for k in [k for k, e in self._entries.items() if e[0] < now]:
+                    del self._entries[k]
+                if len(self._entries) >= self.max_entries:
+                    self._entries.clear()
+            self._entries[key] = (monotonic() + self.ttl, frozenset(tables), count)
+
+    def invalidate(self, tables: Iterable[str] = None):
+        """drop the counts reading from any of the tables, or every count"""
+        with self._lock:
+            if tables is None:
+                self._entries.clear()
+                return
+            tables = set(tables)
+            for k in [k for k, e in self._entries.items() if e[1] & tables]:
+                del self._entries[k]
+
+    def clear(self):
+        """drop every cached count"""
+        self.invalidate()
+
+
+count_cache = CountCache()
+
+
+def query_tables(query: Query) -> set:
+    """names of the tables a query reads from"""
+    return {
+        t.name
+        for t in find_tables(query.statement, include_joins=True, include_aliases=True)
+        if isinstance(t, sa.Table)
+    }
+
+
+def count_key(query: Query) -> tuple:
+    """key a count query by its compiled SQL and bound parameters"""
+    compiled = query.statement.compile(dialect=query.session.get_bind().dialect)
+    return (compiled.string, repr(sorted(compiled.params.items())))
+
+
+def estimated_count(query: Query) -> int:
+    """row count of the query's main table taken from the table statistics,
+    or None when the database has not gathered any or the query does not
+    count every row of that one table"""
+    entity = query.column_descriptions[0]["entity"]
+    table = getattr(entity, "__table__", entity)
+    if not isinstance(table, sa.Table):
+        return None
+    statement = query.statement
+    if (
+        statement.whereclause is not None
+        or statement._group_by_clauses
+        or statement._distinct
+        or statement._limit_clause is not None
+        or statement._offset_clause is not None
+        or query_tables(query) != {table.name}
+    ):
+        return None
+    session = query.session
+    if session.get_bind().dialect.name == "sqlite":
+        if not session.execute(
+            sa.text("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")
+        ).scalar():
+            return None
+        stat = session.execute(
+            sa.text("SELECT stat FROM sqlite_stat1 WHERE tbl = :t"),
+            {"t": table.name},
+        ).scalar()
+        return int(stat.split()[0]) if stat else None
+    return session.execute(
+        sa.text(
+            "SELECT TABLE_ROWS FROM information_schema.TABLES"
+            " WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t"
+        ),
+        {"t": table.name},
+    ).scalar()
+
+
+def count_rows(query: Query, mode: str = None) -> Tuple[int, bool]:
+    """count the rows of a query with the given mode
+
+    `exact` always runs COUNT(*), `cached` reuses a recent count of the
+    same query and `estimated` reads the table statistics of unfiltered
+    queries, falling back to a cached count otherwise. Return the count and
+    whether it is an approximation.
+    """
+    if mode is None:
+        mode = getenv("QQ_COUNT_MODE", "exact")
+    if mode not in COUNT_MODES:
+        raise ValueError("count")
+
+    if mode == "estimated":
+        estimate = estimated_count(query)
+        if estimate is not None:
+            return estimate, True
+    if mode == "exact":
+        return query.count(), False
+
+    key = count_key(query)
+    count = count_cache.get(key)
+    if count is None:
+        count = query.count()
+        count_cache.set(key, query_tables(query), count)
+    return count, False
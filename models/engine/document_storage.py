@@ -1,14 +1,57 @@
 #!/usr/bin/python3
 """DocumentStorage class Module
 """
+from collections.abc import Callable
+from contextlib import contextmanager
+from datetime import datetime
 from os import getenv
-from pymongo import MongoClient
-
-classes = {}
+from threading import local
+from typing import Iterable, List
+from pymongo import ASCENDING, DeleteOne, IndexModel, InsertOne, MongoClient
+from pymongo import ReturnDocument, UpdateOne
+
+
+def client_options() -> dict:
+    """MongoClient connection pool options, tunable through QQ_MONGO_*"""
+    return {
+        "maxPoolSize": int(getenv("QQ_MONGO_MAX_POOL_SIZE", 100)),
+        "minPoolSize": int(getenv("QQ_MONGO_MIN_POOL_SIZE", 0)),
+        "maxIdleTimeMS": int(getenv("QQ_MONGO_MAX_IDLE_TIME_MS", 60000)),
+        "waitQueueTimeoutMS": int(getenv("QQ_MONGO_WAIT_QUEUE_TIMEOUT_MS", 30000)),
+        "uuidRepresentation": "standard",
+    }
+
+
+def collection_indexes(cls) -> List[IndexModel]:
+    """the indexes of a collection, declared after the model's SQL indexes
+    and unique columns"""
+    indexes = [
+        IndexModel(
+            [(col.name, ASCENDING) for col in index.columns],
+            name=index.name,
+            unique=bool(index.unique),
+        )
+        for index in cls.__table__.indexes
+    ]
+    indexes += [
+        IndexModel([(col.name, ASCENDING)], name=f"uq_{col.name}", unique=True)
+        for col in cls.__table__.columns
+        if col.unique
+    ]
+    return indexes
 
 
 class DocumentStorage:
-    """Interacts with the MongoDB database."""
+    """Interacts with the MongoDB database.
+
+    Writes are buffered per thread and sent with one `bulk_write` per
+    collection on `save()`. Ids are reserved from a `counters` collection
+    when objects are added, so they are known before the write happens.
+
+    It has no `query()`, so the API routes, which build SQLAlchemy
+    queries, cannot run on it; it serves scripts working through the
+    storage interface.
+    """
 
     _client = None
     __db = None
@@ -19,51 +62,176 @@ class DocumentStorage:
             self.__db = self._client[getenv("QQ_DB", "quizquickie")]
         return self.__db
 
-    def __init__(self):
-        self._client = MongoClient()
+    def __init__(self, client: MongoClient = None):
+        """initialise the storage engine on a client, or a new pooled one"""
+        if client is None:
+            client = MongoClient(
+                getenv("QQ_MONGO_URI", "mongodb://localhost:27017"), **client_options()
+            )
+        self._client = client
+        self._local = local()
+        self._write_listeners = []
+
+    @property
+    def _pending(self) -> dict:
+        """the writes of the current thread waiting for `save()`"""
+        if not hasattr(self._local, "pending"):
+            self._local.pending = {}
+        return self._local.pending
+
+    def _reserve_ids(self, collection: str, n: int) -> int:
+        """reserve n consecutive ids of a collection, return the first one"""
+        counter = self._db["counters"].find_one_and_update(
+            {"_id": collection},
+            {"$inc": {"seq": n}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return counter["seq"] - n + 1
+
+    def _document(self, obj) -> dict:
+        """convert a model instance into a document"""
+        doc = obj.column_state()
+        doc["_id"] = doc.pop("id")
+        return doc
+
+    def _instance(self, cls, doc: dict):
+        """convert a document into a detached model instance; columns left
+        out of a projection are set to None"""
+        if doc is None:
+            return None
+        doc = dict(doc)
+        doc["id"] = doc.pop("_id")
+        columns = [attr.key for attr in cls.__mapper__.column_attrs]
+        return cls.from_column_state({key: doc.get(key) for key in columns})
+
+    def _projection(self, fields: Iterable[str] = None) -> dict:
+        """build a projection fetching only the given fields"""
+        if fields is None:
+            return None
+        return {("_id" if f == "id" else f): 1 for f in fields}
+
+    def _buffer(self, collection: str, op):
+        """queue a write until the next `save()`"""
+        self._pending.setdefault(collection, []).append(op)
+
+    def add_write_listener(self, listener: Callable[[List[str]], None]):
+        """call `listener` with the collection names written by every save"""
+        self._write_listeners.append(listener)
 
     def new(self, obj):
         """Add the object to the current database."""
-        print(obj)
-        self._db[obj.__tablename__].insert_one(obj.json())
+        if obj is not None:
+            self.insert_many([obj])
+        return obj
+
+    def insert_many(self, objs: list) -> list:
+        """Add many objects of one model at once, reserving their ids
+        with a single counter update."""
+        if not objs:
+            return objs
+        collection = objs[0].__tablename__
+        now = datetime.now()
+        first_id = self._reserve_ids(collection, len(objs))
+        for i, obj in enumerate(objs):
+            obj.id = first_id + i
+            obj.created_at = obj.created_at or now
+            obj.updated_at = obj.updated_at or now
+            self._buffer(collection, InsertOne(self._document(obj)))
+        return objs
 
     def update(self, obj):
         """Update the object in the database."""
-        self._db[obj.__tablename__].update_one({"_id": obj.id}, {"$set": obj.json()})
+        if obj is not None:
+            obj.updated_at = datetime.now()
+            doc = self._document(obj)
+            self._buffer(
+                obj.__tablename__, UpdateOne({"_id": doc.pop("_id")}, {"$set": doc})
+            )
+        return obj
 
     def delete(self, obj):
         """Delete the object from the current database."""
         if obj is not None:
-            self._db[obj.__tablename__].delete_one({"_id": obj.id})
+            self._buffer(obj.__tablename__, DeleteOne({"_id": obj.id}))
+        return obj
 
-    def save(self):
-        """Placeholder for save (MongoDB auto-commits)."""
-        pass
+    def bulk_write(self, collection: str, ops: list):
+        """Queue raw pymongo write operations on a collection."""
+        self._pending.setdefault(collection, []).extend(ops)
 
-    def reload(self):
-        """Reloads data from the database."""
-        pass
+    def save(self):
+        """Send the buffered writes with one bulk write per collection."""
+        pending, self._local.pending = self._pending, {}
+        for collection, ops in pending.items():
+            if ops:
+                self._db[collection].bulk_write(ops, ordered=True)
+        if pending:
+            for listener in self._write_listeners:
+                listener(list(pending))
+
+    def cleanup(self):
+        """Drop the writes buffered since the last save."""
+        self._local.pending = {}
+
+    @contextmanager
+    def transaction(self):
+        """Buffer the writes of a block and save them once it exits."""
+        try:
+            yield self
+            self.save()
+        except BaseException:
+            self.cleanup()
+            raise
+
+    def reload(self, reset: bool = False):
+        """Create the declared indexes, dropping every collection first on
+        `reset`."""
+        from models import classes
+
+        for cls in classes.values():
+            collection = self._db[cls.__tablename__]
+            if reset:
+                collection.drop()
+            indexes = collection_indexes(cls)
+            if indexes:
+                collection.create_indexes(indexes)
+        if reset:
+            self._db["counters"].drop()
 
     def close(self):
-        """Close the MongoDB client connection."""
-        self._client.close()
+        """Drop the unsaved writes of the current thread."""
+        self.cleanup()
 
-    def get(self, cls, id):
+    def get(self, cls, id, fields: Iterable[str] = None):
         """
-        Returns the object based on the class name and its ID, or
+        Returns the object based on the class and its ID, or
         None if not found.
         """
-        if cls.__tablename__ not in classes.values():
-            return None
-        result = self._db[cls.__tablename__].find_one({"_id": id})
-        return result
-
-    def search(self, cls, **kwargs):
+        doc = self._db[cls.__tablename__].find_one(
+            {"_id": id}, self._projection(fields)
+        )
+        return self._instance(cls, doc)
+
+    def get_many(self, cls, ids: list, fields: Iterable[str] = None) -> list:
+        """Return the objects of many ids in input order, None for misses."""
+        docs = self._db[cls.__tablename__].find(
+            {"_id": {"$in": list(ids)}}, self._projection(fields)
+        )
+        found = {doc["_id"]: self._instance(cls, doc) for doc in docs}
+        return [found.get(id) for id in ids]
+
+    def search(self, cls, fields: Iterable[str] = None, **kwargs):
         """Search for a matching class instance."""
-        return list(self._db[cls.__tablename__].find(kwargs))
+        if "id" in kwargs:
+            kwargs["_id"] = kwargs.pop("id")
+        docs = self._db[cls.__tablename__].find(kwargs, self._projection(fields))
+        return [self._instance(cls, doc) for doc in docs]
 
     def count(self, cls=None):
         """Count the number of objects in storage."""
+        from models import classes
+
         count = 0
         if cls is None:
             count = sum(
@@ -76,44 +244,11 @@ class DocumentStorage:
 
     def all(self, cls=None):
         """Query all objects in the current database."""
+        from models import classes
+
         new_dict = {}
-        if cls is None:
-            for clas in classes.values():
-                objs = self._db[clas.__tablename__].find({})
-                for obj in objs:
-                    key = clas.__name__ + "." + str(obj["_id"])
-                    new_dict[key] = obj
-        else:
-            objs = self._db[cls.__tablename__].find({})
-            for obj in objs:
-                key = cls.__name__ + "." + str(obj["_id"])
-                new_dict[key] = obj
+        for clas in classes.values():
+            if cls is None or cls is clas:
+                for obj in self.search(clas):
+                    new_dict[f"{clas.__name__}.{obj.id}"] = obj
         return new_dict
-
-
-# Example usage
-if __name__ == "__main__":
-    db = DocumentStorage()
-    db.reload()
-
-    class T:
-        __tablename__ = "t"
-        id = 69
-        h = "hello"
-        w = "world"
-
-        def json(self):
-            return self.__dict__
-
-    db.new(T())  # Add the object to the database
-    db.new(T())
-    db.new(T())
-
-    # Retrieve object by id
-    obj = db.all(T)
-    print(obj)
-
-    # Check if count is correct
-    if not db.count(T) == 3:
-        print(db.count(T))
-        assert False
@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+"""SQL instrumentation Module
+
+Engines passed to `instrument` report every statement they run to the
+`QueryStats` collecting in the current context, so the queries of a
+request (or of a `query_budget` block) can be counted and timed.
+"""
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from heapq import heappush, heappushpop
+from os import getenv
+from time import perf_counter
+from typing import List, Tuple
+import sqlalchemy as sa
+
+_current: ContextVar["QueryStats"] = ContextVar("query_stats", default=None)
+
+
+class QueryStats:
+    """the statements run while collecting, with their timings"""
+
+    def __init__(self, slowest: int = 5, n_plus_one: int = None, parent=None):
+        """start empty, keeping the `slowest` longest statements and
+        flagging statements repeated `n_plus_one` times or more; every
+        statement is also reported to the `parent` stats"""
+        if n_plus_one is None:
+            n_plus_one = int(getenv("QQ_SQL_N_PLUS_ONE", 5))
+        self.count = 0
+        self.total_time = 0.0
+        self.statements = Counter()
+        self.n_plus_one_threshold = n_plus_one
+        self._slowest_size = slowest
+        self._slowest = []
+        self.parent = parent
+
+    def record(self, statement: str, duration: float):
+        """account for one executed statement"""
+        self.count += 1
+        self.total_time += duration
+        self.statements[statement] += 1
+        entry = (duration, self.count, statement)
+        if len(self._slowest) < self._slowest_size:
+            heappush(self._slowest, entry)
+        else:
+            heappushpop(self._slowest, entry)
+        if self.parent is not None:
+            self.parent.record(statement, duration)
+
+    @property
+    def slowest(self) -> List[Tuple[float, str]]:
+        """the longest statements with their duration, longest first"""
+        return [(d, s) for d, _, s in sorted(self._slowest, reverse=True)]
+
+    @property
+    def n_plus_one(self) -> List[Tuple[str, int]]:
+        """statements run again and again with only their parameters
+        changing, with how many times they ran"""
+        return [
+            (statement, n)
+            for statement, n in self.statements.most_common()
+            if n >= self.n_plus_one_threshold
+        ]
+
+    def as_dict(self) -> dict:
+        """summary of the collected statements for logging"""
+        return {
+            "queries": self.count,
+            "db_time_ms": round(self.total_time * 1000, 3),
+            "slowest": [
+                {"ms": round(d * 1000, 3), "sql": " ".join(s.split())}
+                for d, s in self.slowest
+            ],
+            "n_plus_one": [
+                {"count": n, "sql": " ".join(s.split())} for s, n in self.n_plus_one
+            ],
+        }
+
+    def header(self) -> str:
+        """short summary of the collected statements for a response header"""
+        return (
+            f"count={self.count}; time_ms={self.total_time * 1000:.3f};"
+            f" n_plus_one={len(self.n_plus_one)}"
+        )
+
+
+def _before_execute(conn, cursor, statement, params, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("query_start", []).append(perf_counter())
+
+
+def _after_execute(conn, cursor, statement, params, context, executemany):
+    stats = _current.get()
+    if stats is not None and conn.info.get("query_start"):
+        stats.record(statement, perf_counter() - conn.info["query_start"].pop())
+
+
+def instrument(engine: sa.Engine):
+    """report the statements of an engine to the collecting QueryStats"""
+    if not sa.event.contains(engine, "before_cursor_execute", _before_execute):
+        sa.event.listen(engine, "before_cursor_execute", _before_execute)
+        sa.event.listen(engine, "after_cursor_execute", _after_execute)
+
+
+def start_collecting(**kwargs) -> Tuple[QueryStats, object]:
+    """collect the statements of the current context into new QueryStats;
+    return them with the token to pass to `stop_collecting`"""
+    stats = QueryStats(parent=_current.get(), **kwargs)
+    return stats, _current.set(stats)
+
+
+def stop_collecting(token):
+    """stop collecting, restoring the collector that was active before"""
+    _current.reset(token)
+
+
+@contextmanager
+def collect_queries(**kwargs):
+    """collect the statements run inside the block"""
+    stats, token = start_collecting(**kwargs)
+    try:
+        yield stats
+    finally:
+        stop_collecting(token)
+
+
+@contextmanager
+def query_budget(max_queries: int, allow_n_plus_one: bool = False):
+    """fail with an AssertionError when the block runs more than
+    `max_queries` statements, or any N+1 pattern unless allowed
+
+        with query_budget(3):
+            client.get("/api/v1/group")
+    """
+    with collect_queries() as stats:
+        yield stats
+    report = "\n".join(f"  {n}x {s}" for s, n in stats.statements.most_common())
+    assert (
+        stats.count <= max_queries
+    ), f"{stats.count} queries over a budget of {max_queries}:\n{report}"
+    assert allow_n_plus_one or not stats.n_plus_one, f"N+1 queries:\n{report}"
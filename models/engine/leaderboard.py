@@ -0,0 +1,638 @@
+#!/usr/bin/python3
+"""Leaderboard class Module
+"""
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta, timezone
+from math import inf
+from os import getenv
+from threading import RLock
+from time import monotonic
+from typing import Callable, Dict, Iterable, List, Tuple
+from uuid import uuid4
+import sqlalchemy as sa
+from sqlalchemy.orm import Session, attributes
+
+WINDOWS = ("all", "week")
+
+# schema_meta key of the version shared by the boards of every process
+VERSION_KEY = "leaderboard_version"
+
+
+class MemoryLeaderboardBackend:
+    """in-process score boards, each kept as a bisect-sorted list of
+    (-score, member) next to a member -> score map
+
+    Boards are only seen by their process, which reads the attempts other
+    processes graded from the database when it syncs them.
+    """
+
+    shared = False
+
+    def __init__(self):
+        """initialise without any board"""
+        self._scores: Dict[str, dict] = {}
+        self._ranks: Dict[str, list] = {}
+        self._watermarks: Dict[str, int] = {}
+        self._applied: Dict[str, set] = {}
+        self._expires: Dict[str, float] = {}
+        self._lock = RLock()
+
+    @property
+    def lock(self):
+        """lock making a board load atomic with the increments around it"""
+        return self._lock
+
+    def _expire(self):
+        """drop the boards past their time to live"""
+        now = monotonic()
+        for board in [b for b, t in self._expires.items() if t <= now]:
+            for boards in (self._scores, self._ranks, self._watermarks):
+                boards.pop(board, None)
+            self._applied.pop(board, None)
+            del self._expires[board]
+
+    def watermark(self, board: str) -> int:
+        """the attempt id up to which a board counts every attempt, or None
+        when it was not filled from the database"""
+        with self._lock:
+            self._expire()
+            return self._watermarks.get(board)
+
+    def replace(
+        self, board: str, scores: Dict[int, int], watermark: int, ttl: int = None
+    ):
+        """fill a board with the scores of the attempts up to `watermark`"""
+        with self._lock:
+            self._expire()
+            self._scores[board] = dict(scores)
+            self._ranks[board] = sorted((-s, m) for m, s in scores.items())
+            self._watermarks[board] = watermark
+            self._applied[board] = set()
+            if ttl:
+                self._expires[board] = monotonic() + ttl
+            else:
+                self._expires.pop(board, None)
+
+    def apply(
+        self, board: str, attempt_id: int, member: int, amount: int, ttl: int = None
+    ) -> bool:
+        """add the score of an attempt to a loaded board that does not count
+        it yet, returning whether it was added"""
+        with self._lock:
+            watermark = self.watermark(board)
+            if watermark is None or attempt_id <= watermark:
+                return False
+            if attempt_id in self._applied[board]:
+                return False
+            self._applied[board].add(attempt_id)
+            self._incr(board, member, amount)
+            return True
+
+    def settle(self, board: str, watermark: int):
+        """move the watermark of a board up, forgetting the attempts below"""
+        with self._lock:
+            if self._watermarks.get(board, watermark) < watermark:
+                self._watermarks[board] = watermark
+                self._applied[board] = {
+                    i for i in self._applied[board] if i > watermark
+                }
+
+    def _incr(self, board: str, member: int, amount: int):
+        scores = self._scores.setdefault(board, {})
+        ranks = self._ranks.setdefault(board, [])
+        old = scores.get(member)
+        if old is not None:
+            del ranks[bisect_left(ranks, (-old, member))]
+        scores[member] = (old or 0) + amount
+        insort(ranks, (-scores[member], member))
+
+    def score(self, board: str, member: int) -> int:
+        """the score of a member, or None"""
+        return self._scores.get(board, {}).get(member)
+
+    def rank(self, board: str, member: int) -> int:
+        """the 0-based rank of a member, or None"""
+        score = self.score(board, member)
+        if score is None:
+            return None
+        return bisect_left(self._ranks[board], (-score, member))
+
+    def _bounds(self, board: str, min_score=None, max_score=None) -> Tuple[int, int]:
+        ranks = self._ranks.get(board, [])
+        lo = 0 if max_score is None else bisect_left(ranks, (-max_score,))
+        hi = (
+            len(ranks)
+            if min_score is None
+            else bisect_right(ranks, (-min_score, float("inf")))
+        )
+        return lo, hi
+
+    def range(
+        self, board: str, offset: int, limit: int, min_score=None, max_score=None
+    ) -> List[Tuple[int, int]]:
+        """(member, score) pairs by descending score within the bounds"""
+        with self._lock:
+            lo, hi = self._bounds(board, min_score, max_score)
+            ranks = self._ranks.get(board, [])
+            start = lo + offset
+            return [(m, -s) for s, m in ranks[start : min(start + limit, hi)]]
+
+    def count(self, board: str, min_score=None, max_score=None) -> int:
+        """number of members within the score bounds"""
+        with self._lock:
+            lo, hi = self._bounds(board, min_score, max_score)
+            return max(hi - lo, 0)
+
+    def clear(self):
+        """drop every board"""
+        with self._lock:
+            for boards in (
+                self._scores,
+                self._ranks,
+                self._watermarks,
+                self._applied,
+                self._expires,
+            ):
+                boards.clear()
+
+
+class RedisLeaderboardBackend:
+    """score boards shared by every process as Redis sorted sets"""
+
+    shared = True
+
+    def __init__(
+        self,
+        client=None,
+        prefix: str = "qq:lb:",
+        lock_name: str = "qq:lb-lock",
+        lock_timeout: int = 30,
+    ):
+        """initialise the boards on a Redis client, the lock being kept
+        out of the prefix the boards are cleared by"""
+        if client is None:
+            from redis import Redis
+
+            client = Redis.from_url(getenv("QQ_REDIS_URL", "redis://localhost:6379/0"))
+        self._client = client
+        self.prefix = prefix
+        self.lock_name = lock_name
+        self.lock_timeout = lock_timeout
+
+    @property
+    def lock(self):
+        """lock making a board load atomic with the increments and clears
+        of every process"""
+        return self._client.lock(self.lock_name, timeout=self.lock_timeout)
+
+    def watermark(self, board: str) -> int:
+        """the attempt id up to which a board counts every attempt, or None
+        when it was not filled from the database"""
+        watermark = self._client.get(f"{self.prefix}{board}:loaded")
+        return None if watermark is None else int(watermark)
+
+    def replace(
+        self, board: str, scores: Dict[int, int], watermark: int, ttl: int = None
+    ):
+        """fill a board with the scores of the attempts up to `watermark`"""
+        key = self.prefix + board
+        pipe = self._client.pipeline()
+        pipe.delete(key, f"{key}:applied")
+        if scores:
+            pipe.zadd(key, {str(m): s for m, s in scores.items()})
+        pipe.set(f"{key}:loaded", watermark, ex=ttl)
+        if ttl:
+            pipe.expire(key, ttl)
+        pipe.execute()
+
+    def apply(
+        self, board: str, attempt_id: int, member: int, amount: int, ttl: int = None
+    ) -> bool:
+        """add the score of an attempt to a loaded board that does not count
+        it yet, returning whether it was added; call it holding the lock"""
+        key = self.prefix + board
+        watermark = self.watermark(board)
+        if watermark is None or attempt_id <= watermark:
+            return False
+        # the attempts past the watermark are kept scored by their id
+        if not self._client.zadd(f"{key}:applied", {attempt_id: attempt_id}, nx=True):
+            return False
+        pipe = self._client.pipeline()
+        pipe.zincrby(key, amount, str(member))
+        if ttl:
+            pipe.expire(f"{key}:applied", ttl)
+        pipe.execute()
+        return True
+
+    def settle(self, board: str, watermark: int):
+        """move the watermark of a board up, forgetting the attempts below;
+        call it holding the lock"""
+        key = self.prefix + board
+        current = self.watermark(board)
+        if current is not None and current < watermark:
+            pipe = self._client.pipeline()
+            pipe.set(f"{key}:loaded", watermark, keepttl=True)
+            pipe.zremrangebyscore(f"{key}:applied", "-inf", watermark)
+            pipe.execute()
+
+    def score(self, board: str, member: int) -> int:
+        """the score of a member, or None"""
+        score = self._client.zscore(self.prefix + board, str(member))
+        return None if score is None else int(score)
+
+    def rank(self, board: str, member: int) -> int:
+        """the 0-based rank of a member, or None"""
+        return self._client.zrevrank(self.prefix + board, str(member))
+
+    def range(
+        self, board: str, offset: int, limit: int, min_score=None, max_score=None
+    ) -> List[Tuple[int, int]]:
+        """(member, score) pairs by descending score within the bounds"""
+        rows = self._client.zrevrangebyscore(
+            self.prefix + board,
+            "+inf" if max_score is None else max_score,
+            "-inf" if min_score is None else min_score,
+            start=offset,
+            num=limit,
+            withscores=True,
+        )
+        return [(int(m), int(s)) for m, s in rows]
+
+    def count(self, board: str, min_score=None, max_score=None) -> int:
+        """number of members within the score bounds"""
+        return self._client.zcount(
+            self.prefix + board,
+            "-inf" if min_score is None else min_score,
+            "+inf" if max_score is None else max_score,
+        )
+
+    def clear(self):
+        """drop every board"""
+        keys = list(self._client.scan_iter(f"{self.prefix}*"))
+        if keys:
+            self._client.delete(*keys)
+
+
+def leaderboard_backend(name: str = None):
+    """create the leaderboard backend selected by QQ_LEADERBOARD"""
+    if name is None:
+        name = getenv("QQ_LEADERBOARD", "MEMORY")
+    if name == "REDIS":
+        return RedisLeaderboardBackend()
+    return MemoryLeaderboardBackend()
+
+
+def week_start(when: datetime = None) -> datetime:
+    """midnight (UTC, like the stored timestamps) of the monday starting
+    the week of `when`"""
+    when = when or datetime.now(timezone.utc).replace(tzinfo=None)
+    return datetime(when.year, when.month, when.day) - timedelta(days=when.weekday())
+
+
+class Leaderboard:
+    """global and per-group score totals of the users' quiz attempts
+
+    Each board is filled from the database the first time it is read, up
+    to a watermark attempt id, and then counts every later attempt once:
+    those graded by its process as they are recorded, and all of them when
+    it syncs with the database, at most every QQ_LEADERBOARD_VERSION_TTL
+    seconds. Boards exist for all-time totals and for the attempts of the
+    current week, the weekly ones expiring after QQ_LEADERBOARD_WEEK_TTL.
+
+    Attempt ids are not committed in order on MySQL, so the watermark only
+    moves up to the last attempt created QQ_LEADERBOARD_LAG seconds ago,
+    which assumes attempts commit within that delay.
+
+    Writes that move totals other than by a new attempt (deleted attempts,
+    quizzes, users or groups, changed scores, quizzes moving group) give
+    the leaderboards a new version in the database, in their transaction.
+    Shared boards are cleared once the write commits; the boards of a
+    process are dropped once it sees the new version, which it checks
+    along with its syncs.
+    """
+
+    def __init__(
+        self,
+        backend=None,
+        storage=None,
+        version_ttl: float = None,
+        lag: float = None,
+    ):
+        """initialise the leaderboards on a backend, over the database of
+        `storage` or of the models' storage"""
+        if version_ttl is None:
+            version_ttl = float(getenv("QQ_LEADERBOARD_VERSION_TTL", 5))
+        if lag is None:
+            lag = float(getenv("QQ_LEADERBOARD_LAG", 30))
+        self._backend = backend if backend is not None else leaderboard_backend()
+        self._storage = storage
+        self.week_ttl = int(getenv("QQ_LEADERBOARD_WEEK_TTL", 8 * 7 * 86400))
+        self.version_ttl = version_ttl
+        self.lag = lag
+        self._version = None
+        self._checked = None
+        self._synced: Dict[str, float] = {}
+        self._changed_key = f"leaderboard_changed_{id(self)}"
+        self._touched_key = f"leaderboard_touched_{id(self)}"
+        sa.event.listen(Session, "before_flush", self._collect)
+        sa.event.listen(Session, "after_flush", self._bump)
+        sa.event.listen(Session, "after_commit", self._invalidate)
+        sa.event.listen(Session, "after_soft_rollback", self._discard)
+
+    @property
+    def storage(self):
+        """the storage the totals are read from"""
+        if self._storage is None:
+            from models import storage
+
+            return storage
+        return self._storage
+
+    def touch(self, session: Session):
+        """give the leaderboards a new version in the transaction of a write
+        that moved score totals, dropping the boards once committed"""
+        from models.engine.relational_storage import schema_meta
+
+        key = schema_meta.c.key == VERSION_KEY
+        session.execute(schema_meta.delete().where(key))
+        session.execute(schema_meta.insert().values(key=VERSION_KEY, value=uuid4().hex))
+        session.info[self._touched_key] = True
+
+    def _read_version(self) -> str:
+        from models.engine.relational_storage import schema_meta
+
+        return self.storage.session.execute(
+            sa.select(schema_meta.c.value).where(schema_meta.c.key == VERSION_KEY)
+        ).scalar()
+
+    def _check_version(self):
+        """drop the boards of this process if another one changed the
+        version since they were loaded"""
+        if self._backend.shared:
+            return
+        now = monotonic()
+        if self._checked is not None and now - self._checked < self.version_ttl:
+            return
+        version = self._read_version()
+        with self._backend.lock:
+            if version != self._version:
+                self._backend.clear()
+                self._version = version
+            self._checked = now
+
+    def _collect(self, session: Session, flush_context, instances):
+        """find the writes about to move score totals"""
+        from models.group import Group
+        from models.quiz import Quiz
+        from models.quiz_attempt import QuizAttempt
+        from models.user import User
+
+        for obj in session.deleted:
+            if isinstance(obj, (QuizAttempt, Quiz, Group, User)):
+                session.info[self._changed_key] = True
+                return
+        for obj in session.dirty:
+            if isinstance(obj, QuizAttempt):
+                fields = ("score", "created_at")
+            elif isinstance(obj, Quiz):
+                fields = ("group_id",)
+            else:
+                continue
+            if any(attributes.get_history(obj, f).has_changes() for f in fields):
+                session.info[self._changed_key] = True
+                return
+
+    def _bump(self, session: Session, flush_context):
+        if session.info.pop(self._changed_key, False):
+            self.touch(session)
+
+    def _invalidate(self, session: Session):
+        if session.info.pop(self._touched_key, False):
+            self.clear()
+
+    def _discard(self, session: Session, previous_transaction):
+        if previous_transaction.parent is None:
+            session.info.pop(self._changed_key, None)
+            session.info.pop(self._touched_key, None)
+
+    def board(self, group_id: int = None, window: str = "all", when=None) -> str:
+        """name of the board of a group (or the global one) and window"""
+        if window not in WINDOWS:
+            raise ValueError("window")
+        scope = "global" if group_id is None else f"group:{group_id}"
+        if window == "week":
+            return f"{scope}:week:{week_start(when):%Y-%m-%d}"
+        return f"{scope}:all"
+
+    def _ttl(self, window: str) -> int:
+        return self.week_ttl if window == "week" else None
+
+    def _attempts(self, select, group_id: int = None, window: str = "all", when=None):
+        """restrict a select of quiz attempts to those counted by a board"""
+        from models.quiz import Quiz
+        from models.quiz_attempt import QuizAttempt
+
+        if group_id is not None:
+            select = select.join(Quiz, Quiz.id == QuizAttempt.quiz_id).where(
+                Quiz.group_id == group_id
+            )
+        if window == "week":
+            start = week_start(when)
+            select = select.where(
+                QuizAttempt.created_at >= start,
+                QuizAttempt.created_at < start + timedelta(days=7),
+            )
+        return select
+
+    def _load(self, board: str, group_id: int = None, window: str = "all", when=None):
+        """fill a board with the totals of the settled attempts, then sync
+        it with the more recent ones"""
+        from models.engine.relational_storage import seconds_ago
+        from models.quiz_attempt import QuizAttempt
+
+        session = self.storage.session
+        watermark = session.execute(
+            self._attempts(
+                sa.select(sa.func.coalesce(sa.func.max(QuizAttempt.id), 0))
+                .select_from(QuizAttempt)
+                .where(QuizAttempt.created_at <= seconds_ago(self.lag)),
+                group_id,
+                window,
+                when,
+            )
+        ).scalar()
+        totals = session.execute(
+            self._attempts(
+                sa.select(QuizAttempt.user_id, sa.func.sum(QuizAttempt.score))
+                .where(QuizAttempt.id <= watermark)
+                .group_by(QuizAttempt.user_id),
+                group_id,
+                window,
+                when,
+            )
+        )
+        self._backend.replace(
+            board,
+            {user_id: int(total) for user_id, total in totals},
+            watermark,
+            self._ttl(window),
+        )
+        self._sync(board, group_id, window, when)
+
+    def _sync(self, board: str, group_id: int = None, window: str = "all", when=None):
+        """add the attempts past the watermark of a board that it does not
+        count yet, and move the watermark up to the settled ones"""
+        from models.engine.relational_storage import seconds_ago
+        from models.quiz_attempt import QuizAttempt
+
+        rows = self.storage.session.execute(
+            self._attempts(
+                sa.select(
+                    QuizAttempt.id,
+                    QuizAttempt.user_id,
+                    QuizAttempt.score,
+                    QuizAttempt.created_at <= seconds_ago(self.lag),
+                ).where(QuizAttempt.id > self._backend.watermark(board)),
+                group_id,
+                window,
+                when,
+            )
+        ).all()
+        for attempt_id, user_id, score, _ in rows:
+            self._backend.apply(board, attempt_id, user_id, score, self._ttl(window))
+        settled = [attempt_id for attempt_id, _, _, settled in rows if settled]
+        if settled:
+            self._backend.settle(board, max(settled))
+        now = monotonic()
+        self._synced = {
+            b: t for b, t in self._synced.items() if now - t < self.version_ttl
+        }
+        self._synced[board] = now
+
+    def _ensure(self, group_id: int = None, window: str = "all", when=None) -> str:
+        """name of a board, filling it from the database or syncing it with
+        the attempts of other processes if needed"""
+        board = self.board(group_id, window, when)
+        self._check_version()
+        if self._backend.watermark(board) is None:
+            with self._backend.lock:
+                if self._backend.watermark(board) is None:
+                    self._load(board, group_id, window, when)
+        elif monotonic() - self._synced.get(board, -inf) >= self.version_ttl:
+            with self._backend.lock:
+                if self._backend.watermark(board) is not None:
+                    self._sync(board, group_id, window, when)
+        return board
+
+    def record(
+        self,
+        attempt_id: int,
+        user_id: int,
+        score: int,
+        group_id: int = None,
+        when=None,
+    ):
+        """add a graded attempt to the global and group boards that do not
+        count it yet; call it once the attempt is committed"""
+        with self._backend.lock:
+            for scope in (None, group_id) if group_id is not None else (None,):
+                for window in WINDOWS:
+                    # boards not loaded yet will read the attempt from the DB
+                    self._backend.apply(
+                        self.board(scope, window, when),
+                        attempt_id,
+                        user_id,
+                        score,
+                        self._ttl(window),
+                    )
+
+    def top(
+        self, n: int, offset: int = 0, group_id: int = None, window: str = "all"
+    ) -> List[Tuple[int, int]]:
+        """the (user_id, score) pairs of the n best users after `offset`"""
+        return self._backend.range(self._ensure(group_id, window), offset, n)
+
+    def between(
+        self,
+        min_score: int = None,
+        max_score: int = None,
+        n: int = None,
+        offset: int = 0,
+        group_id: int = None,
+        window: str = "all",
+    ) -> List[Tuple[int, int]]:
+        """the (user_id, score) pairs scoring within the bounds, best first"""
+        board = self._ensure(group_id, window)
+        if n is None:
+            n = self._backend.count(board, min_score, max_score)
+        return self._backend.range(board, offset, n, min_score, max_score)
+
+    def count(
+        self,
+        min_score: int = None,
+        max_score: int = None,
+        group_id: int = None,
+        window: str = "all",
+    ) -> int:
+        """number of users scoring within the bounds"""
+        return self._backend.count(self._ensure(group_id, window), min_score, max_score)
+
+    def rank(self, user_id: int, group_id: int = None, window: str = "all") -> int:
+        """the 1-based rank of a user, or None if they have no score"""
+        rank = self._backend.rank(self._ensure(group_id, window), user_id)
+        return None if rank is None else rank + 1
+
+    def score(self, user_id: int, group_id: int = None, window: str = "all") -> int:
+        """the total score of a user, or None"""
+        return self._backend.score(self._ensure(group_id, window), user_id)
+
+    def scores(
+        self, user_ids: Iterable[int], group_id: int = None, window: str = "all"
+    ) -> List[int]:
+        """the total scores of many users in input order, 0 when missing"""
+        board = self._ensure(group_id, window)
+        return [self._backend.score(board, u) or 0 for u in user_ids]
+
+    def paginate(
+        self,
+        item_name: str,
+        page: int = None,
+        page_size: int = None,
+        apply: Callable[[List[Tuple[int, int]]], list] = None,
+        min_score: int = None,
+        max_score: int = None,
+        group_id: int = None,
+        window: str = "all",
+    ) -> dict:
+        """a page of a board in the format of `paginate`; `apply` turns the
+        (user_id, score) pairs of the page into its items"""
+        if page_size is None:
+            page_size = getenv("PAGE_SIZE", 50)
+        page_size = int(page_size)
+        if page_size < 1:
+            raise ValueError("page_size")
+        page = 1 if page is None else int(page)
+        if page < 1:
+            raise ValueError("page")
+
+        total_items = self.count(min_score, max_score, group_id, window)
+        total_pages = (total_items + page_size - 1) // page_size
+        entries = self.between(
+            min_score, max_score, page_size, (page - 1) * page_size, group_id, window
+        )
+        return {
+            item_name: apply(entries) if apply else entries,
+            "page": page,
+            "next": page + 1 if page < total_pages else page,
+            "prev": page - 1 if page > 1 else page,
+            "page_size": page_size,
+            f"total_{item_name}": total_items,
+            "total_pages": total_pages,
+        }
+
+    def clear(self):
+        """drop every board of the backend; they are filled again on their
+        next read. Other processes only drop theirs after a `touch`."""
+        with self._backend.lock:
+            self._backend.clear()
+            self._synced.clear()
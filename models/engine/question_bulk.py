@@ -0,0 +1,273 @@
+#!/usr/bin/python3
+"""Bulk question authoring Module
+
+Questions and their answer options are written with set-based statements
+instead of one ORM object per row. The rows bypass the session's unit of
+work, so callers bump the quiz version themselves once they are done.
+"""
+from os import getenv
+from typing import Iterable, List, Tuple
+import sqlalchemy as sa
+
+QUESTION_TYPES = ("TFQ", "SCQ", "MCQ")
+QUESTION_FIELDS = ("statement", "points", "type", "options", "correct_answer")
+# an option order must fit the uint64 masks the answer keys are graded with
+MAX_OPTIONS = 64
+
+
+def question_error(question: dict) -> str:
+    """the name of the first invalid field of a submitted question, or None"""
+    kind, options = question["type"], question["options"]
+    correct = question["correct_answer"]
+    if kind not in QUESTION_TYPES:
+        return "type"
+    if len(options) > MAX_OPTIONS:
+        return "options"
+    if (
+        (kind in ("TFQ", "SCQ") and len(correct) != 1)
+        or (kind == "MCQ" and len(correct) >= len(options))
+        or (kind == "TFQ" and correct[0] > 1)
+        or any(a < 0 or a >= len(options) for a in correct)
+    ):
+        return "answer option"
+    return None
+
+
+def answer_rows(question_id: int, question: dict) -> List[dict]:
+    """the answer rows of a submitted question"""
+    correct = set(question["correct_answer"])
+    return [
+        {"text": text, "order": i, "correct": i in correct, "question_id": question_id}
+        for i, text in enumerate(question["options"])
+    ]
+
+
+def next_order(session, quiz_id: int) -> int:
+    """the order following the last question of a quiz"""
+    from models.question import Question
+
+    last = session.execute(
+        sa.select(sa.func.max(Question.order)).where(Question.quiz_id == quiz_id)
+    ).scalar()
+    return 0 if last is None else last + 1
+
+
+def lock_quiz_content(session, quiz_id: int, user_id: int):
+    """lock a quiz of a user for writing and load its content, or return
+    None when the user has no such quiz"""
+    from models.engine.quiz_content import build_quiz_content, quiz_content_query
+    from models.quiz import Quiz
+
+    owned = session.execute(
+        sa.select(Quiz.id)
+        .where(Quiz.id == quiz_id, Quiz.user_id == user_id)
+        .with_for_update()
+    ).scalar()
+    if owned is None:
+        return None
+    return build_quiz_content(session.execute(quiz_content_query(quiz_id)))
+
+
+def _insert_question_chunk(session, rows: List[dict]) -> List[int]:
+    """insert question rows with unique orders, returning their ids in
+    input order"""
+    from models.question import Question
+
+    orders = [row["order"] for row in rows]
+    if session.get_bind().dialect.insert_executemany_returning:
+        ids = dict(
+            session.execute(
+                sa.insert(Question).returning(Question.order, Question.id), rows
+            ).all()
+        )
+    else:
+        # without RETURNING the chunk is found again by its orders, which
+        # the caller keeps unique by holding a lock on the quiz row
+        session.execute(sa.insert(Question), rows)
+        ids = dict(
+            session.execute(
+                sa.select(Question.order, Question.id).where(
+                    Question.quiz_id == rows[0]["quiz_id"],
+                    Question.order.between(min(orders), max(orders)),
+                )
+            ).all()
+        )
+    return [ids[order] for order in orders]
+
+
+def insert_questions(
+    session,
+    quiz_id: int,
+    questions: Iterable[dict],
+    start: int = 0,
+    chunk_size: int = None,
+) -> List[int]:
+    """insert validated questions and their options after order `start`,
+    `chunk_size` questions per statement, returning their ids in order"""
+    from models.answer import Answer
+
+    if chunk_size is None:
+        chunk_size = int(getenv("QQ_DB_INSERT_CHUNK_SIZE", 1000))
+    questions = list(questions)
+    question_ids = []
+    for i in range(0, len(questions), chunk_size):
+        chunk = questions[i : i + chunk_size]
+        ids = _insert_question_chunk(
+            session,
+            [
+                {
+                    "statement": q["statement"],
+                    "points": q["points"],
+                    "type": q["type"],
+                    "order": start + i + n,
+                    "quiz_id": quiz_id,
+                }
+                for n, q in enumerate(chunk)
+            ],
+        )
+        answers = [row for id, q in zip(ids, chunk) for row in answer_rows(id, q)]
+        for j in range(0, len(answers), chunk_size):
+            session.execute(sa.insert(Answer), answers[j : j + chunk_size])
+        question_ids.extend(ids)
+    return question_ids
+
+
+def merge_questions(content, submitted: Iterable[dict]) -> List[dict]:
+    """complete the submitted questions of a quiz with the stored fields they
+    leave out, raising ValueError with the name of the first invalid field;
+    every `question_id` has to belong to the quiz"""
+    stored = {q.id: q for q in content.questions}
+    merged = []
+    seen = set()
+    for question in submitted:
+        id = question.get("question_id")
+        if id is None:
+            base = {}
+        elif id in seen:
+            raise ValueError("question")
+        else:
+            seen.add(id)
+            base = stored[id].to_dict(with_answer=True)
+        base.update((k, v) for k, v in question.items() if v is not None)
+        if any(field not in base for field in QUESTION_FIELDS):
+            raise ValueError("question")
+        error = question_error(base)
+        if error is not None:
+            raise ValueError(error)
+        merged.append(base)
+    return merged
+
+
+def delete_questions(session, question_ids: Iterable[int]) -> int:
+    """delete questions with their options and user answers, one statement
+    per table, returning the number of questions deleted"""
+    from models.answer import Answer
+    from models.question import Question
+    from models.user_answer import UserAnswer
+
+    question_ids = list(question_ids)
+    if not question_ids:
+        return 0
+    for model, column in (
+        (UserAnswer, UserAnswer.question_id),
+        (Answer, Answer.question_id),
+        (Question, Question.id),
+    ):
+        result = session.execute(
+            sa.delete(model)
+            .where(column.in_(question_ids))
+            .execution_options(synchronize_session=False)
+        )
+    return result.rowcount
+
+
+def replace_questions(
+    session, content, questions: List[dict], chunk_size: int = None
+) -> Tuple[List[int], bool]:
+    """make the stored questions of a quiz match a merged question list,
+    writing only the rows that differ; return the question ids in their
+    new order and whether the answer key of the quiz changed"""
+    from models.answer import Answer
+    from models.question import Question
+
+    if chunk_size is None:
+        chunk_size = int(getenv("QQ_DB_INSERT_CHUNK_SIZE", 1000))
+    stored = {q.id: q for q in content.questions}
+    kept = {q["question_id"] for q in questions if "question_id" in q}
+    removed = [id for id in stored if id not in kept]
+    key_changed = bool(removed)
+
+    question_updates, answer_updates, answer_inserts = [], [], []
+    cut = {}
+    for q in questions:
+        if "question_id" not in q:
+            continue
+        id, old = q["question_id"], stored[q["question_id"]]
+        if (q["statement"], q["points"], q["type"]) != (
+            old.statement,
+            old.points,
+            old.type,
+        ):
+            question_updates.append(
+                {
+                    "id": id,
+                    "statement": q["statement"],
+                    "points": q["points"],
+                    "type": q["type"],
+                }
+            )
+        key_changed |= (
+            q["points"] != old.points
+            or set(q["correct_answer"]) != set(old.correct_answer)
+            or len(q["options"]) != len(old.options)
+        )
+        old_options = {a.order: a for a in old.options}
+        for row in answer_rows(id, q):
+            option = old_options.get(row["order"])
+            if option is None:
+                answer_inserts.append(row)
+            elif (row["text"], row["correct"]) != (option.text, option.correct):
+                answer_updates.append(
+                    {"id": option.id, "text": row["text"], "correct": row["correct"]}
+                )
+        if len(old_options) > len(q["options"]):
+            cut[id] = len(q["options"])
+
+    delete_questions(session, removed)
+    if question_updates:
+        session.execute(sa.update(Question), question_updates)
+    if answer_updates:
+        session.execute(sa.update(Answer), answer_updates)
+    for i in range(0, len(answer_inserts), chunk_size):
+        session.execute(sa.insert(Answer), answer_inserts[i : i + chunk_size])
+    if cut:
+        session.execute(
+            sa.delete(Answer)
+            .where(
+                Answer.question_id.in_(cut),
+                Answer.order >= sa.case(cut, value=Answer.question_id),
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+    # new questions go after every stored one, then all take their places
+    new = [q for q in questions if "question_id" not in q]
+    start = max((q.order for q in content.questions), default=-1) + 1
+    new_ids = insert_questions(session, content.id, new, start, chunk_size)
+    key_changed |= bool(new)
+    orders = {id: q.order for id, q in stored.items()}
+    orders.update((id, start + n) for n, id in enumerate(new_ids))
+    new_ids = iter(new_ids)
+    question_ids = [
+        q["question_id"] if "question_id" in q else next(new_ids) for q in questions
+    ]
+    moved = {id: order for order, id in enumerate(question_ids) if orders[id] != order}
+    key_changed |= bool(moved)
+    if moved:
+        session.execute(
+            sa.update(Question)
+            .where(Question.id.in_(moved))
+            .values(order=sa.case(moved, value=Question.id))
+            .execution_options(synchronize_session=False)
+        )
+    return question_ids, key_changed
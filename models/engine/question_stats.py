@@ -0,0 +1,185 @@
+#!/usr/bin/python3
+"""Question answer statistics Module
+
+How often each option of a question was chosen is aggregated from the
+user answers once, then kept per question together with the quiz version
+it was computed for and the last attempt id it covers. Later reads only
+aggregate the attempts submitted past that watermark and add them up;
+a new quiz version starts the question over.
+
+Attempt ids are not committed in order on MySQL, so the watermark only
+moves up to the last attempt created QQ_QUESTION_STATS_LAG seconds ago,
+which assumes attempts commit within that delay. The more recent
+attempts are aggregated again on every read without being kept.
+"""
+from collections import OrderedDict
+from os import getenv
+from threading import Lock
+from typing import List, NamedTuple, Tuple
+import sqlalchemy as sa
+
+
+class OptionStats(NamedTuple):
+    """how often an answer option of a question was chosen"""
+
+    order: int
+    text: str
+    correct: bool
+    count: int
+
+
+class QuestionStats(NamedTuple):
+    """the answer distribution of a question over the attempts of its quiz,
+    kept in the cache up to the `watermark` attempt id"""
+
+    question_id: int
+    version: int
+    watermark: int
+    attempts: int
+    options: Tuple[OptionStats, ...]
+
+    @property
+    def correct_answers(self) -> int:
+        """the number of times a correct option was chosen"""
+        return sum(o.count for o in self.options if o.correct)
+
+    @property
+    def wrong_answers(self) -> int:
+        """the number of times a wrong option was chosen"""
+        return sum(o.count for o in self.options if not o.correct)
+
+    @property
+    def correct_options(self) -> Tuple[int, ...]:
+        """the orders of the correct options"""
+        return tuple(o.order for o in self.options if o.correct)
+
+    def to_dict(self) -> dict:
+        """the statistics as served to the quiz owner"""
+        return {
+            "question_id": self.question_id,
+            "attempts": self.attempts,
+            "correct_answers": self.correct_answers,
+            "wrong_answers": self.wrong_answers,
+            "options": [o._asdict() for o in self.options],
+        }
+
+
+def option_counts(
+    session, question_id: int, after: int, upto: int = None
+) -> List[OptionStats]:
+    """count the choices of every option of a question in the attempts with
+    an id in (`after`, `upto`], or past `after` without `upto`, in one
+    aggregate"""
+    from models.answer import Answer
+    from models.user_answer import UserAnswer
+
+    where = [UserAnswer.question_id == question_id, UserAnswer.attempt_id > after]
+    if upto is not None:
+        where.append(UserAnswer.attempt_id <= upto)
+    picks = (
+        sa.select(UserAnswer.answer, sa.func.count().label("count"))
+        .where(*where)
+        .group_by(UserAnswer.answer)
+        .subquery()
+    )
+    return [
+        OptionStats(order, text, bool(correct), count)
+        for order, text, correct, count in session.execute(
+            sa.select(
+                Answer.order,
+                Answer.text,
+                Answer.correct,
+                sa.func.coalesce(picks.c.count, 0),
+            )
+            .outerjoin(picks, picks.c.answer == Answer.order)
+            .where(Answer.question_id == question_id)
+            .order_by(Answer.order)
+        )
+    ]
+
+
+class QuestionStatsCache:
+    """answer statistics of the most recently read questions"""
+
+    def __init__(self, max_entries: int = None, lag: float = None):
+        """initialise an empty cache"""
+        if max_entries is None:
+            max_entries = int(getenv("QQ_QUESTION_STATS_CACHE_SIZE", 1024))
+        if lag is None:
+            lag = float(getenv("QQ_QUESTION_STATS_LAG", 30))
+        self.max_entries = max_entries
+        self.lag = lag
+        self._stats = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._stats)
+
+    def get(self, storage, quiz_id: int, question_id: int) -> QuestionStats:
+        """the statistics of a question of a quiz, aggregating only the
+        attempts submitted since they were last read"""
+        from models.engine.relational_storage import seconds_ago
+        from models.quiz import Quiz
+        from models.quiz_attempt import QuizAttempt
+
+        session = storage.session
+        version = session.execute(
+            sa.select(Quiz.content_version).where(Quiz.id == quiz_id)
+        ).scalar()
+        with self._lock:
+            stats = self._stats.get(question_id)
+        if stats is None or stats.version != version:
+            stats = QuestionStats(question_id, version, 0, 0, ())
+
+        # the database clock, in the time zone of the created_at defaults
+        settled = seconds_ago(self.lag)
+        since = (QuizAttempt.quiz_id == quiz_id, QuizAttempt.id > stats.watermark)
+        upto = sa.func.coalesce(
+            sa.select(sa.func.max(QuizAttempt.id))
+            .where(*since, QuizAttempt.created_at <= settled)
+            .scalar_subquery(),
+            stats.watermark,
+        )
+        upto, new, recent = session.execute(
+            sa.select(
+                upto,
+                sa.func.count(sa.case((QuizAttempt.id <= upto, 1))),
+                sa.func.count(sa.case((QuizAttempt.id > upto, 1))),
+            ).where(*since)
+        ).one()
+        # the options are read again every time, so their text and correct
+        # flags are current even when no attempt was submitted since
+        stats = stats._replace(
+            watermark=upto,
+            attempts=stats.attempts + new,
+            options=self._add(
+                stats.options,
+                option_counts(session, question_id, stats.watermark, upto),
+            ),
+        )
+        with self._lock:
+            self._stats[question_id] = stats
+            self._stats.move_to_end(question_id)
+            while len(self._stats) > self.max_entries:
+                self._stats.popitem(last=False)
+        if recent:
+            stats = stats._replace(
+                attempts=stats.attempts + recent,
+                options=self._add(
+                    stats.options, option_counts(session, question_id, upto)
+                ),
+            )
+        return stats
+
+    @staticmethod
+    def _add(options: Tuple[OptionStats, ...], counts: List[OptionStats]) -> tuple:
+        """the fresh option `counts` plus the counts of `options`"""
+        previous = {o.order: o.count for o in options}
+        return tuple(
+            o._replace(count=o.count + previous.get(o.order, 0)) for o in counts
+        )
+
+    def clear(self):
+        """drop every entry"""
+        with self._lock:
+            self._stats.clear()
@@ -0,0 +1,121 @@
+#!/usr/bin/python3
+"""Quiz content loader Module
+
+The questions and answer options of a quiz are read in one joined query
+and returned as immutable tuples, ready to be serialized or graded.
+"""
+from datetime import datetime
+from typing import Iterable, NamedTuple, Tuple
+import sqlalchemy as sa
+
+
+class AnswerContent(NamedTuple):
+    """an answer option of a question"""
+
+    text: str
+    order: int
+    correct: bool
+    id: int = None
+
+
+class QuestionContent(NamedTuple):
+    """a question of a quiz with its answer options, by order"""
+
+    id: int
+    statement: str
+    points: int
+    type: str
+    order: int
+    options: Tuple[AnswerContent, ...]
+
+    @property
+    def correct_answer(self) -> Tuple[int, ...]:
+        """the orders of the correct options"""
+        return tuple(a.order for a in self.options if a.correct)
+
+    def to_dict(self, with_answer: bool = False) -> dict:
+        """the question as served to the API clients, with its correct
+        options for the quiz owner"""
+        result = {
+            "statement": self.statement,
+            "points": self.points,
+            "type": self.type,
+            "options": [a.text for a in self.options],
+        }
+        if with_answer:
+            result["correct_answer"] = list(self.correct_answer)
+        return result
+
+
+class QuizContent(NamedTuple):
+    """a quiz with its questions, by order"""
+
+    id: int
+    user_id: int
+    group_id: int
+    end: datetime
+    version: int
+    questions: Tuple[QuestionContent, ...]
+
+    def to_dict(self, with_answer: bool = False) -> dict:
+        """the questions of the quiz as served to the API clients"""
+        return {"questions": [q.to_dict(with_answer) for q in self.questions]}
+
+
+def quiz_content_query(quiz_id: int) -> sa.Select:
+    """select the rows of a quiz's content tree, one per answer option"""
+    from models.answer import Answer
+    from models.question import Question
+    from models.quiz import Quiz
+
+    return (
+        sa.select(
+            Quiz.id,
+            Quiz.user_id,
+            Quiz.group_id,
+            Quiz.end,
+            Quiz.content_version,
+            Question.id,
+            Question.statement,
+            Question.points,
+            Question.type,
+            Question.order,
+            Answer.id,
+            Answer.text,
+            Answer.order,
+            Answer.correct,
+        )
+        .select_from(Quiz)
+        .outerjoin(Question, Question.quiz_id == Quiz.id)
+        .outerjoin(Answer, Answer.question_id == Question.id)
+        .where(Quiz.id == quiz_id)
+        .order_by(Question.order, Question.id, Answer.order, Answer.id)
+    )
+
+
+def build_quiz_content(rows: Iterable[tuple]) -> QuizContent:
+    """assemble the rows of `quiz_content_query`, or None without rows"""
+    quiz = None
+    questions = []
+    question, options = None, []
+    for row in rows:
+        if quiz is None:
+            quiz = row[:5]
+        if row[5] is None:
+            continue
+        if question is None or question[0] != row[5]:
+            if question is not None:
+                questions.append(QuestionContent(*question, tuple(options)))
+            question, options = row[5:10], []
+        if row[10] is not None:
+            options.append(AnswerContent(row[11], row[12], bool(row[13]), row[10]))
+    if quiz is None:
+        return None
+    if question is not None:
+        questions.append(QuestionContent(*question, tuple(options)))
+    return QuizContent(*quiz, tuple(questions))
+
+
+def load_quiz_content(storage, quiz_id: int) -> QuizContent:
+    """the content of a quiz read through a storage, or None"""
+    return build_quiz_content(storage.session.execute(quiz_content_query(quiz_id)))
@@ -0,0 +1,153 @@
+#!/usr/bin/python3
+"""Regrade Module
+
+Rescores the stored attempts of a quiz against its current answer key.
+The user answers are streamed in chunks of attempts, turned into one
+option bitmask per (attempt, question) with NumPy and scored for the
+whole chunk at once; the changed scores are written back with a single
+UPDATE per chunk.
+"""
+from os import getenv
+from typing import NamedTuple, Set
+import numpy as np
+import sqlalchemy as sa
+from models.engine.answer_keys import AnswerKey, compile_answer_key
+from models.engine.quiz_content import build_quiz_content, quiz_content_query
+
+
+class RegradeReport(NamedTuple):
+    """the outcome of a regrade"""
+
+    quiz_id: int
+    attempts: int
+    changed: int
+    user_ids: Set[int]
+
+    def to_dict(self) -> dict:
+        """the report as printed or served"""
+        return {
+            "quiz_id": self.quiz_id,
+            "attempts": self.attempts,
+            "changed": self.changed,
+        }
+
+
+def score_attempts(
+    key: AnswerKey, attempt_ids: np.ndarray, answers: np.ndarray
+) -> tuple:
+    """score attempts from their (attempt_id, question_id, answer) rows;
+    return the scores and full score flags, in the order of the sorted
+    `attempt_ids`"""
+    question_ids = np.asarray(key.question_ids, dtype=np.int64)
+    key_masks = np.asarray(key.masks, dtype=np.uint64)
+    points = np.asarray(key.points, dtype=np.int64)
+    n_attempts, n_questions = len(attempt_ids), len(question_ids)
+
+    masks = np.zeros((n_attempts, n_questions), dtype=np.uint64)
+    invalid = np.zeros((n_attempts, n_questions), dtype=bool)
+    if len(answers) and n_questions:
+        order = np.argsort(question_ids)
+        col = np.searchsorted(question_ids, answers[:, 1], sorter=order)
+        col = np.minimum(col, n_questions - 1)
+        known = question_ids[order[col]] == answers[:, 1]
+        rows = np.searchsorted(attempt_ids, answers[known, 0])
+        cols = order[col[known]]
+        options = answers[known, 2]
+        # orders a uint64 mask cannot hold never match the key
+        fits = (options >= 0) & (options < 64)
+        np.bitwise_or.at(
+            masks,
+            (rows[fits], cols[fits]),
+            np.left_shift(np.uint64(1), options[fits].astype(np.uint64)),
+        )
+        invalid[rows[~fits], cols[~fits]] = True
+
+    correct = (masks == key_masks) & ~invalid
+    return correct @ points, correct.all(axis=1)
+
+
+def regrade_quiz(session, quiz_id: int, chunk_size: int = None) -> RegradeReport:
+    """rescore every attempt of a quiz against its current answer key,
+    returning None for an unknown quiz
+
+    The quiz_stats and user_stats rollups of the quiz are rebuilt in the
+    same transaction, its score distribution even when no score moved;
+    leaderboards have to be refreshed by the caller.
+    """
+    from models.quiz_attempt import QuizAttempt
+    from models.quiz_stats import QuizStats
+    from models.user_answer import UserAnswer
+    from models.user_stats import UserStats
+
+    if chunk_size is None:
+        chunk_size = int(getenv("QQ_REGRADE_CHUNK_SIZE", 2000))
+    content = build_quiz_content(session.execute(quiz_content_query(quiz_id)))
+    if content is None:
+        return None
+    key = compile_answer_key(content)
+    if isinstance(key.masks, tuple):
+        # some correct option order does not fit a uint64 mask
+        raise ValueError("answer_key")
+
+    table = QuizAttempt.__table__
+    attempts = changed = 0
+    user_ids = set()
+    last_id = 0
+    while True:
+        chunk = session.execute(
+            sa.select(table.c.id, table.c.user_id, table.c.score, table.c.full_score)
+            .where(table.c.quiz_id == quiz_id, table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(chunk_size)
+        ).all()
+        if not chunk:
+            break
+        ids = np.fromiter((r[0] for r in chunk), dtype=np.int64, count=len(chunk))
+        last_id = int(ids[-1])
+        answers = np.array(
+            session.execute(
+                sa.select(
+                    UserAnswer.attempt_id, UserAnswer.question_id, UserAnswer.answer
+                )
+                .join(table, table.c.id == UserAnswer.attempt_id)
+                .where(
+                    table.c.quiz_id == quiz_id,
+                    UserAnswer.attempt_id.between(int(ids[0]), last_id),
+                )
+            ).all(),
+            dtype=np.int64,
+        ).reshape(-1, 3)
+
+        scores, full_scores = score_attempts(key, ids, answers)
+        old_scores = np.fromiter((r[2] for r in chunk), np.int64, len(chunk))
+        old_full = np.fromiter((bool(r[3]) for r in chunk), bool, len(chunk))
+        moved = np.flatnonzero((scores != old_scores) | (full_scores != old_full))
+        attempts += len(chunk)
+        if not len(moved):
+            continue
+
+        changed += len(moved)
+        user_ids.update(chunk[i][1] for i in moved)
+        moved_ids = [int(ids[i]) for i in moved]
+        session.execute(
+            table.update()
+            .where(table.c.id.in_(moved_ids))
+            .values(
+                score=sa.case(
+                    {int(ids[i]): int(scores[i]) for i in moved}, value=table.c.id
+                ),
+                full_score=sa.case(
+                    {int(ids[i]): bool(full_scores[i]) for i in moved},
+                    value=table.c.id,
+                ),
+                updated_at=sa.func.now(),
+            )
+        )
+
+    if changed:
+        QuizStats.rebuild(session, quiz_id)
+        UserStats.reconcile(session, user_ids)
+    elif attempts:
+        # the points of the quiz may have changed all the same
+        QuizStats.rebuild_distributions(session, quiz_id)
+    return RegradeReport(quiz_id, attempts, changed, user_ids)
@@ -2,33 +2,371 @@
 """RelationalStorage class Module
 """
 from os import getenv
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from hashlib import sha256
+import json
+import logging
 from collections.abc import Callable
-from typing import Any
+from contextlib import contextmanager
+from random import choice
+from threading import Event, Lock, Thread
+from time import monotonic
+from typing import Any, Iterable, List
 import sqlalchemy as sa
 from sqlalchemy import create_engine
-from sqlalchemy.orm import scoped_session, sessionmaker, Query
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import scoped_session, sessionmaker, Query, Session
+from sqlalchemy.orm.util import identity_key
+from sqlalchemy.pool import StaticPool
+from models.engine.count_cache import count_cache, count_rows
+from models.engine.instrumentation import instrument
+from models.engine.search import drop_search, install_search, search_ddl
+
+log = logging.getLogger("quizquickie.storage")
+
+
+def database_url() -> str:
+    """build the database url from the QQ_DB_* environment variables"""
+    if getenv("QQ_DB_ENGINE", "SQLITE") == "MYSQL":
+        DB_NAME = getenv("QQ_DB_NAME", "quizquickie_db")
+        DB_USR = getenv("QQ_DB_USR", "quizquickie_usr")
+        DB_PWD = getenv("QQ_DB_PWD", "quizquickie_pwd")
+        DB_HOST = getenv("QQ_DB_HOST", "localhost")
+        return f"mysql+mysqldb://{DB_USR}:{DB_PWD}@{DB_HOST}/{DB_NAME}"
+    DB = getenv("QQ_DB", "quizquickie_db")
+    return f"sqlite:///{DB}.db"
+
+
+def engine_options(url: str) -> dict:
+    """connection pool options for an engine, tunable through QQ_DB_POOL_*"""
+    url = sa.engine.make_url(url)
+    options = {"pool_pre_ping": getenv("QQ_DB_POOL_PRE_PING", "1") == "1"}
+    if url.get_backend_name() == "sqlite":
+        # sessions are bound per thread but pooled connections are handed
+        # from one thread to the next, so sqlite3's own check must be off
+        options["connect_args"] = {"check_same_thread": False}
+        if url.database in (None, "", ":memory:"):
+            # every connection to :memory: is a new empty database
+            options["poolclass"] = StaticPool
+            return options
+    options.update(
+        pool_size=int(getenv("QQ_DB_POOL_SIZE", 5)),
+        max_overflow=int(getenv("QQ_DB_MAX_OVERFLOW", 10)),
+        pool_timeout=int(getenv("QQ_DB_POOL_TIMEOUT", 30)),
+        pool_recycle=int(getenv("QQ_DB_POOL_RECYCLE", 3600)),
+    )
+    return options
+
+
+SQLITE_PROFILES = {
+    "default": {},
+    "performance": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 268435456,
+        "cache_size": -65536,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+}
+
+
+def sqlite_pragmas(profile: str = None) -> dict:
+    """pragmas of a SQLite profile selected by QQ_SQLITE_PROFILE, each one
+    overridable through QQ_SQLITE_<PRAGMA>"""
+    if profile is None:
+        profile = getenv("QQ_SQLITE_PROFILE", "performance")
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(f"unknown SQLite profile {profile!r}")
+    pragmas = dict(SQLITE_PROFILES[profile])
+    for pragma in SQLITE_PROFILES["performance"]:
+        value = getenv(f"QQ_SQLITE_{pragma.upper()}")
+        if value:
+            pragmas[pragma] = value
+    return pragmas
+
+
+def apply_sqlite_pragmas(engine: sa.Engine, pragmas: dict):
+    """run the pragmas on every new connection of a SQLite engine"""
+    if not pragmas:
+        return
+
+    @sa.event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in pragmas.items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
+        cursor.close()
+
+
+def start_wal_checkpoints(engine: sa.Engine, interval: float) -> Event:
+    """checkpoint the WAL of a SQLite engine every `interval` seconds from a
+    daemon thread, so it does not grow while readers keep it busy; set the
+    returned event to stop"""
+    stop = Event()
+
+    def checkpoint():
+        while not stop.wait(interval):
+            try:
+                with engine.connect() as conn:
+                    conn.exec_driver_sql("PRAGMA wal_checkpoint(PASSIVE)")
+            except Exception:
+                log.exception("WAL checkpoint failed")
+
+    Thread(target=checkpoint, name="wal-checkpoint", daemon=True).start()
+    return stop
+
+
+class seconds_ago(sa.sql.functions.FunctionElement):
+    """the database clock less some seconds, in the time zone its `now()`
+    defaults store timestamps in"""
+
+    type = sa.DateTime()
+    inherit_cache = True
+
+    def __init__(self, seconds: float):
+        super().__init__(sa.literal(float(seconds)))
+
+
+@compiles(seconds_ago)
+def _seconds_ago(element, compiler, **kw):
+    seconds = compiler.process(element.clauses, **kw)
+    return f"CURRENT_TIMESTAMP - {seconds} * INTERVAL '1 second'"
+
+
+@compiles(seconds_ago, "sqlite")
+def _seconds_ago_sqlite(element, compiler, **kw):
+    seconds = compiler.process(element.clauses, **kw)
+    return f"datetime('now', -({seconds}) || ' seconds')"
+
+
+@compiles(seconds_ago, "mysql")
+@compiles(seconds_ago, "mariadb")
+def _seconds_ago_mysql(element, compiler, **kw):
+    seconds = compiler.process(element.clauses, **kw)
+    return f"NOW() - INTERVAL {seconds} SECOND"
+
+
+schema_meta = sa.Table(
+    "schema_meta",
+    sa.MetaData(),
+    sa.Column("key", sa.String(50), primary_key=True),
+    sa.Column("value", sa.String(64), nullable=False),
+)
+
+
+def schema_fingerprint(metadata: sa.MetaData, ddl: List[str] = ()) -> str:
+    """hash the tables, columns, foreign keys and indexes of a schema, and
+    the extra `ddl` statements run on top of it"""
+    parts = [f"ddl {stmt}" for stmt in ddl]
+    for table in sorted(metadata.tables.values(), key=lambda t: t.name):
+        parts.append(f"table {table.name}")
+        for column in table.columns:
+            parts.append(
+                f"column {column.name} {column.type!r} nullable={column.nullable}"
+                f" pk={column.primary_key} unique={column.unique}"
+                f" fk={sorted(fk.target_fullname for fk in column.foreign_keys)}"
+            )
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            parts.append(
+                f"index {index.name} {[c.name for c in index.columns]}"
+                f" unique={index.unique}"
+            )
+    return sha256("\n".join(parts).encode()).hexdigest()
+
+
+def replica_urls() -> List[str]:
+    """read replica database urls listed in QQ_DB_REPLICAS"""
+    return [
+        url.strip() for url in getenv("QQ_DB_REPLICAS", "").split(",") if url.strip()
+    ]
+
+
+# info keys of the tables written since the last commit, by a connection
+# on its own or by a session, and of the session set of a connection
+_WRITTEN_TABLES = "written_tables"
+_SESSION_WRITES = "session_written_tables"
+
 
+class RoutingSession(Session):
+    """session sending the reads of a read-only unit of work to a replica
 
-class RelationalStorage:
+    The session picks one replica on its first read and keeps it until it
+    is closed, so replicas lagging by different amounts never interleave
+    within a request. It sticks to the primary once it has written
+    anything, so a request always reads its own writes.
+    """
+
+    def __init__(self, replicas: List[sa.Engine] = (), **kwargs):
+        """initialise a session over the primary and its replicas"""
+        super().__init__(**kwargs)
+        self.replicas = list(replicas)
+        self.replica = None
+        self.read_only = False
+        self.wrote = False
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        """pick the engine a statement runs on"""
+        if self._flushing or getattr(clause, "is_dml", False):
+            self.wrote = True
+        if self.replicas and self.read_only and not self.wrote:
+            if self.replica is None:
+                self.replica = choice(self.replicas)
+            return self.replica
+        return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+
+    def close(self):
+        """close the session, letting its next use pick a replica again"""
+        super().close()
+        self.replica = None
+
+
+class WriteTracker:
+    """reports the tables written by every commit to write listeners
+
+    Written tables are collected per connection, and per session for the
+    connections of a session, then reported once committed, so a listener
+    never runs while a reader could still see the rows from before.
+    """
+
+    def _track_writes(self, engine: sa.Engine, session_factory):
+        """listen for the writes of an engine and the sessions of a factory"""
+        self._write_listeners = [count_cache.invalidate]
+        sa.event.listen(engine, "after_cursor_execute", self._after_execute)
+        sa.event.listen(engine, "checkin", self._checkin)
+        sa.event.listen(session_factory, "after_begin", self._link_writes)
+        sa.event.listen(session_factory, "after_commit", self._report_writes)
+        sa.event.listen(session_factory, "after_soft_rollback", self._forget_writes)
+
+    def _after_execute(self, conn, cursor, statement, params, context, executemany):
+        """note the table a DML statement touched, None when unknown"""
+        if context is None:
+            return
+        if context.compiled is not None:
+            if not (context.isinsert or context.isupdate or context.isdelete):
+                return
+            table = context.compiled.statement.table.name
+        elif statement.lstrip()[:6].upper() in ("INSERT", "UPDATE", "DELETE"):
+            table = None
+        else:
+            return
+        if _SESSION_WRITES in conn.info:
+            conn.info[_SESSION_WRITES].add(table)
+        else:
+            conn.info.setdefault(_WRITTEN_TABLES, set()).add(table)
+
+    def _link_writes(self, session: Session, transaction, connection):
+        """collect the writes on a connection of a session in the session"""
+        connection.info[_SESSION_WRITES] = session.info.setdefault(
+            _WRITTEN_TABLES, set()
+        )
+
+    def _report_writes(self, session: Session):
+        """tell the write listeners about the tables a session committed"""
+        written = session.info.pop(_WRITTEN_TABLES, None)
+        if written:
+            self._notify_writes(written)
+
+    def _forget_writes(self, session: Session, previous_transaction):
+        """drop the writes of a session rolled back"""
+        if previous_transaction.parent is None:
+            session.info.pop(_WRITTEN_TABLES, None)
+
+    def _checkin(self, dbapi_connection, connection_record):
+        """report the writes of a connection used outside a session once it
+        is back in the pool, past its commit"""
+        connection_record.info.pop(_SESSION_WRITES, None)
+        written = connection_record.info.pop(_WRITTEN_TABLES, None)
+        if written:
+            self._notify_writes(written)
+
+    def _notify_writes(self, written: set):
+        tables = None if None in written else sorted(written)
+        for listener in self._write_listeners:
+            listener(tables)
+
+    def add_write_listener(self, listener: Callable[[List[str]], None]):
+        """call `listener` with the table names written by every commit, or
+        None when they are unknown"""
+        self._write_listeners.append(listener)
+
+
+class RelationalStorage(WriteTracker):
     """interacts with the SQL database"""
 
     _engine = None
     _session = None
 
-    def __init__(self):
-        """initialise the storage engine instance"""
-        if getenv("QQ_DB_ENGINE", "SQLITE") == "MYSQL":
-            DB_NAME = getenv("QQ_DB_NAME", "quizquickie_db")
-            DB_USR = getenv("QQ_DB_USR", "quizquickie_usr")
-            DB_PWD = getenv("QQ_DB_PWD", "quizquickie_pwd")
-            DB_HOST = getenv("QQ_DB_HOST", "localhost")
-
-            self._engine = create_engine(
-                f"mysql+mysqldb://{DB_USR}:{DB_PWD}@{DB_HOST}/{DB_NAME}"
-            )
-        else:
-            DB = getenv("QQ_DB", "quizquickie_db")
-            self._engine = create_engine(f"sqlite:///{DB}.db")
+    def __init__(
+        self, url: str = None, replicas: List[str] = None, sqlite_profile: str = None
+    ):
+        """initialise the storage engine instance, with optional read
+        replicas of the database and the SQLite profile to open it with"""
+        if url is None:
+            url = database_url()
+        if replicas is None:
+            replicas = replica_urls()
+        self._engine = self._create_engine(url, sqlite_profile)
+        self.replicas = [self._create_engine(u, sqlite_profile) for u in replicas]
+        self._checkpoints = None
+        interval = float(getenv("QQ_SQLITE_CHECKPOINT_INTERVAL", 60))
+        if (
+            self._engine.dialect.name == "sqlite"
+            and self._engine.url.database not in (None, "", ":memory:")
+            and str(sqlite_pragmas(sqlite_profile).get("journal_mode")).upper() == "WAL"
+            and interval > 0
+        ):
+            self._checkpoints = start_wal_checkpoints(self._engine, interval)
+        self.read_your_writes = float(getenv("QQ_DB_READ_YOUR_WRITES", 5))
+        self._recent_writes = {}
+        self._recent_writes_lock = Lock()
+        session_factory = sessionmaker(
+            bind=self._engine,
+            class_=RoutingSession,
+            replicas=self.replicas,
+            expire_on_commit=False,
+        )
+        # every thread (and so every request) gets its own session
+        self._session = scoped_session(session_factory)
+        self._track_writes(self._engine, session_factory)
+
+    @staticmethod
+    def _create_engine(url: str, sqlite_profile: str = None) -> sa.Engine:
+        """create an engine, applying the SQLite profile to SQLite ones"""
+        engine = create_engine(url, **engine_options(url))
+        if engine.dialect.name == "sqlite":
+            apply_sqlite_pragmas(engine, sqlite_pragmas(sqlite_profile))
+        instrument(engine)
+        return engine
+
+    @property
+    def session(self) -> Session:
+        """the database session of the current thread"""
+        return self._session()
+
+    def read_only(self, enabled: bool = True):
+        """let the current thread's session read from a replica until it
+        writes or is closed"""
+        self._session().read_only = enabled
+
+    def has_written(self) -> bool:
+        """whether the current thread's session has written anything"""
+        return self._session().wrote
+
+    def mark_write(self, key: str):
+        """open the read-your-writes window of a client after a write"""
+        now = monotonic()
+        with self._recent_writes_lock:
+            if len(self._recent_writes) > 10000:
+                self._recent_writes = {
+                    k: t for k, t in self._recent_writes.items() if t > now
+                }
+            self._recent_writes[key] = now + self.read_your_writes
+
+    def wrote_recently(self, key: str) -> bool:
+        """whether a client is still inside its read-your-writes window"""
+        return self._recent_writes.get(key, 0) > monotonic()
 
     def new(self, obj):
         """add the object to the current database session"""
@@ -48,38 +386,172 @@ class RelationalStorage:
         return obj
 
     def save(self):
-        """commit all changes of the current database session"""
-        self._session.commit()
+        """commit all changes of the current database session, or only
+        flush them when called inside an open unit of work"""
+        if self._session().info.get("unit_of_work"):
+            self._session.flush()
+        else:
+            self._session.commit()
 
     def cleanup(self):
         """rollback the changes that happened in the transaction"""
         self._session.rollback()
 
-    def reload(self):
-        """reloads data from the database"""
+    def reload(self, reset: bool = False) -> bool:
+        """bootstrap the database schema without touching existing data,
+        see `bootstrap`; return whether any DDL was run"""
+        self._session.remove()
+        with self._engine.begin() as conn:
+            return self.bootstrap(conn, reset)
+
+    @staticmethod
+    def bootstrap(conn: sa.Connection, reset: bool = False) -> bool:
+        """bootstrap the database schema on a connection
+
+        DDL is skipped entirely when the fingerprint stored in `schema_meta`
+        matches the models, otherwise only the missing tables, columns and
+        indexes (and full-text search structures) are created, and the
+        `ix_` indexes the models no longer declare are dropped. Every table
+        is dropped first only on `reset`. Return whether any DDL was run.
+        """
         from models.base import Base
 
-        Base.metadata.drop_all(self._engine)
-        Base.metadata.create_all(self._engine)
-        session_factory = sessionmaker(bind=self._engine, expire_on_commit=False)
-        Session = scoped_session(session_factory)
-        self._session = Session()
+        if reset:
+            drop_search(conn)
+            Base.metadata.drop_all(conn)
+            schema_meta.drop(conn, checkfirst=True)
+
+        fingerprint = schema_fingerprint(Base.metadata, search_ddl(conn.dialect.name))
+        schema_meta.create(conn, checkfirst=True)
+        stored = conn.execute(
+            sa.select(schema_meta.c.value).where(schema_meta.c.key == "fingerprint")
+        ).scalar()
+        if stored == fingerprint:
+            return False
+
+        inspector = sa.inspect(conn)
+        existing = set(inspector.get_table_names())
+        Base.metadata.create_all(conn)
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing:
+                continue
+            columns = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns:
+                    spec = sa.schema.CreateColumn(column).compile(dialect=conn.dialect)
+                    name = conn.dialect.identifier_preparer.format_table(table)
+                    conn.execute(sa.text(f"ALTER TABLE {name} ADD COLUMN {spec}"))
+            indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(conn)
+            # dropped once their replacements exist, which foreign keys
+            # may need on MySQL
+            preparer = conn.dialect.identifier_preparer
+            on = (
+                ""
+                if conn.dialect.name == "sqlite"
+                else " ON " + preparer.format_table(table)
+            )
+            for name in indexes - {i.name for i in table.indexes}:
+                if name and name.startswith("ix_"):
+                    conn.execute(sa.text(f"DROP INDEX {preparer.quote(name)}{on}"))
+        install_search(conn)
+
+        conn.execute(schema_meta.delete().where(schema_meta.c.key == "fingerprint"))
+        conn.execute(schema_meta.insert().values(key="fingerprint", value=fingerprint))
+        return True
 
     def close(self):
-        """remove the session from the running storage engine"""
-        self._session.close()
+        """close and discard the session of the current thread"""
+        self._session.remove()
+
+    def dispose(self):
+        """stop the WAL checkpoints and close every pooled connection"""
+        if self._checkpoints is not None:
+            self._checkpoints.set()
+        self._session.remove()
+        for engine in [self._engine] + self.replicas:
+            engine.dispose()
+
+    @contextmanager
+    def transaction(self):
+        """open an explicit unit of work on the current thread's session
+
+        The changes are committed once when the outermost block exits and
+        rolled back if it raises; `save()` calls made inside only flush.
+        """
+        session: Session = self._session()
+        if session.info.get("unit_of_work"):
+            yield session
+            return
+        session.info["unit_of_work"] = True
+        try:
+            yield session
+            session.commit()
+        except BaseException:
+            session.rollback()
+            raise
+        finally:
+            session.info.pop("unit_of_work", None)
 
     def get(self, cls, id):
         """
-        Returns the object based on the class name and its ID, or
-        None if not found
+        Returns the object based on the class and its ID, or
+        None if not found; objects already in the session are
+        returned without a query
         """
         from models import classes
 
-        if cls not in classes.values():
+        if cls not in classes.values() or id is None:
             return None
 
-        return self._session.query(classes[cls]).get(id)
+        return self._session.get(cls, id)
+
+    def get_many(self, cls, ids: Iterable[int], chunk_size: int = None) -> list:
+        """Return the objects of many ids in input order, None for misses.
+
+        Objects already in the session are taken from its identity map and
+        the others are loaded with one IN query per `chunk_size` ids.
+        """
+        from models import classes
+
+        ids = list(ids)
+        if cls not in classes.values():
+            return [None] * len(ids)
+        if chunk_size is None:
+            chunk_size = int(getenv("QQ_DB_IN_CHUNK_SIZE", 500))
+
+        session: Session = self._session()
+        found = {}
+        missing = []
+        for id in dict.fromkeys(ids):
+            obj = session.identity_map.get(identity_key(cls, id))
+            if obj is not None:
+                found[id] = obj
+            elif id is not None:
+                missing.append(id)
+        for i in range(0, len(missing), chunk_size):
+            chunk = missing[i : i + chunk_size]
+            for obj in session.scalars(sa.select(cls).where(cls.id.in_(chunk))):
+                found[obj.id] = obj
+        return [found.get(id) for id in ids]
+
+    def insert_many(self, cls, rows: List[dict], chunk_size: int = None) -> int:
+        """Insert plain rows of a model, one executemany per `chunk_size`
+        rows, and return how many were inserted.
+
+        The rows skip the session's unit of work: no objects are created
+        and the flush hooks of the model do not see them.
+        """
+        if chunk_size is None:
+            chunk_size = int(getenv("QQ_DB_INSERT_CHUNK_SIZE", 1000))
+        session: Session = self._session()
+        for i in range(0, len(rows), chunk_size):
+            session.execute(sa.insert(cls), rows[i : i + chunk_size])
+        if rows and not session.info.get("unit_of_work"):
+            session.commit()
+        return len(rows)
 
     def search(self, cls, **kwargs):
         """Search for a matching class instance"""
@@ -113,6 +585,24 @@ class RelationalStorage:
     def query(self, *args, **kwargs):
         return self._session.query(*args, **kwargs)
 
+    def analyze(self):
+        """refresh the table statistics used for estimated counts"""
+        with self._engine.begin() as conn:
+            conn.exec_driver_sql("ANALYZE")
+
+    def explain(self, query) -> List[str]:
+        """return the plan the database picks for a query, one step per line"""
+        statement = getattr(query, "statement", query)
+        sql = str(
+            statement.compile(self._engine, compile_kwargs={"literal_binds": True})
+        )
+        with self._engine.connect() as conn:
+            if self._engine.dialect.name == "sqlite":
+                plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")
+                return [row.detail for row in plan]
+            plan = conn.exec_driver_sql(f"EXPLAIN {sql}").mappings()
+            return [f"{row['table']} USING INDEX {row['key']}" for row in plan]
+
 
 if __name__ == "__main__":
     db = RelationalStorage()
@@ -134,7 +624,7 @@ if __name__ == "__main__":
             return self.__dict__
 
     classes["t"] = T
-    db.reload()
+    db.reload(reset=True)
 
     db.new(T())  # Add the object to the database
     db.new(T())
@@ -150,32 +640,90 @@ if __name__ == "__main__":
         assert False
 
 
+def encode_cursor(values: list) -> str:
+    """pack the sort key values of a row into an opaque cursor"""
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor: str, keyset: tuple) -> list:
+    """unpack a cursor into values typed after the keyset columns"""
+    try:
+        values = json.loads(urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list) or len(values) != len(keyset):
+            raise ValueError
+        return [
+            (
+                datetime.fromisoformat(v)
+                if col.type.python_type is datetime and v is not None
+                else v
+            )
+            for v, col in zip(values, keyset)
+        ]
+    except (ValueError, TypeError):
+        raise ValueError("cursor")
+
+
+def keyset_values(row, keyset: tuple) -> list:
+    """read the keyset column values of a result row"""
+    mapping = getattr(row, "_mapping", None)
+    entities = tuple(row) if mapping is not None else (row,)
+    values = []
+    for col in keyset:
+        if mapping is not None and col in mapping:
+            values.append(mapping[col])
+            continue
+        entity = next(e for e in entities if isinstance(e, col.class_))
+        values.append(getattr(entity, col.key))
+    return values
+
+
 def paginate(
     item_name: str,
     query: Query,
     page: int = None,
     page_size: int = None,
     apply: Callable[[Any], dict] = None,
+    cursor: str = None,
+    keyset: tuple = None,
+    with_total: bool = None,
+    count: str = None,
 ):
-    """Helper function to paginate SQLAlchemy queries"""
+    """Helper function to paginate SQLAlchemy queries
+
+    Passing a `cursor` (an empty one for the first page) switches to keyset
+    pagination: the query is ordered by the non-nullable `keyset` columns,
+    the last of which must be unique, and seeks past the cursor with
+    `(keys) > (cursor keys)` instead of an OFFSET. The total count is only
+    run in that mode when `with_total` is set.
+
+    `count` picks how totals are computed (see `count_rows`); approximate
+    totals are flagged with `total_estimated`.
+    """
+    if page_size is None:
+        page_size = getenv("PAGE_SIZE", 50)
+    page_size = int(page_size)
+    if page_size < 1:
+        raise ValueError("page_size")
+
+    if cursor is not None:
+        return paginate_keyset(
+            item_name, query, page_size, apply, cursor, keyset, with_total, count
+        )
+
     if page is None:
         page = 1
-    if page_size is None:
-        page_size = getenv("PAGE_SIZE")
     page = int(page)
-    page_size = int(page_size)
     if page < 1:
         raise ValueError("page")
-    if page_size < 1:
-        raise ValueError("page_size")
 
-    total_items = query.count()
+    total_items, estimated = count_rows(query, count)
     total_pages = (
         total_items + page_size - 1
     ) // page_size  # Round up to get total pages
     items = query.limit(page_size).offset((page - 1) * page_size).all()
 
-    return {
+    result = {
         item_name: [apply(item) if apply else item.to_dict() for item in items],
         "page": page,
         "next": page + 1 if page < total_pages else page,
@@ -184,3 +732,54 @@ def paginate(
         f"total_{item_name}": total_items,
         "total_pages": total_pages,
     }
+    if estimated:
+        result["total_estimated"] = True
+    return result
+
+
+def paginate_keyset(
+    item_name: str,
+    query: Query,
+    page_size: int,
+    apply: Callable[[Any], dict],
+    cursor: str,
+    keyset: tuple,
+    with_total: bool = None,
+    count: str = None,
+):
+    """Helper function to paginate SQLAlchemy queries by seeking a cursor"""
+    if not keyset:
+        raise ValueError("cursor")
+    if any(getattr(col.expression, "nullable", True) for col in keyset):
+        raise ValueError("sort_by")
+
+    result = {}
+    if with_total:
+        total_items, estimated = count_rows(query, count)
+        result[f"total_{item_name}"] = total_items
+        result["total_pages"] = (total_items + page_size - 1) // page_size
+        if estimated:
+            result["total_estimated"] = True
+
+    query = query.order_by(None).order_by(*keyset)
+    if cursor:
+        values = decode_cursor(cursor, keyset)
+        query = query.filter(
+            sa.tuple_(*keyset)
+            > sa.tuple_(*(sa.literal(v, col.type) for v, col in zip(values, keyset)))
+        )
+    # one extra row tells whether there is a next page without counting
+    items = query.limit(page_size + 1).all()
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        next_cursor = encode_cursor(keyset_values(items[-1], keyset))
+
+    result.update(
+        {
+            item_name: [apply(item) if apply else item.to_dict() for item in items],
+            "page_size": page_size,
+            "next_cursor": next_cursor,
+        }
+    )
+    return result
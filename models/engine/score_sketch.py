@@ -0,0 +1,237 @@
+#!/usr/bin/python3
+"""Score distribution sketch Module
+
+The scores of a quiz are summarised by a KLL quantile sketch and a
+histogram of fixed bins, both over the fraction of the full score each
+attempt got, so the summaries of different quizzes can be merged. The
+sketch keeps a few hundred samples whatever the number of attempts and
+answers rank queries within about 1.7/k of the exact rank.
+"""
+import struct
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+from math import ceil
+from os import getenv
+from random import Random
+from typing import Iterable, List, Sequence, Tuple
+
+_random = Random()
+
+# version, k, bins, points, attempts, levels
+_HEADER = struct.Struct("<BHHIQB")
+_VERSION = 1
+
+DEFAULT_QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+
+class KLLSketch:
+    """mergeable quantile sketch of Karnin, Lang and Liberty over floats
+
+    Level h holds samples standing for 2**h values each. A level over its
+    capacity is sorted and every other sample, from a random offset, is
+    promoted to the next level.
+    """
+
+    def __init__(self, k: int = 200, levels: List[array] = None, count: int = 0):
+        """initialise an empty sketch keeping about 3k samples"""
+        self.k = k
+        self.count = count
+        self.levels = levels or [array("f")]
+
+    def __len__(self):
+        return sum(len(level) for level in self.levels)
+
+    def capacity(self, level: int) -> int:
+        """the number of samples a level holds before being compacted"""
+        depth = len(self.levels) - level - 1
+        return int(ceil((2 / 3) ** depth * self.k)) + 1
+
+    def update(self, value: float):
+        """add a value"""
+        self.levels[0].append(value)
+        self.count += 1
+        self._compress()
+
+    def merge(self, other: "KLLSketch"):
+        """add every value summarised by another sketch"""
+        while len(self.levels) < len(other.levels):
+            self.levels.append(array("f"))
+        for level, samples in zip(self.levels, other.levels):
+            level.extend(samples)
+        self.count += other.count
+        self._compress()
+
+    def _compress(self):
+        while len(self) >= sum(map(self.capacity, range(len(self.levels)))):
+            for h, level in enumerate(self.levels):
+                if len(level) < self.capacity(h):
+                    continue
+                if h + 1 == len(self.levels):
+                    self.levels.append(array("f"))
+                samples = sorted(level)
+                # an odd sample out stays behind
+                kept = samples[-1:] if len(samples) % 2 else []
+                promoted = samples[
+                    _random.getrandbits(1) : len(samples) - len(kept) : 2
+                ]
+                self.levels[h] = array("f", kept)
+                self.levels[h + 1].extend(promoted)
+                break
+
+    def weighted(self) -> Tuple[List[float], List[int]]:
+        """the samples in increasing order with their cumulative weights"""
+        pairs = sorted(
+            (value, 1 << h) for h, level in enumerate(self.levels) for value in level
+        )
+        return [v for v, _ in pairs], list(accumulate(w for _, w in pairs))
+
+    def quantiles(self, qs: Sequence[float]) -> List[float]:
+        """the approximate values at the ranks `qs` in [0, 1], or None for
+        an empty sketch"""
+        values, weights = self.weighted()
+        if not values:
+            return [None for _ in qs]
+        total = weights[-1]
+        return [
+            values[min(bisect_right(weights, q * total - 1e-9), len(values) - 1)]
+            for q in qs
+        ]
+
+    def rank(self, value: float) -> float:
+        """the approximate fraction of the values not above `value`"""
+        values, weights = self.weighted()
+        i = bisect_right(values, value)
+        return weights[i - 1] / weights[-1] if i else 0.0
+
+
+class ScoreDistribution:
+    """the quantile sketch and histogram of score fractions of attempts"""
+
+    def __init__(self, bins: int = None, k: int = None, points: int = 0):
+        """initialise an empty distribution of quizzes worth `points`"""
+        if bins is None:
+            bins = int(getenv("QQ_SCORE_HISTOGRAM_BINS", 10))
+        if k is None:
+            k = int(getenv("QQ_SCORE_SKETCH_K", 200))
+        self.points = points
+        self.sketch = KLLSketch(k)
+        self.histogram = array("Q", [0] * bins)
+
+    @property
+    def attempts(self) -> int:
+        """the number of attempts summarised"""
+        return self.sketch.count
+
+    @staticmethod
+    def fraction(score: int, points: int) -> float:
+        """the fraction of the full score a score is, within [0, 1]"""
+        return min(max(score / points, 0.0), 1.0) if points > 0 else 0.0
+
+    def add(self, score: int):
+        """add the score of an attempt"""
+        fraction = self.fraction(score, self.points)
+        self.sketch.update(fraction)
+        bins = len(self.histogram)
+        self.histogram[min(int(fraction * bins), bins - 1)] += 1
+
+    def extend(self, scores: Iterable[int]):
+        """add the scores of many attempts"""
+        for score in scores:
+            self.add(score)
+
+    def merge(self, other: "ScoreDistribution"):
+        """add the attempts of another distribution, over the same bins"""
+        if len(other.histogram) != len(self.histogram):
+            raise ValueError("bins")
+        self.sketch.merge(other.sketch)
+        for i, count in enumerate(other.histogram):
+            self.histogram[i] += count
+        if self.points != other.points:
+            self.points = 0
+
+    def quantiles(self, qs: Sequence[float]) -> List[float]:
+        """the score fractions at the ranks `qs`"""
+        return self.sketch.quantiles(qs)
+
+    def to_dict(self, qs: Sequence[float]) -> dict:
+        """the distribution as served, in points when all its attempts
+        come from quizzes worth the same points and in fractions of the
+        full score otherwise"""
+        scale = self.points or 1
+        bins = len(self.histogram)
+        quantiles = [
+            None if f is None else round(f * scale, 2) for f in self.quantiles(qs)
+        ]
+        median, p90 = (
+            None if f is None else round(f * scale, 2)
+            for f in self.quantiles((0.5, 0.9))
+        )
+        return {
+            "attempts": self.attempts,
+            "points": self.points or None,
+            "median": median,
+            "p90": p90,
+            "quantiles": [{"quantile": q, "score": s} for q, s in zip(qs, quantiles)],
+            "histogram": [
+                {
+                    "from": round(i * scale / bins, 2),
+                    "to": round((i + 1) * scale / bins, 2),
+                    "count": count,
+                }
+                for i, count in enumerate(self.histogram)
+            ],
+        }
+
+    def dumps(self) -> bytes:
+        """the compact serialized form of the distribution"""
+        levels = self.sketch.levels
+        parts = [
+            _HEADER.pack(
+                _VERSION,
+                self.sketch.k,
+                len(self.histogram),
+                max(self.points, 0),
+                self.sketch.count,
+                len(levels),
+            )
+        ]
+        parts.append(array("I", map(len, levels)).tobytes())
+        parts.extend(level.tobytes() for level in levels)
+        parts.append(self.histogram.tobytes())
+        return b"".join(parts)
+
+    @classmethod
+    def loads(cls, data: bytes) -> "ScoreDistribution":
+        """read a distribution serialized by `dumps`"""
+        version, k, bins, points, count, n_levels = _HEADER.unpack_from(data)
+        if version != _VERSION:
+            raise ValueError("distribution")
+        offset = _HEADER.size
+        sizes = array("I")
+        sizes.frombytes(data[offset : offset + 4 * n_levels])
+        offset += 4 * n_levels
+        levels = []
+        for size in sizes:
+            level = array("f")
+            level.frombytes(data[offset : offset + 4 * size])
+            levels.append(level)
+            offset += 4 * size
+        distribution = cls(bins, k, points)
+        distribution.sketch = KLLSketch(k, levels, count)
+        distribution.histogram = array("Q")
+        distribution.histogram.frombytes(data[offset : offset + 8 * bins])
+        return distribution
+
+
+def merge_distributions(
+    distributions: Iterable[ScoreDistribution],
+) -> ScoreDistribution:
+    """a distribution of the attempts of all the given ones"""
+    merged = None
+    for distribution in distributions:
+        if merged is None:
+            merged = distribution
+        else:
+            merged.merge(distribution)
+    return merged if merged is not None else ScoreDistribution()
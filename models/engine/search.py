@@ -0,0 +1,211 @@
+#!/usr/bin/python3
+"""Full-text search Module
+
+SQLite gets FTS5 tables mirroring the searchable columns, kept in sync by
+triggers; MySQL gets FULLTEXT indexes. Other databases fall back to the
+`LIKE '%q%'` filters.
+
+The index matches words, not substrings: every word of the text has to
+start a word of the row, so "thon" no longer finds "Python", while "pyth"
+and "python basics" do.
+"""
+import re
+from typing import List
+import sqlalchemy as sa
+from sqlalchemy.orm import Query
+
+# (table, searchable columns) of every FTS5 table, named <table>_fts
+FTS_TABLES = {
+    "quiz": ("title", "category"),
+    "question": ("statement",),
+    "group": ("title",),
+}
+FTS_WEIGHTS = {"quiz": (10.0, 2.0), "question": (1.0,), "group": (1.0,)}
+
+
+def _sqlite_ddl(table: str, columns: tuple) -> List[str]:
+    fts = f"{table}_fts"
+    cols = ", ".join(columns)
+    new = ", ".join(f"new.{c}" for c in columns)
+    old = ", ".join(f"old.{c}" for c in columns)
+    delete = (
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old});"
+    )
+    insert = f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols},"
+        f" content='{table}', content_rowid='id',"
+        " tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON "{table}"'
+        f" BEGIN {insert} END",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON "{table}"'
+        f" BEGIN {delete} END",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON "{table}"'
+        f" BEGIN {delete} {insert} END",
+    ]
+
+
+# (index name, table, columns) of the MySQL FULLTEXT indexes
+FULLTEXT_INDEXES = [
+    ("ft_quiz_title_category", "quiz", ("title", "category")),
+    ("ft_question_statement", "question", ("statement",)),
+    ("ft_group_title", "group", ("title",)),
+]
+
+
+def search_ddl(dialect: str) -> List[str]:
+    """the statements creating the search structures of a dialect"""
+    if dialect == "sqlite":
+        return [
+            stmt
+            for table, columns in FTS_TABLES.items()
+            for stmt in _sqlite_ddl(table, columns)
+        ]
+    if dialect in ("mysql", "mariadb"):
+        return [
+            f"CREATE FULLTEXT INDEX {name} ON `{table}` ({', '.join(columns)})"
+            for name, table, columns in FULLTEXT_INDEXES
+        ]
+    return []
+
+
+def install_search(conn: sa.Connection):
+    """create the missing search structures, indexing the existing rows"""
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        existing = set(
+            conn.execute(
+                sa.text("SELECT name FROM sqlite_master WHERE type = 'table'")
+            ).scalars()
+        )
+        for stmt in search_ddl(dialect):
+            conn.exec_driver_sql(stmt)
+        for table in FTS_TABLES:
+            fts = f"{table}_fts"
+            if fts not in existing:
+                conn.exec_driver_sql(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+    elif dialect in ("mysql", "mariadb"):
+        inspector = sa.inspect(conn)
+        for (name, table, _), stmt in zip(FULLTEXT_INDEXES, search_ddl(dialect)):
+            if name not in {i["name"] for i in inspector.get_indexes(table)}:
+                conn.exec_driver_sql(stmt)
+
+
+def drop_search(conn: sa.Connection):
+    """drop the search tables that do not go away with their models"""
+    if conn.dialect.name == "sqlite":
+        for table in FTS_TABLES:
+            conn.exec_driver_sql(f"DROP TABLE IF EXISTS {table}_fts")
+
+
+def match_query(text: str, dialect: str) -> str:
+    """turn free text into a match expression requiring every word as a
+    prefix, or None when it has no word"""
+    words = re.findall(r"\w+", text or "")
+    if not words:
+        return None
+    if dialect == "sqlite":
+        return " ".join(f'"{w}"*' for w in words)
+    return " ".join(f"+{w}*" for w in words)
+
+
+def _dialect(query: Query, model) -> str:
+    return query.session.get_bind(mapper=sa.inspect(model)).dialect.name
+
+
+def _fts_rank(table: str, match: str):
+    """select (id, rank) of the rows of a FTS5 table matching, best first
+    by ascending rank"""
+    fts = sa.table(f"{table}_fts", sa.column("rowid"))
+    weights = ", ".join(str(w) for w in FTS_WEIGHTS[table])
+    return (
+        sa.select(
+            fts.c.rowid.label("id"),
+            sa.literal_column(f"bm25({table}_fts, {weights})").label("rank"),
+        )
+        .select_from(fts)
+        .where(sa.literal_column(f"{table}_fts").op("MATCH")(match))
+    )
+
+
+def search_quizzes(query: Query, text: str, ranked: bool = True) -> Query:
+    """filter a query of quizzes to those whose title, category or question
+    statements match the text, ordering them by relevance when `ranked`"""
+    from models.question import Question
+    from models.quiz import Quiz
+
+    dialect = _dialect(query, Quiz)
+    match = match_query(text, dialect)
+    if match is None or dialect not in ("sqlite", "mysql", "mariadb"):
+        return query.filter(Quiz.title.like(f"%{text}%"))
+
+    if dialect == "sqlite":
+        # bm25 scores of different FTS tables are not on the same scale, so
+        # each table ranks its own hits and title or category matches come
+        # before quizzes only matched by a question, as on MySQL
+        quizzes = _fts_rank("quiz", match).subquery()
+        questions = _fts_rank("question", match).subquery()
+        hits = sa.union_all(
+            sa.select(
+                quizzes.c.id,
+                quizzes.c.rank.label("quiz_rank"),
+                sa.null().label("question_rank"),
+            ),
+            sa.select(Question.quiz_id, sa.null(), questions.c.rank).join(
+                questions, questions.c.id == Question.id
+            ),
+        ).subquery()
+        matches = (
+            sa.select(
+                hits.c.id,
+                sa.func.min(hits.c.quiz_rank).label("quiz_rank"),
+                sa.func.min(hits.c.question_rank).label("question_rank"),
+            )
+            .group_by(hits.c.id)
+            .subquery()
+        )
+        query = query.join(matches, matches.c.id == Quiz.id)
+        if not ranked:
+            return query
+        return query.order_by(
+            matches.c.quiz_rank == None,
+            matches.c.quiz_rank,
+            matches.c.question_rank == None,
+            matches.c.question_rank,
+        )
+
+    from sqlalchemy.dialects.mysql import match as mysql_match
+
+    score = mysql_match(Quiz.title, Quiz.category, against=match).in_boolean_mode()
+    in_questions = (
+        sa.select(Question.id)
+        .where(
+            Question.quiz_id == Quiz.id,
+            mysql_match(Question.statement, against=match).in_boolean_mode(),
+        )
+        .exists()
+    )
+    query = query.filter(sa.or_(score > 0, in_questions))
+    return query.order_by(score.desc()) if ranked else query
+
+
+def search_groups(query: Query, text: str, ranked: bool = True) -> Query:
+    """filter a query of groups to those whose title matches the text,
+    ordering them by relevance when `ranked`"""
+    from models.group import Group
+
+    dialect = _dialect(query, Group)
+    match = match_query(text, dialect)
+    if match is None or dialect not in ("sqlite", "mysql", "mariadb"):
+        return query.where(Group.title.like(f"%{text}%"))
+
+    if dialect == "sqlite":
+        matches = _fts_rank("group", match).subquery()
+        query = query.join(matches, matches.c.id == Group.id)
+        return query.order_by(matches.c.rank) if ranked else query
+
+    from sqlalchemy.dialects.mysql import match as mysql_match
+
+    score = mysql_match(Group.title, against=match).in_boolean_mode()
+    query = query.filter(score > 0)
+    return query.order_by(score.desc()) if ranked else query
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, ForeignKey, Integer, String
+from sqlalchemy import Column, ForeignKey, Index, Integer, String
 from sqlalchemy.orm import relationship
 from models.base import BaseModel, Base
 from models.group_user import group_user
@@ -8,6 +8,10 @@ class Group(Base, BaseModel):
     """Group DB model class"""
 
     __tablename__ = "group"
+    __table_args__ = (
+        Index("ix_group_ownership_id", "ownership_id"),
+        Index("ix_group_title", "title"),
+    )
 
     def __init__(self, title, ownership_id, **kwargs):
         """initialize a Group instance"""
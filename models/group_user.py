@@ -1,4 +1,4 @@
-from sqlalchemy import Table, Column, ForeignKey, Integer
+from sqlalchemy import Table, Column, ForeignKey, Index, Integer
 from models.base import Base
 
 group_user = Table(
@@ -16,4 +16,5 @@ group_user = Table(
         ForeignKey("user.id", onupdate="CASCADE", ondelete="CASCADE"),
         primary_key=True,
     ),
+    Index("ix_group_user_user_id", "user_id"),
 )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, ForeignKey, Integer
+from sqlalchemy import Column, ForeignKey, Index, Integer
 from sqlalchemy.orm import relationship
 from models.base import BaseModel, Base
 
@@ -7,6 +7,7 @@ class Ownership(Base, BaseModel):
     """Ownership DB model class"""
 
     __tablename__ = "ownership"
+    __table_args__ = (Index("ix_ownership_user_id", "user_id"),)
 
     def __init__(self, user_id, **kwargs):
         """initialize a Ownership instance"""
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, ForeignKey, Integer, String
+from sqlalchemy import Column, ForeignKey, Index, Integer, String
 from sqlalchemy.orm import relationship
 from models.base import BaseModel, Base
 
@@ -7,6 +7,7 @@ class Question(Base, BaseModel):
     """Question DB model class"""
 
     __tablename__ = "question"
+    __table_args__ = (Index("ix_question_quiz_id_order", "quiz_id", "order"),)
 
     def __init__(self, statement, quiz_id, points, type, order, **kwargs):
         """initialize a Question instance"""
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, ForeignKey, DATETIME, Integer, String
+from sqlalchemy import Column, ForeignKey, DATETIME, Index, Integer, String
 from sqlalchemy.orm import relationship
 from models.base import BaseModel, Base
 
@@ -7,6 +7,11 @@ class Quiz(Base, BaseModel):
     """Quiz DB model class"""
 
     __tablename__ = "quiz"
+    __table_args__ = (
+        Index("ix_quiz_group_id_title", "group_id", "title"),
+        Index("ix_quiz_user_id_title", "user_id", "title"),
+        Index("ix_quiz_title", "title"),
+    )
 
     def __init__(
         self,
@@ -42,6 +47,8 @@ class Quiz(Base, BaseModel):
     duration = Column(Integer, nullable=True)
     start = Column(DATETIME, nullable=True)
     end = Column(DATETIME, nullable=True)
+    # incremented by every edit of the questions or answer options
+    content_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     group_id = Column(Integer, ForeignKey("group.id"), nullable=True)
     user_id = Column(Integer, ForeignKey("user.id"), nullable=False)
@@ -54,6 +61,9 @@ class Quiz(Base, BaseModel):
     quiz_attempts = relationship(
         "QuizAttempt", back_populates="quiz", cascade="all, delete-orphan"
     )
+    stats = relationship(
+        "QuizStats", back_populates="quiz", uselist=False, cascade="all, delete-orphan"
+    )
 
 
 from models.question import Question
@@ -63,3 +73,7 @@ Question.quiz = relationship("Quiz", back_populates="questions")
 from models.quiz_attempt import QuizAttempt
 
 QuizAttempt.quiz = relationship("Quiz", back_populates="quiz_attempts")
+
+from models.quiz_stats import QuizStats
+
+QuizStats.quiz = relationship("Quiz", back_populates="stats")
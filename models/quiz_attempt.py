@@ -1,4 +1,4 @@
-from sqlalchemy import Column, ForeignKey, Integer, Boolean
+from sqlalchemy import Column, ForeignKey, Index, Integer, Boolean
 from sqlalchemy.orm import relationship
 from models.base import BaseModel, Base
 
@@ -7,6 +7,15 @@ class QuizAttempt(Base, BaseModel):
     """QuizAttempt DB model class"""
 
     __tablename__ = "quiz_attempt"
+    __table_args__ = (
+        Index(
+            "ix_quiz_attempt_quiz_id_user_id_created_at",
+            "quiz_id",
+            "user_id",
+            "created_at",
+        ),
+        Index("ix_quiz_attempt_user_id_quiz_id_score", "user_id", "quiz_id", "score"),
+    )
 
     def __init__(self, score, quiz_id, user_id, **kwargs):
         """initialize a QuizAttempt instance"""
@@ -0,0 +1,213 @@
+from itertools import groupby
+from math import sqrt
+import sqlalchemy as sa
+from sqlalchemy import Column, ForeignKey, Integer, LargeBinary
+from sqlalchemy.exc import IntegrityError
+from models.base import BaseModel, Base
+from models.engine.score_sketch import ScoreDistribution
+
+
+class QuizStats(Base, BaseModel):
+    """QuizStats DB model class, the running totals of a quiz's attempts"""
+
+    __tablename__ = "quiz_stats"
+
+    def __init__(self, quiz_id, **kwargs):
+        """initialize a QuizStats instance"""
+        kwargs.update(quiz_id=quiz_id)
+        super().__init__(**kwargs)
+
+    quiz_id = Column(Integer, ForeignKey("quiz.id"), nullable=False, unique=True)
+
+    attempts = Column(Integer, nullable=False, default=0)
+    users = Column(Integer, nullable=False, default=0)
+    full_scores = Column(Integer, nullable=False, default=0)
+    score_sum = Column(Integer, nullable=False, default=0)
+    score_sq_sum = Column(Integer, nullable=False, default=0)
+    min_score = Column(Integer, nullable=True)
+    max_score = Column(Integer, nullable=True)
+    # serialized ScoreDistribution of the attempt scores
+    distribution = Column(LargeBinary, nullable=True)
+
+    quiz = None
+
+    @property
+    def average_score(self) -> float:
+        """mean score of the attempts"""
+        return self.score_sum / self.attempts if self.attempts else None
+
+    @property
+    def score_stddev(self) -> float:
+        """population standard deviation of the attempt scores"""
+        if not self.attempts:
+            return None
+        mean = self.score_sum / self.attempts
+        return sqrt(max(self.score_sq_sum / self.attempts - mean * mean, 0))
+
+    @property
+    def score_distribution(self) -> ScoreDistribution:
+        """the quantile sketch and histogram of the attempt scores"""
+        if self.distribution is None:
+            return ScoreDistribution()
+        return ScoreDistribution.loads(self.distribution)
+
+    @classmethod
+    def record(
+        cls,
+        session,
+        quiz_id: int,
+        score: int,
+        full_score: bool,
+        user_id: int,
+        points: int = 0,
+    ):
+        """add one attempt of a quiz worth `points`, already flushed, to its
+        totals with a single UPDATE, so concurrent submissions never
+        overwrite each other; the row is locked first while its score
+        distribution is updated and the user is counted
+
+        SQLite ignores FOR UPDATE: there the write lock taken by inserting
+        the attempt, held until commit, serializes the submissions instead.
+        """
+        from models.quiz_attempt import QuizAttempt
+
+        table = cls.__table__
+        row = session.execute(
+            sa.select(table.c.distribution)
+            .where(table.c.quiz_id == quiz_id)
+            .with_for_update()
+        ).first()
+        # read under the row lock, past the snapshot of the transaction, so
+        # concurrent first attempts of a user count them once
+        new_user = (
+            len(
+                session.execute(
+                    sa.select(QuizAttempt.id)
+                    .where(
+                        QuizAttempt.quiz_id == quiz_id, QuizAttempt.user_id == user_id
+                    )
+                    .limit(2)
+                    .with_for_update(read=True)
+                ).all()
+            )
+            == 1
+        )
+        if row is not None and row[0] is not None:
+            distribution = ScoreDistribution.loads(row[0])
+            # a rebuild follows every change of the answer key, this only
+            # covers a write racing with one
+            distribution.points = points
+        else:
+            distribution = ScoreDistribution(points=points)
+        distribution.add(score)
+        values = dict(
+            attempts=table.c.attempts + 1,
+            users=table.c.users + int(new_user),
+            full_scores=table.c.full_scores + int(full_score),
+            score_sum=table.c.score_sum + score,
+            score_sq_sum=table.c.score_sq_sum + score * score,
+            min_score=sa.case(
+                (table.c.min_score <= score, table.c.min_score), else_=score
+            ),
+            max_score=sa.case(
+                (table.c.max_score >= score, table.c.max_score), else_=score
+            ),
+            distribution=distribution.dumps(),
+            updated_at=sa.func.now(),
+        )
+        update = table.update().where(table.c.quiz_id == quiz_id).values(**values)
+        if row is not None:
+            session.execute(update)
+            return
+        try:
+            with session.begin_nested():
+                session.execute(
+                    table.insert().values(
+                        quiz_id=quiz_id,
+                        attempts=1,
+                        users=int(new_user),
+                        full_scores=int(full_score),
+                        score_sum=score,
+                        score_sq_sum=score * score,
+                        min_score=score,
+                        max_score=score,
+                        distribution=values["distribution"],
+                    )
+                )
+        except IntegrityError:
+            # another submission created the row first
+            cls.record(session, quiz_id, score, full_score, user_id, points)
+
+    @classmethod
+    def rebuild(cls, session, quiz_id: int = None) -> int:
+        """recompute the totals of one quiz, or of every quiz, from their
+        attempts; return the number of rows written"""
+        from models.quiz_attempt import QuizAttempt
+
+        table = cls.__table__
+        delete = table.delete()
+        totals = sa.select(
+            QuizAttempt.quiz_id,
+            sa.func.count(),
+            sa.func.count(sa.distinct(QuizAttempt.user_id)),
+            sa.func.sum(sa.case((QuizAttempt.full_score, 1), else_=0)),
+            sa.func.sum(QuizAttempt.score),
+            sa.func.sum(QuizAttempt.score * QuizAttempt.score),
+            sa.func.min(QuizAttempt.score),
+            sa.func.max(QuizAttempt.score),
+        ).group_by(QuizAttempt.quiz_id)
+        if quiz_id is not None:
+            delete = delete.where(table.c.quiz_id == quiz_id)
+            totals = totals.where(QuizAttempt.quiz_id == quiz_id)
+        session.execute(delete)
+        rows = session.execute(
+            table.insert().from_select(
+                [
+                    "quiz_id",
+                    "attempts",
+                    "users",
+                    "full_scores",
+                    "score_sum",
+                    "score_sq_sum",
+                    "min_score",
+                    "max_score",
+                ],
+                totals,
+            )
+        ).rowcount
+        cls.rebuild_distributions(session, quiz_id)
+        return rows
+
+    @classmethod
+    def rebuild_distributions(cls, session, quiz_id: int = None):
+        """recompute the score distributions of one quiz, or of every quiz,
+        from their attempts and the current points of their questions"""
+        from models.question import Question
+        from models.quiz_attempt import QuizAttempt
+
+        table = cls.__table__
+        points = sa.select(Question.quiz_id, sa.func.sum(Question.points)).group_by(
+            Question.quiz_id
+        )
+        scores = sa.select(QuizAttempt.quiz_id, QuizAttempt.score).order_by(
+            QuizAttempt.quiz_id
+        )
+        if quiz_id is not None:
+            points = points.where(Question.quiz_id == quiz_id)
+            scores = scores.where(QuizAttempt.quiz_id == quiz_id)
+        points = dict(session.execute(points).all())
+
+        distributions = []
+        for id, rows in groupby(session.execute(scores), key=lambda row: row[0]):
+            distribution = ScoreDistribution(points=points.get(id) or 0)
+            distribution.extend(score for _, score in rows)
+            distributions.append(
+                {"b_quiz_id": id, "b_distribution": distribution.dumps()}
+            )
+        if distributions:
+            session.execute(
+                table.update()
+                .where(table.c.quiz_id == sa.bindparam("b_quiz_id"))
+                .values(distribution=sa.bindparam("b_distribution")),
+                distributions,
+            )
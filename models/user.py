@@ -51,6 +51,9 @@ class User(Base, BaseModel):
     ownerships = relationship(
         "Ownership", back_populates="user", cascade="all, delete-orphan"
     )
+    stats = relationship(
+        "UserStats", back_populates="user", uselist=False, cascade="all, delete-orphan"
+    )
 
 
 from models.ownership import Ownership
@@ -68,3 +71,7 @@ QuizAttempt.user = relationship("User", back_populates="quiz_attempts")
 from models.user_session import UserSession
 
 UserSession.user = relationship("User", back_populates="user_sessions")
+
+from models.user_stats import UserStats
+
+UserStats.user = relationship("User", back_populates="stats")
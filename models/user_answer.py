@@ -1,4 +1,4 @@
-from sqlalchemy import Column, ForeignKey, Integer
+from sqlalchemy import Column, ForeignKey, Index, Integer
 from sqlalchemy.orm import relationship
 from models.base import BaseModel, Base
 
@@ -7,6 +7,15 @@ class UserAnswer(Base, BaseModel):
     """UserAnswer DB model class"""
 
     __tablename__ = "user_answer"
+    __table_args__ = (
+        Index("ix_user_answer_attempt_id", "attempt_id"),
+        Index(
+            "ix_user_answer_question_id_attempt_id_answer",
+            "question_id",
+            "attempt_id",
+            "answer",
+        ),
+    )
 
     def __init__(self, attempt_id, answer, question_id, **kwargs):
         """initialize a UserAnswer instance"""
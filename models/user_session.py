@@ -1,4 +1,4 @@
-from sqlalchemy import Column, ForeignKey, DATETIME, Integer, Uuid
+from sqlalchemy import Column, ForeignKey, DATETIME, Index, Integer, Uuid
 from sqlalchemy.orm import relationship
 from models.base import BaseModel, Base
 
@@ -7,6 +7,10 @@ class UserSession(Base, BaseModel):
     """UserSession DB model class"""
 
     __tablename__ = "user_session"
+    __table_args__ = (
+        Index("ix_user_session_expiry_date", "expiry_date"),
+        Index("ix_user_session_user_id", "user_id"),
+    )
 
     def __init__(self, expiry_date, uuid, user_id, **kwargs):
         """initialize a UserSession instance"""
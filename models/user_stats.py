@@ -0,0 +1,198 @@
+from collections import Counter, defaultdict
+import sqlalchemy as sa
+from sqlalchemy import Column, ForeignKey, Integer
+from sqlalchemy.orm import Session, attributes
+from models.base import BaseModel, Base
+
+COUNTERS = ("owned_groups", "created_quizzes", "subscribed_groups", "solved_quizzes")
+
+
+class UserStats(Base, BaseModel):
+    """UserStats DB model class, the profile counters of a user
+
+    Rows share the id of their user and are kept current by the session
+    flush hooks below, so every write path (including cascades) updates
+    them in the transaction that changes the counted rows.
+    """
+
+    __tablename__ = "user_stats"
+
+    id = Column(Integer, ForeignKey("user.id"), primary_key=True, autoincrement=False)
+
+    owned_groups = Column(Integer, nullable=False, default=0)
+    created_quizzes = Column(Integer, nullable=False, default=0)
+    subscribed_groups = Column(Integer, nullable=False, default=0)
+    solved_quizzes = Column(Integer, nullable=False, default=0)
+
+    user = None
+
+    @staticmethod
+    def counts():
+        """select the counters of every user computed from scratch"""
+        from models.group import Group
+        from models.group_user import group_user
+        from models.ownership import Ownership
+        from models.quiz import Quiz
+        from models.quiz_attempt import QuizAttempt
+        from models.user import User
+
+        def count(*where, column=None):
+            counted = sa.func.count() if column is None else sa.func.count(column)
+            return sa.select(counted).where(*where).correlate(User).scalar_subquery()
+
+        return sa.select(
+            User.id,
+            count(Group.ownership_id == Ownership.id, Ownership.user_id == User.id),
+            count(Quiz.user_id == User.id),
+            count(group_user.c.user_id == User.id),
+            count(
+                QuizAttempt.user_id == User.id,
+                QuizAttempt.full_score.is_(True),
+                column=sa.distinct(QuizAttempt.quiz_id),
+            ),
+        )
+
+    @classmethod
+    def reconcile(cls, session, user_ids=None) -> int:
+        """recompute the counters of some users, or of everyone, fixing any
+        drift; return the number of rows written"""
+        from models.user import User
+
+        table = cls.__table__
+        delete = table.delete()
+        counts = cls.counts()
+        if user_ids is not None:
+            user_ids = list(user_ids)
+            delete = delete.where(table.c.id.in_(user_ids))
+            counts = counts.where(User.id.in_(user_ids))
+        session.execute(delete)
+        return session.execute(
+            table.insert().from_select(["id", *COUNTERS], counts)
+        ).rowcount
+
+    @classmethod
+    def apply(cls, session, deltas: dict):
+        """add counter deltas to the rows of their users, rebuilding the
+        rows that do not exist yet"""
+        table = cls.__table__
+        missing = []
+        for user_id, delta in deltas.items():
+            delta = {k: v for k, v in delta.items() if v}
+            if not delta:
+                continue
+            values = {k: table.c[k] + v for k, v in delta.items()}
+            if not session.execute(
+                table.update().where(table.c.id == user_id).values(**values)
+            ).rowcount:
+                missing.append(user_id)
+        if missing:
+            cls.reconcile(session, missing)
+
+
+def _solved_elsewhere(session, user_id, quiz_id, exclude) -> bool:
+    """whether the user has a full score attempt of the quiz stored
+    outside the given attempt ids"""
+    from models.quiz_attempt import QuizAttempt
+
+    query = sa.select(QuizAttempt.id).where(
+        QuizAttempt.user_id == user_id,
+        QuizAttempt.quiz_id == quiz_id,
+        QuizAttempt.full_score.is_(True),
+    )
+    exclude = [id for id in exclude if id is not None]
+    if exclude:
+        query = query.where(QuizAttempt.id.not_in(exclude))
+    return session.execute(query.limit(1)).first() is not None
+
+
+def _owner_id(session, group):
+    """the id of the user owning a group"""
+    from models.ownership import Ownership
+
+    if group.ownership is not None:
+        return group.ownership.user_id
+    ownership = session.get(Ownership, group.ownership_id)
+    return ownership.user_id if ownership is not None else None
+
+
+def _collect_deltas(session: Session, flush_context, instances):
+    """work out the counter changes of the objects about to be flushed"""
+    from models.group import Group
+    from models.quiz import Quiz
+    from models.quiz_attempt import QuizAttempt
+    from models.user import User
+
+    deltas = defaultdict(Counter)
+    subscribed, unsubscribed = set(), set()
+    solved, unsolved = {}, {}
+
+    with session.no_autoflush:
+        for obj in session.new:
+            if isinstance(obj, Group):
+                deltas[_owner_id(session, obj)]["owned_groups"] += 1
+                subscribed.update((obj, u) for u in obj.users)
+            elif isinstance(obj, Quiz):
+                deltas[obj.user_id]["created_quizzes"] += 1
+            elif isinstance(obj, QuizAttempt) and obj.full_score:
+                solved.setdefault((obj.user_id, obj.quiz_id), []).append(obj.id)
+
+        for obj in session.dirty:
+            if isinstance(obj, Group):
+                history = attributes.get_history(
+                    obj, "users", attributes.PASSIVE_NO_INITIALIZE
+                )
+                subscribed.update((obj, u) for u in history.added)
+                unsubscribed.update((obj, u) for u in history.deleted)
+            elif isinstance(obj, User):
+                history = attributes.get_history(
+                    obj, "groups", attributes.PASSIVE_NO_INITIALIZE
+                )
+                subscribed.update((g, obj) for g in history.added)
+                unsubscribed.update((g, obj) for g in history.deleted)
+            elif isinstance(obj, QuizAttempt):
+                history = attributes.get_history(obj, "full_score")
+                if not history.has_changes():
+                    continue
+                before = bool(history.deleted and history.deleted[0])
+                after = bool(history.added and history.added[0])
+                if after and not before:
+                    solved.setdefault((obj.user_id, obj.quiz_id), []).append(obj.id)
+                elif before and not after:
+                    unsolved.setdefault((obj.user_id, obj.quiz_id), []).append(obj.id)
+
+        deleted_users = {obj.id for obj in session.deleted if isinstance(obj, User)}
+        for obj in session.deleted:
+            if isinstance(obj, Group):
+                deltas[_owner_id(session, obj)]["owned_groups"] -= 1
+                unsubscribed.update((obj, u) for u in obj.users)
+            elif isinstance(obj, Quiz):
+                deltas[obj.user_id]["created_quizzes"] -= 1
+            elif isinstance(obj, QuizAttempt) and obj.full_score:
+                unsolved.setdefault((obj.user_id, obj.quiz_id), []).append(obj.id)
+
+        for group, user in subscribed - unsubscribed:
+            deltas[user.id]["subscribed_groups"] += 1
+        for group, user in unsubscribed - subscribed:
+            deltas[user.id]["subscribed_groups"] -= 1
+        for (user_id, quiz_id), ids in solved.items():
+            if not _solved_elsewhere(session, user_id, quiz_id, ids):
+                deltas[user_id]["solved_quizzes"] += 1
+        for (user_id, quiz_id), ids in unsolved.items():
+            if not _solved_elsewhere(session, user_id, quiz_id, ids):
+                deltas[user_id]["solved_quizzes"] -= 1
+
+    # the rows of deleted users go away with them
+    for user_id in deleted_users:
+        deltas.pop(user_id, None)
+    deltas.pop(None, None)
+    session.info.setdefault("user_stats_deltas", []).append(dict(deltas))
+
+
+def _apply_deltas(session: Session, flush_context):
+    """write the counter changes worked out before the flush"""
+    for deltas in session.info.pop("user_stats_deltas", []):
+        UserStats.apply(session, deltas)
+
+
+sa.event.listen(Session, "before_flush", _collect_deltas)
+sa.event.listen(Session, "after_flush", _apply_deltas)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""Shared fixture of the route tests
+"""
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+os.environ.setdefault("AUTH", "SESSION_AUTH")
+os.environ.setdefault("SESSION_NAME", "session_id")
+os.environ.setdefault("QQ_DB", os.path.join(tempfile.mkdtemp(), "quizquickie_test"))
+
+from api.v1.app import app  # noqa: E402
+from models import (  # noqa: E402
+    answer_keys,
+    autocomplete,
+    leaderboard,
+    question_stats,
+    storage,
+)
+from models.base import time_fmt  # noqa: E402
+
+
+class RouteTestCase(unittest.TestCase):
+    """a fresh database with `users` users, two groups and `quizzes`
+    quizzes owned by the first user, who is logged in"""
+
+    users = 3
+    quizzes = 2
+
+    def setUp(self):
+        storage.reload(reset=True)
+        for cache in (answer_keys, question_stats, leaderboard):
+            if cache is not None:
+                cache.clear()
+        self.client = app.test_client()
+        self.user_ids = [
+            u["user_id"]
+            for u in self.post(
+                "/api/v1/test/users",
+                [
+                    {"email": f"u{i}@x.com", "password": "pw", "user_name": f"user{i}"}
+                    for i in range(self.users)
+                ],
+            )
+        ]
+        self.group_ids = [
+            g["group_id"]
+            for g in self.post(
+                "/api/v1/test/groups",
+                {
+                    "user_id": self.user_ids[0],
+                    "body": [{"title": "g0"}, {"title": "g1"}],
+                },
+            )
+        ]
+        start = datetime.now() + timedelta(days=1)
+        self.quiz_ids = [
+            q["quiz_id"]
+            for q in self.post(
+                "/api/v1/test/quizzes",
+                {
+                    "user_id": self.user_ids[0],
+                    "body": [
+                        {
+                            "title": f"quiz {i}",
+                            "category": "cat",
+                            "difficulty": 2,
+                            "points": 10,
+                            "duration": 30,
+                            "start": start.strftime(time_fmt),
+                            "end": (start + timedelta(days=1)).strftime(time_fmt),
+                        }
+                        for i in range(self.quizzes)
+                    ],
+                },
+            )
+        ]
+        if autocomplete is not None:
+            autocomplete.build(storage)
+        self.login(0)
+
+    def tearDown(self):
+        storage.close()
+
+    def post(self, url, body):
+        """post a test fixture command, returning its response body"""
+        response = self.client.post(url, json=body)
+        self.assertEqual(response.status_code, 201, response.json)
+        return response.json
+
+    def login(self, i):
+        """log in as the i-th user"""
+        response = self.client.post(
+            "/api/v1/auth/login", json={"email": f"u{i}@x.com", "password": "pw"}
+        )
+        self.assertEqual(response.status_code, 200, response.json)
+
+    def add_questions(self, quiz_id, n=3, options=3):
+        """add `n` single choice questions worth 2 points, the i-th having
+        option i % `options` correct, returning their ids"""
+        response = self.client.post(
+            f"/api/v1/user/quiz/{quiz_id}/question",
+            json={
+                "questions": [
+                    {
+                        "statement": f"q{i}",
+                        "points": 2,
+                        "type": "SCQ",
+                        "options": [f"o{j}" for j in range(options)],
+                        "correct_answer": [i % options],
+                    }
+                    for i in range(n)
+                ]
+            },
+        )
+        self.assertEqual(response.status_code, 201, response.json)
+        return [q["question_id"] for q in response.json]
+
+    def submit(self, quiz_id, options):
+        """submit an attempt choosing `options` for each question"""
+        return self.client.post(
+            f"/api/v1/user/profile/quiz/{quiz_id}/attempts",
+            json={"answers": [{"options": chosen} for chosen in options]},
+        )
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""Tests for the autocomplete routes
+"""
+import unittest
+import unittest.mock
+
+from tests.test_api.v1.test_routes import RouteTestCase, autocomplete
+
+
+class TestPrefixFallback(RouteTestCase):
+    """Check the database prefix scan used when the index is over its bound"""
+
+    def setUp(self):
+        super().setUp()
+        self.post(
+            "/api/v1/test/users",
+            [{"email": "p@x.com", "password": "pw", "user_name": "50%_off"}],
+        )
+
+    def names(self, query):
+        with unittest.mock.patch.object(autocomplete, "search", return_value=None):
+            response = self.client.get(f"/api/v1/autocomplete?query={query}")
+        self.assertEqual(response.status_code, 200, response.json)
+        return [user["user_name"] for user in response.json["users"]]
+
+    def test_wildcards_are_literal(self):
+        """% and _ in the query match themselves only"""
+        self.assertEqual(self.names("user"), ["user0", "user1", "user2"])
+        self.assertEqual(self.names("%25"), [])
+        self.assertEqual(self.names("user_"), [])
+        self.assertEqual(self.names("50%25_"), ["50%_off"])
+
+
+if __name__ == "__main__":
+    unittest.main()
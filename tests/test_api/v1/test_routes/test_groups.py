@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Tests for the group routes
+"""
+import unittest
+
+from models import QuizStats
+from models.engine.score_sketch import ScoreDistribution
+from tests.test_api.v1.test_routes import RouteTestCase, storage
+
+
+class TestGroupDistribution(RouteTestCase):
+    """Check the merged score distribution of a group's quizzes"""
+
+    def setUp(self):
+        super().setUp()
+        for quiz_id in self.quiz_ids:
+            self.add_questions(quiz_id)
+        self.login(1)
+        for quiz_id, options in zip(self.quiz_ids, ([[0], [1], [2]], [[0], [0], [0]])):
+            self.assertEqual(self.submit(quiz_id, options).status_code, 200)
+        response = self.client.post(
+            "/api/v1/test/add_quizzes",
+            json={
+                "user_id": self.user_ids[0],
+                "group_id": self.group_ids[0],
+                "body": [{"quiz_id": quiz_id} for quiz_id in self.quiz_ids],
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        self.login(0)
+
+    def url(self, i=0):
+        return f"/api/v1/group/{self.group_ids[i]}/stats/distribution"
+
+    def set_distribution(self, blob):
+        with storage.transaction() as session:
+            session.execute(
+                QuizStats.__table__.update()
+                .where(QuizStats.quiz_id == self.quiz_ids[1])
+                .values(distribution=blob)
+            )
+
+    def test_merged(self):
+        """the attempts of every quiz of the group are merged"""
+        response = self.client.get(self.url())
+        self.assertEqual(response.status_code, 200, response.json)
+        self.assertEqual(response.json["quizzes"], 2)
+        self.assertEqual(response.json["attempts"], 2)
+        self.assertEqual(response.json["points"], 6)
+        self.assertEqual(sum(b["count"] for b in response.json["histogram"]), 2)
+
+    def test_empty_and_missing(self):
+        """a group without attempts is empty, an unknown group 404"""
+        response = self.client.get(self.url(1))
+        self.assertEqual(response.status_code, 200, response.json)
+        self.assertEqual((response.json["quizzes"], response.json["attempts"]), (0, 0))
+        response = self.client.get("/api/v1/group/404/stats/distribution")
+        self.assertEqual(response.status_code, 404)
+
+    def test_bin_mismatch(self):
+        """quizzes sketched with other bins give 422"""
+        self.set_distribution(ScoreDistribution(bins=4, points=6).dumps())
+        self.assertEqual(self.client.get(self.url()).status_code, 422)
+
+    def test_corrupt_blob(self):
+        """a corrupt distribution is a server error, not a bad request"""
+        self.set_distribution(b"\0" * 64)
+        self.assertEqual(self.client.get(self.url()).status_code, 500)
+
+
+if __name__ == "__main__":
+    unittest.main()
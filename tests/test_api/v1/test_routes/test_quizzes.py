@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Tests for the quiz routes
+"""
+import unittest
+
+from parameterized import parameterized
+
+from tests.test_api.v1.test_routes import RouteTestCase
+
+
+class TestQuizKeysetPagination(RouteTestCase):
+    """Check the cursor pages of the public quiz listing"""
+
+    quizzes = 5
+
+    def page(self, **body):
+        response = self.client.get("/api/v1/quiz", json={"page_size": 2, **body})
+        self.assertEqual(response.status_code, 200, response.json)
+        return response.json
+
+    @parameterized.expand([("title",), ("category",), ("difficulty",)])
+    def test_round_trip(self, sort_by):
+        """following the cursors lists every quiz once, ties broken by id"""
+        ids, cursor, pages = [], "", 0
+        while cursor is not None:
+            page = self.page(cursor=cursor, sort_by=sort_by)
+            self.assertLessEqual(len(page["quizzes"]), 2)
+            self.assertNotIn("total_quizzes", page)
+            ids += [q["quiz_id"] for q in page["quizzes"]]
+            cursor, pages = page["next_cursor"], pages + 1
+        self.assertEqual(pages, 3)
+        # every quiz has the same category and difficulty
+        self.assertEqual(ids, sorted(self.quiz_ids))
+
+    def test_with_total(self):
+        """the total is only counted when asked for"""
+        page = self.page(cursor="", with_total=True)
+        self.assertEqual((page["total_quizzes"], page["total_pages"]), (5, 3))
+
+    @parameterized.expand([("not_base64", "%%%"), ("wrong_length", "WzFd")])
+    def test_bad_cursor(self, name, cursor):
+        """an undecodable cursor gives 422"""
+        response = self.client.get("/api/v1/quiz", json={"cursor": cursor})
+        self.assertEqual(response.status_code, 422)
+        self.assertIn("cursor", response.json["error"])
+
+
+class TestQuizOneGetter(RouteTestCase):
+    """Check the async view serving a quiz's questions"""
+
+    def test_questions(self):
+        """the questions of a public quiz are served without answers"""
+        self.add_questions(self.quiz_ids[0], n=2, options=2)
+        for _ in range(2):
+            response = self.client.get(f"/api/v1/quiz/{self.quiz_ids[0]}")
+            self.assertEqual(response.status_code, 200, response.json)
+            self.assertEqual(
+                response.json["questions"],
+                [
+                    {
+                        "statement": f"q{i}",
+                        "points": 2,
+                        "type": "SCQ",
+                        "options": ["o0", "o1"],
+                    }
+                    for i in range(2)
+                ],
+            )
+
+    def test_missing(self):
+        """unknown quizzes give 404"""
+        self.assertEqual(self.client.get("/api/v1/quiz/404").status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""Tests for the user profile routes
+"""
+import unittest
+
+from parameterized import parameterized
+
+from models import QuizStats
+from tests.test_api.v1.test_routes import RouteTestCase, storage
+
+
+class TestAttemptSubmission(RouteTestCase):
+    """Check the grading of submitted attempts"""
+
+    def setUp(self):
+        super().setUp()
+        self.add_questions(self.quiz_ids[0])
+        self.login(1)
+
+    def test_full_score(self):
+        """an attempt choosing every correct option gets the full score"""
+        response = self.submit(self.quiz_ids[0], [[0], [1], [2]])
+        self.assertEqual(response.status_code, 200, response.json)
+        self.assertEqual(response.json["score"], 6)
+
+    def test_stats_count_users_once(self):
+        """repeated attempts of a user count one user in the quiz stats"""
+        for user in (1, 1, 2):
+            self.login(user)
+            self.assertEqual(
+                self.submit(self.quiz_ids[0], [[0], [1], [0]]).status_code, 200
+            )
+        storage.close()
+        stats = storage.search(QuizStats, quiz_id=self.quiz_ids[0])[0]
+        self.assertEqual((stats.attempts, stats.users, stats.score_sum), (3, 2, 12))
+        with storage.transaction() as session:
+            QuizStats.rebuild(session, self.quiz_ids[0])
+        storage.close()
+        stats = storage.search(QuizStats, quiz_id=self.quiz_ids[0])[0]
+        self.assertEqual((stats.attempts, stats.users, stats.score_sum), (3, 2, 12))
+
+    @parameterized.expand([("past_options", 3), ("huge", 10**9), ("negative", -1)])
+    def test_out_of_range_order(self, name, order):
+        """an order outside the options of a question is a wrong answer"""
+        response = self.submit(self.quiz_ids[0], [[0], [1], [order]])
+        self.assertEqual(response.status_code, 200, response.json)
+        self.assertEqual(response.json["score"], 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Tests for the user quiz routes
+"""
+import unittest
+
+from models import Question, Quiz, QuizAttempt
+from models.engine.instrumentation import collect_queries
+from tests.test_api.v1.test_routes import RouteTestCase, app, leaderboard, storage
+
+
+class TestQuestionWrites(RouteTestCase):
+    """Check the question PUT and DELETE routes"""
+
+    def setUp(self):
+        super().setUp()
+        self.quiz_id = self.quiz_ids[0]
+        self.question_ids = self.add_questions(self.quiz_id)
+        self.login(1)
+        self.assertEqual(self.submit(self.quiz_id, [[0], [1], [2]]).json["score"], 6)
+        self.login(0)
+
+    def url(self):
+        return f"/api/v1/user/quiz/{self.quiz_id}/question"
+
+    def score(self):
+        storage.close()
+        return storage.query(QuizAttempt.score).scalar()
+
+    def test_put_leaves_regrade_to_command(self):
+        """a new answer key keeps stored scores until regrade-quiz runs"""
+        questions = [{"question_id": id} for id in self.question_ids]
+        questions[0]["correct_answer"] = [1]
+        response = self.client.put(self.url(), json={"questions": questions})
+        self.assertEqual(response.status_code, 200, response.json)
+        self.assertEqual(self.score(), 6)
+
+        self.assertEqual(leaderboard.score(self.user_ids[1]), 6)
+        result = app.test_cli_runner().invoke(args=["regrade-quiz", str(self.quiz_id)])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("1 changed score", result.output)
+        self.assertEqual(self.score(), 4)
+        self.assertEqual(leaderboard.score(self.user_ids[1]), 4)
+
+    def version(self):
+        storage.close()
+        return storage.get(Quiz, self.quiz_id).content_version
+
+    def test_put_text_keeps_answer_key(self):
+        """text edits leave the answer key version, key edits bump it"""
+        version = self.version()
+        questions = [{"question_id": id} for id in self.question_ids]
+        questions[0]["statement"] = "reworded"
+        questions[1]["options"] = ["x", "y", "z"]
+        response = self.client.put(self.url(), json={"questions": questions})
+        self.assertEqual(response.status_code, 200, response.json)
+        self.assertEqual(self.version(), version)
+        questions.reverse()
+        response = self.client.put(self.url(), json={"questions": questions})
+        self.assertEqual(response.status_code, 200, response.json)
+        self.assertEqual(self.version(), version + 1)
+
+    def test_put_removed_rescores(self):
+        """questions left out of the list are deleted and scores follow"""
+        questions = [{"question_id": id} for id in self.question_ids[1:]]
+        response = self.client.put(self.url(), json={"questions": questions})
+        self.assertEqual(response.status_code, 200, response.json)
+        self.assertEqual(self.score(), 4)
+        self.assertEqual(leaderboard.score(self.user_ids[1]), 4)
+
+    def test_too_many_options(self):
+        """questions over the option limit are refused when added or edited"""
+        question = {
+            "statement": "wide",
+            "points": 1,
+            "type": "SCQ",
+            "options": [f"o{j}" for j in range(65)],
+            "correct_answer": [64],
+        }
+        response = self.client.post(self.url(), json={"questions": [question]})
+        self.assertEqual(response.status_code, 422)
+        self.assertIn("options", response.json["error"])
+        question = {"question_id": self.question_ids[0], "options": question["options"]}
+        response = self.client.put(self.url(), json={"questions": [question]})
+        self.assertEqual(response.status_code, 422)
+        self.assertIn("options", response.json["error"])
+
+    def test_delete(self):
+        """listed questions are removed and stored attempts rescored"""
+        response = self.client.delete(
+            self.url(), json={"questions": [{"question_id": self.question_ids[0]}]}
+        )
+        self.assertEqual(response.status_code, 204)
+        storage.close()
+        self.assertEqual(
+            storage.query(Question.id).filter_by(quiz_id=self.quiz_id).count(), 2
+        )
+        self.assertEqual(self.score(), 4)
+        self.assertEqual(leaderboard.score(self.user_ids[1]), 4)
+
+    def test_delete_nothing(self):
+        """an empty list returns without locking or touching the quiz"""
+        with collect_queries() as stats:
+            response = self.client.delete(self.url(), json={"questions": []})
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(
+            [s for s in stats.statements if "FOR UPDATE" in s or "UPDATE quiz" in s]
+        )
+
+    def test_delete_unknown(self):
+        """unknown question ids give 404"""
+        response = self.client.delete(
+            self.url(), json={"questions": [{"question_id": 404}]}
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""Tests for the AsyncRelationalStorage engine
+"""
+import os
+import tempfile
+import unittest
+
+import sqlalchemy as sa
+
+from models import User
+from models.engine.async_relational_storage import (
+    AsyncRelationalStorage,
+    async_database_url,
+)
+
+
+class TestAsyncRelationalStorage(unittest.TestCase):
+    """Tests for the asyncio storage on a SQLite file"""
+
+    def setUp(self):
+        path = os.path.join(tempfile.mkdtemp(), "async.db")
+        self.storage = AsyncRelationalStorage(f"sqlite:///{path}")
+        self.connects = []
+        sa.event.listen(
+            self.storage._engine.sync_engine, "connect", self.record_connect
+        )
+        self.storage.run(self.storage.reload(reset=True))
+
+    def tearDown(self):
+        self.storage.run(self.storage.dispose())
+
+    def record_connect(self, dbapi_connection, connection_record):
+        self.connects.append(connection_record)
+
+    def view(self, coroutine_function):
+        """run a coroutine function the way async views do"""
+
+        async def run():
+            try:
+                return await coroutine_function()
+            finally:
+                await self.storage.close()
+
+        return self.storage.run(run())
+
+    def user(self, i):
+        return User(email=f"u{i}@x.com", password=b"pw", user_name=f"user{i}")
+
+    def test_driver(self):
+        """urls get the asyncio driver of their database"""
+        self.assertEqual(
+            async_database_url("sqlite:///x.db").drivername, "sqlite+aiosqlite"
+        )
+        self.assertEqual(
+            async_database_url("mysql+mysqldb://u@h/db").drivername, "mysql+aiomysql"
+        )
+
+    def test_crud(self):
+        """objects are saved, read, counted and deleted from coroutines"""
+
+        async def create():
+            self.storage.new(self.user(0))
+            await self.storage.save()
+
+        async def read():
+            users = await self.storage.search(User, user_name="user0")
+            user = await self.storage.get(User, users[0].id)
+            return user.email, await self.storage.count(User)
+
+        async def delete():
+            user = (await self.storage.search(User))[0]
+            await self.storage.delete(user)
+            await self.storage.save()
+            return await self.storage.count(User)
+
+        self.view(create)
+        self.assertEqual(self.view(read), ("u0@x.com", 1))
+        self.assertEqual(self.view(delete), 0)
+
+    def test_transaction(self):
+        """a failing unit of work writes nothing"""
+
+        async def failing():
+            async with self.storage.transaction():
+                self.storage.new(self.user(0))
+                await self.storage.save()
+                raise RuntimeError
+
+        async def passing():
+            async with self.storage.transaction():
+                self.storage.new(self.user(1))
+                await self.storage.save()
+            return await self.storage.count(User)
+
+        with self.assertRaises(RuntimeError):
+            self.view(failing)
+        self.assertEqual(self.view(passing), 1)
+
+    def test_writes_reported_at_commit(self):
+        """write listeners hear of a table once its write commits, not
+        before, and never for a rolled back write"""
+        written = []
+        self.storage.add_write_listener(written.append)
+
+        async def write(fail):
+            async with self.storage.transaction():
+                self.storage.new(self.user(len(written)))
+                await self.storage.save()
+                self.assertEqual(written, [])
+                if fail:
+                    raise RuntimeError
+
+        with self.assertRaises(RuntimeError):
+            self.view(lambda: write(True))
+        self.assertEqual(written, [])
+        self.view(lambda: write(False))
+        self.assertEqual(written, [["user"]])
+
+    def test_pooled_connection(self):
+        """successive views reuse a pooled connection"""
+
+        async def count():
+            return await self.storage.count(User)
+
+        for _ in range(5):
+            self.assertEqual(self.view(count), 0)
+        self.assertEqual(len(self.connects), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
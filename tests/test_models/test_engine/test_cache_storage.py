@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""Tests for the CacheStorage engine
+"""
+import os
+import tempfile
+import unittest
+from threading import Thread
+from time import sleep
+from unittest import mock
+
+import sqlalchemy as sa
+
+from models import Quiz, User
+from models.engine.cache_storage import (
+    CacheStorage,
+    MemoryCacheBackend,
+    RedisCacheBackend,
+)
+from models.engine.relational_storage import RelationalStorage
+
+
+class FakeRedis:
+    """local stand-in for the few Redis commands the cache uses"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+        return self.data[key]
+
+    def scan_iter(self, pattern):
+        return [k for k in self.data if k.startswith(pattern.rstrip("*"))]
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+
+class TestMemoryCacheBackend(unittest.TestCase):
+    """Tests for the in-process cache backend"""
+
+    def test_lru_eviction(self):
+        """the least recently used entry is evicted first"""
+        backend = MemoryCacheBackend(max_entries=2)
+        backend.set("a", 1, 60)
+        backend.set("b", 2, 60)
+        backend.get("a")
+        backend.set("c", 3, 60)
+        self.assertEqual(backend.get("a"), 1)
+        self.assertIsNone(backend.get("b"))
+        self.assertEqual(backend.get("c"), 3)
+
+    def test_ttl_expiry(self):
+        """entries are dropped once their time to live has passed"""
+        backend = MemoryCacheBackend()
+        backend.set("a", 1, 0.01)
+        sleep(0.02)
+        self.assertIsNone(backend.get("a"))
+
+    def test_generations(self):
+        """bumping a table moves it to a new generation"""
+        backend = MemoryCacheBackend()
+        self.assertEqual(backend.generation("user"), 0)
+        backend.bump("user")
+        self.assertEqual(backend.generation("user"), 1)
+
+
+class TestCacheStorage(unittest.TestCase):
+    """Tests for the read-through cache in front of RelationalStorage"""
+
+    backend_class = MemoryCacheBackend
+
+    def setUp(self):
+        self.db = RelationalStorage("sqlite:///:memory:")
+        self.db.reload(reset=True)
+        if self.backend_class is RedisCacheBackend:
+            backend = RedisCacheBackend(FakeRedis())
+        else:
+            backend = MemoryCacheBackend()
+        self.storage = CacheStorage(self.db, backend)
+        self.user = self.storage.new(
+            User(email="cache@test.com", password=b"pwd", user_name="cache")
+        )
+        self.storage.save()
+        self.statements = []
+        sa.event.listen(self.db._engine, "before_cursor_execute", self.record)
+
+    def tearDown(self):
+        sa.event.remove(self.db._engine, "before_cursor_execute", self.record)
+        self.db.close()
+
+    def record(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def test_get_is_served_from_cache(self):
+        """a second lookup of the same id runs no query"""
+        self.storage.get(User, self.user.id)
+        self.db.close()
+        self.statements.clear()
+        user = self.storage.get(User, self.user.id)
+        self.assertEqual(user.user_name, "cache")
+        self.assertEqual(self.statements, [])
+
+    def test_write_invalidates(self):
+        """writing to a table drops its cached entries"""
+        self.storage.get(User, self.user.id)
+        self.user.user_name = "renamed"
+        self.storage.save()
+        self.db.close()
+        self.statements.clear()
+        self.assertEqual(self.storage.get(User, self.user.id).user_name, "renamed")
+        self.assertEqual(len(self.statements), 1)
+
+    def test_search_and_count(self):
+        """searches and counts are cached until their table is written"""
+        self.assertEqual(len(self.storage.search(User, user_name="cache")), 1)
+        self.assertEqual(self.storage.count(User), 1)
+        self.statements.clear()
+        self.assertEqual(len(self.storage.search(User, user_name="cache")), 1)
+        self.assertEqual(self.storage.count(User), 1)
+        self.assertEqual(self.statements, [])
+
+        self.storage.new(User(email="b@test.com", password=b"pwd", user_name="b"))
+        self.storage.save()
+        self.assertEqual(self.storage.count(User), 2)
+        self.assertEqual(self.storage.count(Quiz), 0)
+
+    def test_missing_object(self):
+        """looking up a missing id returns None"""
+        self.assertIsNone(self.storage.get(User, 404))
+
+    def test_keeps_pending_changes(self):
+        """a cached hit does not overwrite an instance changed in the session"""
+        self.storage.get(User, self.user.id)
+        self.user.user_name = "pending"
+        self.assertIs(self.storage.get(User, self.user.id), self.user)
+        self.assertEqual(self.user.user_name, "pending")
+
+    def test_invalidates_on_commit(self):
+        """tables are bumped once their writes commit, and not on rollback"""
+        generation = self.storage._backend.generation("user")
+        with self.db.transaction():
+            self.user.user_name = "renamed"
+            self.storage.save()
+            self.assertEqual(self.storage._backend.generation("user"), generation)
+        self.assertEqual(self.storage._backend.generation("user"), generation + 1)
+        with self.assertRaises(RuntimeError):
+            with self.db.transaction():
+                self.user.user_name = "rolled back"
+                self.storage.save()
+                raise RuntimeError
+        self.assertEqual(self.storage._backend.generation("user"), generation + 1)
+
+
+class TestRedisCacheStorage(TestCacheStorage):
+    """Tests for the read-through cache backed by Redis"""
+
+    backend_class = RedisCacheBackend
+
+
+class TestConcurrentReader(unittest.TestCase):
+    """Tests for a read racing with a write on another connection"""
+
+    def setUp(self):
+        path = os.path.join(tempfile.mkdtemp(), "cache.db")
+        self.db = RelationalStorage(f"sqlite:///{path}", sqlite_profile="default")
+        self.db.reload(reset=True)
+        self.storage = CacheStorage(self.db, MemoryCacheBackend())
+        self.user = self.storage.new(
+            User(email="cache@test.com", password=b"pwd", user_name="cache")
+        )
+        self.storage.save()
+
+    def tearDown(self):
+        self.db.dispose()
+
+    def read_in_thread(self):
+        names = []
+
+        def read():
+            names.append(self.storage.get(User, self.user.id).user_name)
+            self.db.close()
+
+        reader = Thread(target=read)
+        reader.start()
+        reader.join()
+        return names[0]
+
+    def test_read_before_commit_is_not_kept(self):
+        """a row read while a write is pending is not served after its commit"""
+        with self.db.transaction():
+            self.user.user_name = "renamed"
+            self.storage.save()
+            self.assertEqual(self.read_in_thread(), "cache")
+        self.db.close()
+        self.assertEqual(self.read_in_thread(), "renamed")
+
+    def test_commit_between_read_and_store(self):
+        """a row read just before a commit is not cached under the
+        generation that commit starts"""
+        read = self.db.get
+
+        def get_then_commit(cls, id):
+            obj = read(cls, id)
+            # end the read transaction so the writer is not locked out
+            self.db.session.commit()
+            writer = Thread(target=self.rename)
+            writer.start()
+            writer.join()
+            return obj
+
+        with mock.patch.object(self.db, "get", get_then_commit):
+            self.assertEqual(self.read_in_thread(), "cache")
+        self.assertEqual(self.read_in_thread(), "renamed")
+
+    def rename(self):
+        user = self.db.session.get(User, self.user.id)
+        user.user_name = "renamed"
+        self.db.save()
+        self.db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
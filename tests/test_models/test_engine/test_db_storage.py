@@ -0,0 +1,1518 @@
+#!/usr/bin/env python3
+"""Tests for the RelationalStorage engine
+"""
+import os
+import tempfile
+import threading
+import unittest
+import unittest.mock
+from datetime import datetime, timedelta
+from time import sleep
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+from parameterized import parameterized
+
+from models import (
+    Answer,
+    Group,
+    Ownership,
+    Question,
+    Quiz,
+    QuizAttempt,
+    QuizStats,
+    UserAnswer,
+    User,
+    UserSession,
+    UserStats,
+    group_user,
+)
+from models.engine.answer_keys import AnswerKeyCache
+from models.engine.autocomplete import Autocomplete, TrigramIndex
+from models.engine.count_cache import count_cache, count_rows
+from models.engine.instrumentation import collect_queries, query_budget
+from models.engine.question_stats import QuestionStatsCache
+from models.engine.question_bulk import (
+    delete_questions,
+    insert_questions,
+    merge_questions,
+    next_order,
+    question_error,
+    replace_questions,
+)
+from models.engine.quiz_content import load_quiz_content
+from models.engine.leaderboard import (
+    Leaderboard,
+    MemoryLeaderboardBackend,
+    RedisLeaderboardBackend,
+)
+from models.engine.regrade import regrade_quiz
+from models.base import Base
+from models.engine.relational_storage import (
+    RelationalStorage,
+    schema_fingerprint,
+    schema_meta,
+)
+from models.engine.score_sketch import (
+    KLLSketch,
+    ScoreDistribution,
+    merge_distributions,
+)
+from models.engine.search import search_quizzes
+
+
+class TestHotQueryIndexes(unittest.TestCase):
+    """Check that the hot route queries are served by an index"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.storage = RelationalStorage("sqlite:///:memory:")
+        cls.storage.reload(reset=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.storage.close()
+
+    @parameterized.expand(
+        [
+            (
+                "quiz_getter",
+                lambda s: s.query(Quiz).filter(Quiz.group_id == 1).order_by(Quiz.title),
+                "ix_quiz_group_id_title",
+            ),
+            (
+                "quiz_getter_public",
+                lambda s: s.query(Quiz)
+                .filter(Quiz.group_id == None)
+                .order_by(Quiz.title),
+                "ix_quiz_group_id_title",
+            ),
+            (
+                "user_quiz_getter",
+                lambda s: s.query(Quiz).filter(Quiz.user_id == 1).order_by(Quiz.title),
+                "ix_quiz_user_id_title",
+            ),
+            (
+                "quiz_title_duplicate",
+                lambda s: s.query(Quiz).filter(Quiz.title == "title"),
+                "ix_quiz_title",
+            ),
+            (
+                "quiz_questions",
+                lambda s: s.query(Question)
+                .where(Question.quiz_id == 1)
+                .order_by(Question.order),
+                "ix_question_quiz_id_order",
+            ),
+            (
+                "question_answers",
+                lambda s: s.query(Answer).where(Answer.question_id == 1),
+                "ix_answer_question_id_order",
+            ),
+            (
+                "user_attempts",
+                lambda s: s.query(QuizAttempt)
+                .filter_by(quiz_id=1, user_id=1)
+                .order_by(QuizAttempt.created_at),
+                "ix_quiz_attempt_quiz_id_user_id_created_at",
+            ),
+            (
+                "quiz_attempts",
+                lambda s: s.query(QuizAttempt).where(QuizAttempt.quiz_id == 1),
+                "ix_quiz_attempt_quiz_id_user_id_created_at",
+            ),
+            (
+                "user_scores",
+                lambda s: s.query(QuizAttempt.quiz_id, QuizAttempt.score).where(
+                    QuizAttempt.user_id == 1
+                ),
+                "ix_quiz_attempt_user_id_quiz_id_score",
+            ),
+            (
+                "attempt_answers",
+                lambda s: s.query(UserAnswer).where(UserAnswer.attempt_id == 1),
+                "ix_user_answer_attempt_id",
+            ),
+            (
+                "question_user_answers",
+                lambda s: s.query(UserAnswer.answer).where(UserAnswer.question_id == 1),
+                "ix_user_answer_question_id_attempt_id_answer",
+            ),
+            (
+                "question_answers_since",
+                lambda s: s.query(UserAnswer.answer).where(
+                    UserAnswer.question_id == 1, UserAnswer.attempt_id > 10
+                ),
+                "ix_user_answer_question_id_attempt_id_answer"
+                " (question_id=? AND attempt_id>?)",
+            ),
+            (
+                "user_ownerships",
+                lambda s: s.query(Ownership).where(Ownership.user_id == 1),
+                "ix_ownership_user_id",
+            ),
+            (
+                "ownership_groups",
+                lambda s: s.query(Group).where(Group.ownership_id == 1),
+                "ix_group_ownership_id",
+            ),
+            (
+                "group_title_duplicate",
+                lambda s: s.query(Group).filter_by(title="title"),
+                "ix_group_title",
+            ),
+            (
+                "user_subscriptions",
+                lambda s: s.query(group_user).filter(group_user.c.user_id == 1),
+                "ix_group_user_user_id",
+            ),
+            (
+                "expired_sessions",
+                lambda s: s.query(UserSession).where(
+                    UserSession.expiry_date < datetime(2024, 1, 1)
+                ),
+                "ix_user_session_expiry_date",
+            ),
+            (
+                "user_sessions",
+                lambda s: s.query(UserSession).where(UserSession.user_id == 1),
+                "ix_user_session_user_id",
+            ),
+        ]
+    )
+    def test_query_uses_index(self, name, build, index):
+        """the query plan of a hot query goes through its index"""
+        plan = self.storage.explain(build(self.storage))
+        self.assertTrue(any(index in step for step in plan), plan)
+
+
+class TestSchemaBootstrap(unittest.TestCase):
+    """Check the schema bootstrap of an existing database"""
+
+    def setUp(self):
+        path = os.path.join(tempfile.mkdtemp(), "schema.db")
+        self.storage = RelationalStorage(f"sqlite:///{path}")
+        self.storage.reload(reset=True)
+
+    def tearDown(self):
+        self.storage.dispose()
+
+    def ddl(self, reset=False):
+        """reload the schema, returning whether it ran DDL and the DDL run"""
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            if statement.lstrip().split()[0] in ("CREATE", "DROP", "ALTER"):
+                statements.append(statement)
+
+        sa.event.listen(self.storage._engine, "before_cursor_execute", record)
+        try:
+            ran = self.storage.reload(reset)
+        finally:
+            sa.event.remove(self.storage._engine, "before_cursor_execute", record)
+        return ran, statements
+
+    def stored_fingerprint(self):
+        with self.storage._engine.connect() as conn:
+            return conn.execute(
+                sa.select(schema_meta.c.value).where(schema_meta.c.key == "fingerprint")
+            ).scalar()
+
+    def test_fingerprint(self):
+        """the fingerprint follows the tables, indexes and extra DDL"""
+        fingerprint = schema_fingerprint(Base.metadata)
+        self.assertEqual(schema_fingerprint(Base.metadata), fingerprint)
+        self.assertNotEqual(
+            schema_fingerprint(Base.metadata, ["CREATE TABLE t (a)"]), fingerprint
+        )
+        index = sa.Index("ix_quiz_category", Quiz.__table__.c.category)
+        self.addCleanup(Quiz.__table__.indexes.discard, index)
+        self.assertNotEqual(schema_fingerprint(Base.metadata), fingerprint)
+
+    def test_unchanged_schema_skips_ddl(self):
+        """a reload over a current schema runs no DDL and keeps the data"""
+        self.storage.new(User(email="u@x.com", password=b"pw", user_name="u"))
+        self.storage.save()
+        fingerprint = self.stored_fingerprint()
+        self.assertEqual(len(fingerprint), 64)
+        self.assertEqual(self.ddl(), (False, []))
+        self.assertEqual(self.stored_fingerprint(), fingerprint)
+        self.assertEqual(self.storage.count(User), 1)
+
+    def test_new_index_created(self):
+        """an index added to a model is created on the existing database"""
+        self.storage.new(User(email="u@x.com", password=b"pw", user_name="u"))
+        self.storage.save()
+        fingerprint = self.stored_fingerprint()
+        index = sa.Index("ix_quiz_category", Quiz.__table__.c.category)
+        self.addCleanup(Quiz.__table__.indexes.discard, index)
+        ran, statements = self.ddl()
+        self.assertTrue(ran)
+        self.assertEqual(
+            [s for s in statements if s.startswith("CREATE INDEX")],
+            ["CREATE INDEX ix_quiz_category ON quiz (category)"],
+        )
+        self.assertNotEqual(self.stored_fingerprint(), fingerprint)
+        names = [
+            i["name"] for i in sa.inspect(self.storage._engine).get_indexes("quiz")
+        ]
+        self.assertIn("ix_quiz_category", names)
+        self.assertEqual(self.storage.count(User), 1)
+
+    def test_reset(self):
+        """a reset drops the data and rebuilds the schema"""
+        self.storage.new(User(email="u@x.com", password=b"pw", user_name="u"))
+        self.storage.save()
+        ran, statements = self.ddl(reset=True)
+        self.assertTrue(ran)
+        self.assertTrue(any(s.startswith("DROP TABLE") for s in statements))
+        self.assertEqual(self.storage.count(User), 0)
+        self.assertEqual(self.ddl(), (False, []))
+
+    def test_stale_index_dropped(self):
+        """an ix_ index the models no longer declare is dropped"""
+        with self.storage._engine.begin() as conn:
+            conn.execute(
+                sa.text(
+                    "CREATE INDEX ix_user_answer_question_id_answer"
+                    " ON user_answer (question_id, answer)"
+                )
+            )
+            conn.execute(schema_meta.delete())
+        self.storage.close()
+        self.storage.reload()
+        indexes = sa.inspect(self.storage._engine).get_indexes("user_answer")
+        self.assertEqual(
+            sorted(i["name"] for i in indexes),
+            [
+                "ix_user_answer_attempt_id",
+                "ix_user_answer_question_id_attempt_id_answer",
+            ],
+        )
+
+    def test_missing_column_added(self):
+        """a column added to a model is added to its existing table"""
+        with self.storage._engine.begin() as conn:
+            conn.execute(sa.text("ALTER TABLE quiz DROP COLUMN content_version"))
+            conn.execute(schema_meta.delete())
+        self.storage.close()
+        self.storage.reload()
+        columns = sa.inspect(self.storage._engine).get_columns("quiz")
+        self.assertIn("content_version", [c["name"] for c in columns])
+
+
+class TestQueryInstrumentation(unittest.TestCase):
+    """Check the per-block SQL statistics and N+1 detection"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.storage = RelationalStorage("sqlite:///:memory:")
+        cls.storage.reload(reset=True)
+        for i in range(6):
+            user = cls.storage.new(
+                User(email=f"u{i}@x.com", password=b"pw", user_name=f"user{i}")
+            )
+            cls.storage.save()
+            cls.storage.new(Ownership(user_id=user.id))
+        cls.storage.save()
+        cls.storage.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.storage.close()
+
+    def tearDown(self):
+        self.storage.close()
+
+    def test_counts_and_times_queries(self):
+        """every statement of the block is counted and timed"""
+        with collect_queries() as stats:
+            self.storage.query(User).all()
+            self.storage.query(Ownership).count()
+        self.assertEqual(stats.count, 2)
+        self.assertGreater(stats.total_time, 0)
+        self.assertEqual(len(stats.slowest), 2)
+        self.assertEqual(stats.n_plus_one, [])
+
+    def test_detects_n_plus_one(self):
+        """lazy loading a relationship per row is flagged"""
+        with collect_queries() as stats:
+            for ownership in self.storage.query(Ownership).all():
+                ownership.user.user_name
+        self.assertEqual(stats.count, 7)
+        self.assertEqual(len(stats.n_plus_one), 1)
+        self.assertEqual(stats.n_plus_one[0][1], 6)
+
+    def test_nested_blocks_report_to_outer_ones(self):
+        """statements of an inner block also count in the outer one"""
+        with collect_queries() as outer:
+            self.storage.query(User).all()
+            with collect_queries() as inner:
+                self.storage.query(Ownership).all()
+        self.assertEqual((outer.count, inner.count), (2, 1))
+
+    def test_query_budget(self):
+        """a block going over its budget or running N+1 queries fails"""
+        with query_budget(1):
+            self.storage.query(User).all()
+        with self.assertRaises(AssertionError):
+            with query_budget(1):
+                self.storage.query(User).all()
+                self.storage.query(Ownership).all()
+        with self.assertRaises(AssertionError):
+            with query_budget(10):
+                for ownership in self.storage.query(Ownership).all():
+                    ownership.user.user_name
+
+
+class TestCountRows(unittest.TestCase):
+    """Check the exact, cached and estimated listing counts"""
+
+    def setUp(self):
+        count_cache.clear()
+        self.storage = RelationalStorage("sqlite:///:memory:")
+        self.storage.reload(reset=True)
+        self.add_users(0, 4)
+        self.storage.session.execute(sa.text("ANALYZE"))
+        self.add_users(4, 6)
+
+    def tearDown(self):
+        self.storage.close()
+
+    def add_users(self, start, stop):
+        for i in range(start, stop):
+            self.storage.new(
+                User(
+                    email=f"u{i}@x.com",
+                    password=b"pw",
+                    user_name=f"u{i}",
+                    first_name=f"f{i % 2}",
+                )
+            )
+        self.storage.save()
+
+    def test_exact_by_default(self):
+        """without QQ_COUNT_MODE counts run COUNT(*) and cache nothing"""
+        with unittest.mock.patch.dict(os.environ):
+            os.environ.pop("QQ_COUNT_MODE", None)
+            self.assertEqual(count_rows(self.storage.query(User)), (6, False))
+        self.assertEqual(len(count_cache._entries), 0)
+
+    def test_estimated_unfiltered_only(self):
+        """only unfiltered single-table counts come from the statistics"""
+        query = self.storage.query(User)
+        self.assertEqual(count_rows(query, "estimated"), (4, True))
+        filtered = query.filter(User.first_name == "f1")
+        self.assertEqual(count_rows(filtered, "estimated"), (3, False))
+        joined = query.join(Quiz, Quiz.user_id == User.id)
+        self.assertEqual(count_rows(joined, "estimated"), (0, False))
+
+    def test_cached_until_commit(self):
+        """cached counts are dropped when a write commits, not on rollback"""
+        query = self.storage.query(User)
+        self.assertEqual(count_rows(query, "cached"), (6, False))
+        with self.assertRaises(RuntimeError):
+            with self.storage.transaction():
+                self.add_users(6, 7)
+                raise RuntimeError
+        self.assertEqual(count_rows(query, "cached"), (6, False))
+        with self.storage.transaction():
+            self.add_users(7, 8)
+            self.assertEqual(count_rows(query, "cached"), (6, False))
+        self.assertEqual(count_rows(query, "cached"), (7, False))
+
+
+class TestReplicaRouting(unittest.TestCase):
+    """Check the reads of read-only sessions on two SQLite replicas"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        urls = [f"sqlite:///{os.path.join(directory, n)}.db" for n in "pab"]
+        # each database holds one user, named after it
+        for url, name in zip(urls, "pab"):
+            storage = RelationalStorage(url, replicas=[])
+            storage.reload(reset=True)
+            storage.new(User(email=f"{name}@x.com", password=b"pw", user_name=name))
+            storage.save()
+            storage.dispose()
+        self.storage = RelationalStorage(urls[0], replicas=urls[1:])
+
+    def tearDown(self):
+        self.storage.dispose()
+
+    def name(self):
+        return self.storage.query(User.user_name).order_by(User.id).limit(1).scalar()
+
+    def test_one_replica_per_session(self):
+        """a session keeps the replica of its first read until closed"""
+        seen = set()
+        for _ in range(40):
+            self.storage.read_only()
+            names = {self.name() for _ in range(10)}
+            self.assertEqual(len(names), 1)
+            seen |= names
+            self.storage.close()
+        self.assertEqual(seen, {"a", "b"})
+
+    def test_writes_stick_to_primary(self):
+        """reads after a write go to the primary"""
+        self.storage.read_only()
+        self.assertIn(self.name(), ("a", "b"))
+        self.storage.new(User(email="c@x.com", password=b"pw", user_name="c"))
+        self.storage.save()
+        self.assertTrue(self.storage.has_written())
+        self.assertEqual(
+            self.storage.query(User.user_name).order_by(User.id).all(),
+            [("p",), ("c",)],
+        )
+        self.storage.close()
+        self.assertEqual(self.name(), "p")
+
+
+class TestGetMany(unittest.TestCase):
+    """Check the primary key lookups of RelationalStorage"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.storage = RelationalStorage("sqlite:///:memory:")
+        cls.storage.reload(reset=True)
+        cls.ids = []
+        for i in range(5):
+            user = cls.storage.new(
+                User(email=f"u{i}@x.com", password=b"pw", user_name=f"user{i}")
+            )
+            cls.storage.save()
+            cls.ids.append(user.id)
+        cls.storage.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.storage.close()
+
+    def tearDown(self):
+        self.storage.close()
+
+    def test_get(self):
+        """get returns the object of an id, or None"""
+        self.assertEqual(self.storage.get(User, self.ids[0]).user_name, "user0")
+        self.assertIsNone(self.storage.get(User, 999))
+        self.assertIsNone(self.storage.get(str, self.ids[0]))
+
+    def test_get_uses_identity_map(self):
+        """an object already in the session is returned without a query"""
+        user = self.storage.get(User, self.ids[0])
+        with collect_queries() as stats:
+            self.assertIs(self.storage.get(User, self.ids[0]), user)
+        self.assertEqual(stats.count, 0)
+
+    def test_get_many_keeps_input_order(self):
+        """objects come back in input order with None for misses"""
+        ids = [self.ids[3], 999, self.ids[0], self.ids[3]]
+        with collect_queries() as stats:
+            users = self.storage.get_many(User, ids)
+        self.assertEqual(stats.count, 1)
+        self.assertEqual(
+            [u.user_name if u else None for u in users],
+            ["user3", None, "user0", "user3"],
+        )
+
+    def test_get_many_chunks(self):
+        """ids missing from the session are loaded chunk_size at a time"""
+        loaded = self.storage.get(User, self.ids[0])
+        with collect_queries() as stats:
+            users = self.storage.get_many(User, self.ids, chunk_size=2)
+        self.assertEqual(stats.count, 2)
+        self.assertEqual([u.id for u in users], self.ids)
+        self.assertIs(users[0], loaded)
+
+
+class TestUserStats(unittest.TestCase):
+    """Check that the profile counters follow the writes"""
+
+    def setUp(self):
+        self.storage = RelationalStorage("sqlite:///:memory:")
+        self.storage.reload(reset=True)
+        self.users = []
+        for i in range(3):
+            self.users.append(
+                self.storage.new(
+                    User(email=f"u{i}@x.com", password=b"pw", user_name=f"user{i}")
+                )
+            )
+        self.storage.save()
+
+    def tearDown(self):
+        self.storage.close()
+
+    def counters(self):
+        """the stored counters of every user"""
+        return {
+            s.id: (
+                s.owned_groups,
+                s.created_quizzes,
+                s.subscribed_groups,
+                s.solved_quizzes,
+            )
+            for s in self.storage.query(UserStats).populate_existing()
+        }
+
+    def assertReconciled(self):
+        """the incremental counters match a full recomputation"""
+        incremental = {k: v for k, v in self.counters().items() if any(v)}
+        UserStats.reconcile(self.storage.session)
+        self.assertEqual(
+            incremental, {k: v for k, v in self.counters().items() if any(v)}
+        )
+
+    def test_counters_follow_writes(self):
+        """creating, solving, subscribing and deleting update the counters"""
+        owner, member, solver = self.users
+        ownership = self.storage.new(Ownership(user_id=owner.id))
+        self.storage.save()
+        group = self.storage.new(Group(title="g", ownership_id=ownership.id))
+        quiz = self.storage.new(
+            Quiz(title="q", category="c", difficulty=1, points=1, user_id=owner.id)
+        )
+        group.users.append(member)
+        self.storage.save()
+        quiz.group_id = group.id
+        self.storage.new(
+            QuizAttempt(score=1, full_score=True, quiz_id=quiz.id, user_id=solver.id)
+        )
+        self.storage.new(
+            QuizAttempt(score=1, full_score=True, quiz_id=quiz.id, user_id=solver.id)
+        )
+        self.storage.save()
+        self.assertEqual(self.counters()[owner.id], (1, 1, 0, 0))
+        self.assertEqual(self.counters()[member.id], (0, 0, 1, 0))
+        self.assertEqual(self.counters()[solver.id], (0, 0, 0, 1))
+        self.assertReconciled()
+
+        self.storage.delete(group)
+        self.storage.save()
+        self.assertEqual(self.counters()[owner.id], (0, 0, 0, 0))
+        self.assertEqual(self.counters()[member.id], (0, 0, 0, 0))
+        self.assertEqual(self.counters()[solver.id], (0, 0, 0, 0))
+        self.assertReconciled()
+
+    def test_reconcile_fixes_drift(self):
+        """reconcile rewrites counters that drifted"""
+        self.storage.new(
+            Quiz(title="q", category="c", difficulty=1, points=1, user_id=1)
+        )
+        self.storage.save()
+        self.storage.session.execute(
+            UserStats.__table__.update().values(created_quizzes=5)
+        )
+        UserStats.reconcile(self.storage.session, [1])
+        self.assertEqual(self.counters()[1], (0, 1, 0, 0))
+
+
+class TestFullTextSearch(unittest.TestCase):
+    """Check the FTS5 search over quizzes and their questions"""
+
+    def setUp(self):
+        self.storage = RelationalStorage("sqlite:///:memory:")
+        self.storage.reload(reset=True)
+        user = self.storage.new(User(email="u@x.com", password=b"pw", user_name="u"))
+        self.storage.save()
+        for title, category in [
+            ("Python basics", "programming"),
+            ("World capitals", "geography"),
+            ("Advanced python decorators", "programming"),
+        ]:
+            self.storage.new(
+                Quiz(
+                    title=title,
+                    category=category,
+                    difficulty=1,
+                    points=1,
+                    user_id=user.id,
+                )
+            )
+        self.storage.save()
+
+    def tearDown(self):
+        self.storage.close()
+
+    def search(self, text):
+        query = search_quizzes(self.storage.query(Quiz), text)
+        return [quiz.title for quiz in query.order_by(Quiz.id)]
+
+    def test_ranked_prefix_search(self):
+        """every word must match a word prefix, titles ranking first"""
+        self.assertEqual(
+            self.search("pyth"), ["Python basics", "Advanced python decorators"]
+        )
+        self.assertEqual(self.search("geo"), ["World capitals"])
+        self.assertEqual(
+            self.search("python decorators"), ["Advanced python decorators"]
+        )
+
+    def test_titles_rank_before_questions(self):
+        """a quiz matched by its title ranks before one only matched by a
+        question, however well that question scores in its own table"""
+        quiz = self.storage.search(Quiz, title="World capitals")[0]
+        # a word rare among many questions gets a high bm25 weight there
+        for order, statement in enumerate(["python"] + ["other"] * 20):
+            self.storage.new(
+                Question(
+                    statement=statement,
+                    quiz_id=quiz.id,
+                    points=1,
+                    type="SCQ",
+                    order=order,
+                )
+            )
+        self.storage.save()
+        query = search_quizzes(self.storage.query(Quiz), "python")
+        self.assertEqual([quiz.title for quiz in query][-1:], ["World capitals"])
+        self.assertEqual(len(query.all()), 3)
+
+    def test_follows_writes(self):
+        """updates, deletes and question statements are indexed"""
+        quiz = self.storage.search(Quiz, title="World capitals")[0]
+        self.storage.new(
+            Question(
+                statement="the python capital",
+                quiz_id=quiz.id,
+                points=1,
+                type="SCQ",
+                order=1,
+            )
+        )
+        quiz.title = "Capitals"
+        self.storage.save()
+        self.assertEqual(self.search("world"), [])
+        self.assertIn("Capitals", self.search("python"))
+        self.storage.delete(self.storage.search(Quiz, title="Python basics")[0])
+        self.storage.save()
+        self.assertEqual(self.search("basics"), [])
+
+    def test_rebuilds_existing_rows(self):
+        """an existing database gets its rows indexed on the next reload"""
+        with self.storage._engine.begin() as conn:
+            conn.exec_driver_sql("DROP TABLE quiz_fts")
+            conn.execute(schema_meta.delete())
+        self.storage.close()
+        self.storage.reload()
+        self.assertEqual(len(self.search("programming")), 2)
+
+
+class TestLeaderboard(unittest.TestCase):
+    """Check the rankings kept by the in-process leaderboard"""
+
+    def setUp(self):
+        self.storage = RelationalStorage("sqlite:///:memory:")
+        self.storage.reload(reset=True)
+        self.backend = MemoryLeaderboardBackend()
+        self.leaderboard = Leaderboard(self.backend, self.storage)
+        for window in ("all", "week"):
+            for group_id in (None, 1):
+                board = self.leaderboard.board(group_id, window)
+                self.backend.replace(board, {1: 5, 2: 9, 3: 5}, 0)
+
+    def tearDown(self):
+        self.storage.close()
+
+    def test_record_reorders(self):
+        """recorded attempts move users up the global and group boards"""
+        self.leaderboard.record(1, 3, 6, group_id=1)
+        self.assertEqual(self.leaderboard.top(3), [(3, 11), (2, 9), (1, 5)])
+        self.assertEqual(self.leaderboard.top(1, 1, group_id=1), [(2, 9)])
+        self.assertEqual(self.leaderboard.rank(1, window="week"), 3)
+        self.assertIsNone(self.leaderboard.rank(4))
+
+    @parameterized.expand(
+        [
+            (None, None, [(2, 9), (1, 5), (3, 5)]),
+            (5, 5, [(1, 5), (3, 5)]),
+            (6, None, [(2, 9)]),
+            (None, 4, []),
+        ]
+    )
+    def test_score_range(self, min_score, max_score, expected):
+        """score ranges are answered best first"""
+        self.assertEqual(self.leaderboard.between(min_score, max_score), expected)
+        self.assertEqual(self.leaderboard.count(min_score, max_score), len(expected))
+
+    def test_paginate(self):
+        """pages follow the format of paginate"""
+        page = self.leaderboard.paginate("users", 2, 2)
+        self.assertEqual(page["users"], [(3, 5)])
+        self.assertEqual(page["total_users"], 3)
+        self.assertEqual((page["prev"], page["next"], page["total_pages"]), (1, 2, 2))
+
+
+class TestLeaderboardVersion(unittest.TestCase):
+    """Check the boards are dropped by writes moving score totals"""
+
+    def setUp(self):
+        self.storage = RelationalStorage("sqlite:///:memory:")
+        self.storage.reload(reset=True)
+        users = [
+            self.storage.new(
+                User(email=f"u{i}@x.com", password=b"pw", user_name=f"u{i}")
+            )
+            for i in (0, 1)
+        ]
+        self.storage.save()
+        quiz = self.storage.new(
+            Quiz(title="q", category="c", difficulty=1, points=1, user_id=users[0].id)
+        )
+        self.storage.save()
+        self.attempts = [
+            self.storage.new(
+                QuizAttempt(
+                    score=score, full_score=False, quiz_id=quiz.id, user_id=u.id
+                )
+            )
+            for u, score in zip(users, (3, 5))
+        ]
+        self.storage.save()
+        self.user_ids = [u.id for u in users]
+        self.leaderboard = Leaderboard(
+            MemoryLeaderboardBackend(), self.storage, version_ttl=0
+        )
+        # a leaderboard of another process, only seeing the shared version
+        self.other = Leaderboard(MemoryLeaderboardBackend(), self.storage)
+
+    def tearDown(self):
+        self.storage.close()
+
+    def test_deleted_attempt(self):
+        """deleting an attempt drops the boards once committed"""
+        self.assertEqual(
+            self.leaderboard.top(2), [(self.user_ids[1], 5), (self.user_ids[0], 3)]
+        )
+        with self.assertRaises(RuntimeError):
+            with self.storage.transaction():
+                self.storage.delete(self.attempts[1])
+                self.storage.save()
+                raise RuntimeError
+        self.assertEqual(self.leaderboard.top(1), [(self.user_ids[1], 5)])
+        self.storage.delete(self.attempts[1])
+        self.storage.save()
+        self.assertEqual(self.leaderboard.top(2), [(self.user_ids[0], 3)])
+
+    def test_version_is_shared(self):
+        """a set-based write touched by one process reloads another's boards"""
+        self.assertEqual(self.leaderboard.score(self.user_ids[0]), 3)
+        with self.storage.transaction() as session:
+            session.execute(sa.update(QuizAttempt).values(score=QuizAttempt.score + 1))
+            self.other.touch(session)
+        self.assertEqual(self.leaderboard.score(self.user_ids[0]), 4)
+
+    def test_version_ttl(self):
+        """the shared version is checked at most every version_ttl seconds"""
+        self.leaderboard.version_ttl = 60
+        self.assertEqual(self.leaderboard.score(self.user_ids[0]), 3)
+        with self.storage.transaction() as session:
+            session.execute(sa.update(QuizAttempt).values(score=0))
+            self.other.touch(session)
+        self.assertEqual(self.leaderboard.score(self.user_ids[0]), 3)
+        self.leaderboard._checked -= 60
+        self.assertEqual(self.leaderboard.score(self.user_ids[0]), 0)
+
+    def attempt(self, user, score, **kwargs):
+        """commit an attempt of the i-th user, returning its id"""
+        attempt = self.storage.new(
+            QuizAttempt(
+                score=score,
+                full_score=False,
+                quiz_id=self.attempts[0].quiz_id,
+                user_id=self.user_ids[user],
+                **kwargs,
+            )
+        )
+        self.storage.save()
+        return attempt.id
+
+    def test_record_after_load(self):
+        """an attempt read by a board load is not added again when recorded,
+        a later one is added once however often it is recorded or synced"""
+        loaded = self.attempt(0, 2)
+        self.assertEqual(self.leaderboard.score(self.user_ids[0]), 5)
+        self.leaderboard.record(loaded, self.user_ids[0], 2)
+        self.assertEqual(self.leaderboard.score(self.user_ids[0]), 5)
+        later = self.attempt(0, 4)
+        for _ in range(2):
+            self.leaderboard.record(later, self.user_ids[0], 4)
+            self.assertEqual(self.leaderboard.score(self.user_ids[0]), 9)
+
+    def test_sync_other_processes(self):
+        """attempts graded by other processes are read at the next sync"""
+        self.leaderboard.version_ttl = 60
+        self.assertEqual(self.leaderboard.score(self.user_ids[1]), 5)
+        self.attempt(1, 4)
+        self.assertEqual(self.leaderboard.score(self.user_ids[1]), 5)
+        self.leaderboard._synced.clear()
+        self.assertEqual(self.leaderboard.score(self.user_ids[1]), 9)
+
+    def test_late_commit_below_watermark(self):
+        """an attempt committed after a load with a lower id than the
+        attempts already read is still counted, until it settles"""
+        self.attempt(0, 1, id=10)
+        self.assertEqual(self.leaderboard.score(self.user_ids[0]), 4)
+        self.attempt(0, 2, id=5)
+        self.assertEqual(self.leaderboard.score(self.user_ids[0]), 6)
+
+    def test_watermark_settles(self):
+        """the watermark moves up to the attempts older than the lag, and
+        the attempts below it are forgotten"""
+        backend = MemoryLeaderboardBackend()
+        leaderboard = Leaderboard(backend, self.storage, version_ttl=0, lag=0)
+        board = leaderboard.board()
+        self.assertEqual(leaderboard.score(self.user_ids[0]), 3)
+        self.assertEqual(backend.watermark(board), self.attempts[1].id)
+        recent = self.attempt(0, 1, created_at=datetime.utcnow() + timedelta(1))
+        self.assertEqual(leaderboard.score(self.user_ids[0]), 4)
+        self.assertEqual(backend.watermark(board), self.attempts[1].id)
+        self.assertEqual(backend._applied[board], {recent})
+        self.assertFalse(backend.apply(board, self.attempts[0].id, 1, 100))
+
+    def test_week_boards_expire(self):
+        """weekly boards are dropped once past their time to live"""
+        backend = MemoryLeaderboardBackend()
+        backend.replace("week", {1: 1}, 0, ttl=0.01)
+        backend.replace("all", {1: 1}, 0)
+        sleep(0.02)
+        self.assertIsNone(backend.watermark("week"))
+        self.assertEqual(backend.watermark("all"), 0)
+        self.assertNotIn("week", backend._scores)
+
+
+class FakeRedisLock:
+    """stand-in for a Redis lock, recording its use"""
+
+    def __init__(self, uses):
+        self.uses = uses
+
+    def __enter__(self):
+        self.uses.append("acquire")
+
+    def __exit__(self, *exc):
+        self.uses.append("release")
+
+
+class FakeRedisBoards:
+    """stand-in for the Redis commands of the leaderboard boards"""
+
+    def __init__(self):
+        self.data = {}
+
+    def lock(self, name, timeout=None):
+        return FakeRedisLock([])
+
+    def pipeline(self):
+        client = self
+
+        class Pipeline:
+            def __init__(self):
+                self.calls = []
+
+            def __getattr__(self, name):
+                return lambda *args, **kwargs: self.calls.append(
+                    (getattr(client, name), args, kwargs)
+                )
+
+            def execute(self):
+                return [call(*args, **kwargs) for call, args, kwargs in self.calls]
+
+        return Pipeline()
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None, keepttl=False):
+        self.data[key] = str(value).encode()
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def expire(self, key, ttl):
+        pass
+
+    def zadd(self, key, mapping, nx=False):
+        board = self.data.setdefault(key, {})
+        mapping = {
+            str(m): s for m, s in mapping.items() if not nx or str(m) not in board
+        }
+        board.update(mapping)
+        return len(mapping)
+
+    def zincrby(self, key, amount, member):
+        board = self.data.setdefault(key, {})
+        board[member] = board.get(member, 0) + amount
+
+    def zscore(self, key, member):
+        return self.data.get(key, {}).get(member)
+
+    def zremrangebyscore(self, key, low, high):
+        board = self.data.get(key, {})
+        for member in [m for m, s in board.items() if s <= high]:
+            del board[member]
+
+
+class TestRedisLeaderboardBackend(unittest.TestCase):
+    """Check the Redis boards are cleared under the shared Redis lock"""
+
+    def test_clear_holds_lock(self):
+        uses = []
+
+        class Client:
+            def lock(self, name, timeout=None):
+                uses.append(name)
+                return FakeRedisLock(uses)
+
+            def scan_iter(self, pattern):
+                uses.append(pattern)
+                return [b"qq:lb:all"]
+
+            def delete(self, *keys):
+                uses.append(keys)
+
+        leaderboard = Leaderboard(RedisLeaderboardBackend(Client()))
+        leaderboard.clear()
+        self.assertEqual(
+            uses, ["qq:lb-lock", "acquire", "qq:lb:*", (b"qq:lb:all",), "release"]
+        )
+
+    def test_apply_once(self):
+        """an attempt is added once to a loaded board, never at or below its
+        watermark, and forgotten once settled"""
+        client = FakeRedisBoards()
+        backend = RedisLeaderboardBackend(client)
+        self.assertFalse(backend.apply("all", 3, 1, 5))
+        backend.replace("all", {1: 2}, 2)
+        self.assertFalse(backend.apply("all", 2, 1, 5))
+        self.assertTrue(backend.apply("all", 3, 1, 5))
+        self.assertFalse(backend.apply("all", 3, 1, 5))
+        self.assertEqual(backend.score("all", 1), 7)
+        backend.settle("all", 3)
+        self.assertEqual(backend.watermark("all"), 3)
+        self.assertEqual(client.data["qq:lb:all:applied"], {})
+
+
+class QuizContentFixture(unittest.TestCase):
+    """a quiz of three single choice questions, stored out of order, the
+    question of order i having option i % 3 correct"""
+
+    def setUp(self):
+        self.storage = RelationalStorage("sqlite:///:memory:")
+        self.storage.reload(reset=True)
+        user = self.storage.new(User(email="u@x.com", password=b"pw", user_name="u"))
+        self.storage.save()
+        self.quiz = self.storage.new(
+            Quiz(title="q", category="c", difficulty=1, points=1, user_id=user.id)
+        )
+        self.storage.save()
+        for order in (2, 1, 3):
+            question = self.storage.new(
+                Question(
+                    statement=f"s{order}",
+                    quiz_id=self.quiz.id,
+                    points=order,
+                    type="SCQ",
+                    order=order,
+                )
+            )
+            self.storage.save()
+            for i in range(3):
+                self.storage.new(
+                    Answer(
+                        text=f"a{i}",
+                        order=i,
+                        question_id=question.id,
+                        correct=i == order % 3,
+                    )
+                )
+        self.storage.save()
+        self.storage.close()
+
+    def tearDown(self):
+        self.storage.close()
+
+    def submit(self, options):
+        """store an attempt of user 1 choosing `options` for each question"""
+        attempt = self.storage.new(
+            QuizAttempt(score=0, full_score=False, quiz_id=self.quiz.id, user_id=1)
+        )
+        self.storage.save()
+        questions = self.storage.query(Question).order_by(Question.order).all()
+        for question, chosen in zip(questions, options):
+            for answer in chosen:
+                self.storage.new(
+                    UserAnswer(
+                        attempt_id=attempt.id, answer=answer, question_id=question.id
+                    )
+                )
+        self.storage.save()
+        return attempt.id
+
+
+class TestQuizContent(QuizContentFixture):
+    """Check the quiz content loader"""
+
+    def test_single_query(self):
+        """the whole tree comes from one query, by question order"""
+        with query_budget(1):
+            content = load_quiz_content(self.storage, self.quiz.id)
+        self.assertEqual([q.statement for q in content.questions], ["s1", "s2", "s3"])
+        self.assertEqual(
+            [q.correct_answer for q in content.questions], [(1,), (2,), (0,)]
+        )
+        self.assertEqual(
+            content.to_dict()["questions"][0],
+            {
+                "statement": "s1",
+                "points": 1,
+                "type": "SCQ",
+                "options": ["a0", "a1", "a2"],
+            },
+        )
+
+    def test_missing_and_empty(self):
+        """unknown quizzes give None, quizzes without questions no questions"""
+        self.assertIsNone(load_quiz_content(self.storage, 999))
+        self.storage.query(Answer).delete()
+        self.storage.query(Question).delete()
+        self.assertEqual(load_quiz_content(self.storage, self.quiz.id).questions, ())
+
+
+class TestAnswerKeys(QuizContentFixture):
+    """Check the compiled answer keys"""
+
+    def test_grade(self):
+        """submissions are graded against the cached key"""
+        cache = AnswerKeyCache(ttl=60)
+        key = cache.get(self.storage, self.quiz.id)
+        self.assertEqual(list(key.masks), [0b10, 0b100, 0b1])
+        with query_budget(0):
+            key = cache.get(self.storage, self.quiz.id)
+            self.assertEqual(key.grade([[1], [2], [0]])[:2], (6, True))
+            self.assertEqual(key.grade([[1], [2, 1], [-1]])[:2], (1, False))
+
+    @parameterized.expand([("past_options", 3), ("huge", 10**9), ("negative", -5)])
+    def test_out_of_range_order(self, name, order):
+        """orders outside the options of a question are wrong, not shifted"""
+        key = AnswerKeyCache(ttl=60).get(self.storage, self.quiz.id)
+        self.assertEqual(key.grade([[1], [2], [order]])[:2], (3, False))
+        self.assertEqual(key.grade([[1, order], [2], [0]])[:2], (5, False))
+
+    def test_invalidated_by_answer_changes(self):
+        """committed answer changes drop the key and bump the quiz version"""
+        cache = AnswerKeyCache(ttl=60)
+        key = cache.get(self.storage, self.quiz.id)
+        # the first a0 option belongs to the question of order 2
+        answer = self.storage.search(Answer, text="a0")[0]
+        answer.correct = True
+        self.storage.save()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(
+            list(cache.get(self.storage, self.quiz.id).masks), [0b10, 0b101, 0b1]
+        )
+
+    def test_versions_within_a_second(self):
+        """each edit gets a new version, however close to the previous one"""
+        writer, reader = AnswerKeyCache(ttl=60), AnswerKeyCache(ttl=0)
+        version = reader.get(self.storage, self.quiz.id).version
+        answer_id = self.storage.search(Answer, text="a0")[0].id
+        for correct, masks in ((True, [0b10, 0b101, 0b1]), (False, [0b10, 0b100, 0b1])):
+            with self.storage.transaction() as session:
+                session.execute(
+                    sa.update(Answer)
+                    .where(Answer.id == answer_id)
+                    .values(correct=correct)
+                )
+                writer.touch(session, [self.quiz.id])
+            self.assertEqual(list(reader.get(self.storage, self.quiz.id).masks), masks)
+        self.assertEqual(reader.get(self.storage, self.quiz.id).version, version + 2)
+
+
+class TestRegrade(QuizContentFixture):
+    """Check the bulk regrade of stored attempts"""
+
+    def test_regrade(self):
+        """attempts are rescored against the current key in chunks"""
+        ids = [
+            self.submit([[1], [2], [0]]),
+            self.submit([[1], [0], [0]]),
+            self.submit([[0], [], [0, 1]]),
+        ]
+        report = regrade_quiz(self.storage.session, self.quiz.id, chunk_size=2)
+        self.assertEqual((report.attempts, report.changed), (3, 2))
+        self.storage.session.expire_all()
+        self.assertEqual(
+            [
+                (a.score, a.full_score)
+                for a in map(lambda id: self.storage.get(QuizAttempt, id), ids)
+            ],
+            [(6, True), (4, False), (0, False)],
+        )
+        report = regrade_quiz(self.storage.session, self.quiz.id)
+        self.assertEqual((report.attempts, report.changed), (3, 0))
+        self.assertIsNone(regrade_quiz(self.storage.session, 999))
+
+
+class TestInsertMany(QuizContentFixture):
+    """Check the chunked bulk insert of RelationalStorage"""
+
+    def test_insert_many(self):
+        """answer rows go in chunk_size at a time, with their unit of work"""
+        attempt_id = self.submit([])
+        rows = [
+            {"attempt_id": attempt_id, "answer": i, "question_id": 1} for i in range(5)
+        ]
+        with self.assertRaises(RuntimeError):
+            with self.storage.transaction():
+                self.storage.insert_many(UserAnswer, rows)
+                raise RuntimeError
+        self.assertEqual(self.storage.count(UserAnswer), 0)
+        with collect_queries() as stats:
+            with self.storage.transaction():
+                self.assertEqual(
+                    self.storage.insert_many(UserAnswer, rows, chunk_size=2), 5
+                )
+        self.assertEqual(stats.count, 3)
+        self.assertEqual(self.storage.count(UserAnswer), 5)
+
+
+class TestQuestionBulk(QuizContentFixture):
+    """Check the set-based question authoring"""
+
+    @parameterized.expand(
+        [
+            ("valid", "MCQ", ["a", "b", "c"], [0, 2], None),
+            ("type", "XYZ", ["a", "b"], [0], "type"),
+            ("scq_many", "SCQ", ["a", "b"], [0, 1], "answer option"),
+            ("tfq_range", "TFQ", ["t", "f", "x"], [2], "answer option"),
+            ("mcq_all", "MCQ", ["a", "b"], [0, 1], "answer option"),
+            ("mcq_range", "MCQ", ["a", "b", "c"], [3], "answer option"),
+            ("negative", "SCQ", ["a", "b"], [-1], "answer option"),
+            ("max_options", "SCQ", ["a"] * 64, [63], None),
+            ("too_many_options", "SCQ", ["a"] * 65, [0], "options"),
+        ]
+    )
+    def test_question_error(self, name, kind, options, correct, expected):
+        question = {"type": kind, "options": options, "correct_answer": correct}
+        self.assertEqual(question_error(question), expected)
+
+    def test_insert_questions(self):
+        """questions are appended in chunks and their ids kept in order"""
+        questions = [
+            {
+                "statement": f"n{i}",
+                "points": 1,
+                "type": "SCQ",
+                "options": ["x", "y"],
+                "correct_answer": [i % 2],
+            }
+            for i in range(5)
+        ]
+        session = self.storage.session
+        start = next_order(session, self.quiz.id)
+        self.assertEqual(start, 4)
+        with collect_queries() as stats:
+            with self.storage.transaction():
+                ids = insert_questions(
+                    session, self.quiz.id, questions, start, chunk_size=2
+                )
+        self.assertEqual(stats.count, 8)
+        content = load_quiz_content(self.storage, self.quiz.id)
+        self.assertEqual([q.id for q in content.questions[3:]], ids)
+        self.assertEqual(
+            [q.correct_answer for q in content.questions[3:]],
+            [(0,), (1,), (0,), (1,), (0,)],
+        )
+
+    def test_replace_questions(self):
+        """only the differing rows are written and the list order is kept"""
+        session = self.storage.session
+        content = load_quiz_content(self.storage, self.quiz.id)
+        first, second, third = (q.id for q in content.questions)
+        merged = merge_questions(
+            content,
+            [
+                {"question_id": third},
+                {"question_id": first, "statement": "renamed"},
+                {
+                    "statement": "n",
+                    "points": 1,
+                    "type": "TFQ",
+                    "options": ["t", "f"],
+                    "correct_answer": [0],
+                },
+            ],
+        )
+        with self.storage.transaction():
+            ids, key_changed = replace_questions(session, content, merged)
+        self.assertTrue(key_changed)
+        content = load_quiz_content(self.storage, self.quiz.id)
+        self.assertEqual([q.id for q in content.questions], ids)
+        self.assertEqual(ids[:2], [third, first])
+        self.assertEqual(
+            [q.statement for q in content.questions], ["s3", "renamed", "n"]
+        )
+        self.assertEqual(self.storage.count(Answer), 8)
+
+        merged = merge_questions(
+            content, [{"question_id": id, "statement": "x"} for id in ids]
+        )
+        with self.storage.transaction():
+            self.assertFalse(replace_questions(session, content, merged)[1])
+        content = load_quiz_content(self.storage, self.quiz.id)
+        merged = merge_questions(content, [{"question_id": id} for id in ids[::-1]])
+        with self.storage.transaction():
+            self.assertTrue(replace_questions(session, content, merged)[1])
+        with self.assertRaises(ValueError):
+            merge_questions(content, [{"question_id": ids[0], "correct_answer": [5]}])
+
+    def test_delete_questions(self):
+        """questions go away with their options in one statement per table"""
+        ids = [q.id for q in load_quiz_content(self.storage, self.quiz.id).questions]
+        with query_budget(3):
+            self.assertEqual(delete_questions(self.storage.session, ids[:2]), 2)
+        self.assertEqual(self.storage.count(Answer), 3)
+
+
+class TestQuestionStats(QuizContentFixture):
+    """Check the cached answer distribution of a question"""
+
+    def test_incremental(self):
+        """later reads only aggregate the attempts past the watermark"""
+        cache = QuestionStatsCache(lag=0)
+        question = self.storage.search(Question, order=1)[0]
+        self.submit([[1], [2], [0]])
+        self.submit([[0], [2], [0]])
+        stats = cache.get(self.storage, self.quiz.id, question.id)
+        self.assertEqual([o.count for o in stats.options], [1, 1, 0])
+        self.assertEqual((stats.correct_answers, stats.wrong_answers), (1, 1))
+
+        last = self.submit([[1], [], []])
+        with query_budget(3):
+            stats = cache.get(self.storage, self.quiz.id, question.id)
+        self.assertEqual(stats.watermark, last)
+        self.assertEqual((stats.attempts, stats.correct_answers), (3, 2))
+        self.assertEqual(
+            stats,
+            QuestionStatsCache(lag=0).get(self.storage, self.quiz.id, question.id),
+        )
+
+    def test_out_of_order_commits(self):
+        """attempts committed after a higher id are counted once settled"""
+        cache = QuestionStatsCache(lag=60)
+        question = self.storage.search(Question, order=1)[0]
+        for attempt_id, chosen in ((5, 1), (3, 0)):
+            self.storage.new(
+                QuizAttempt(
+                    id=attempt_id,
+                    score=0,
+                    full_score=False,
+                    quiz_id=self.quiz.id,
+                    user_id=1,
+                )
+            )
+            self.storage.save()
+            self.storage.new(
+                UserAnswer(
+                    attempt_id=attempt_id, answer=chosen, question_id=question.id
+                )
+            )
+            self.storage.save()
+            stats = cache.get(self.storage, self.quiz.id, question.id)
+            self.assertEqual(stats.watermark, 0)
+        self.assertEqual(
+            (stats.attempts, [o.count for o in stats.options]), (2, [1, 1, 0])
+        )
+
+        self.storage.query(QuizAttempt).update({"created_at": datetime(2020, 1, 1)})
+        self.storage.save()
+        stats = cache.get(self.storage, self.quiz.id, question.id)
+        self.assertEqual((stats.watermark, stats.attempts), (5, 2))
+        self.assertEqual([o.count for o in stats.options], [1, 1, 0])
+
+
+class TestScoreDistribution(QuizContentFixture):
+    """Check the score quantile sketch and histogram of a quiz"""
+
+    @parameterized.expand([(0.1,), (0.25,), (0.5,), (0.75,), (0.9,)])
+    def test_sketch_rank_error(self, q):
+        """quantiles stay within a small rank error of the exact ones"""
+        values = list(range(10000))
+        sketches = [KLLSketch(200), KLLSketch(200)]
+        for i, value in enumerate(reversed(values)):
+            sketches[i % 2].update(value)
+        sketches[0].merge(sketches[1])
+        self.assertLess(len(sketches[0]), 1000)
+        self.assertEqual(sketches[0].count, 10000)
+        (value,) = sketches[0].quantiles([q])
+        self.assertLess(abs(value / len(values) - q), 0.02)
+
+    def test_merge(self):
+        """distributions merge and survive a round trip through bytes"""
+        first, second = ScoreDistribution(points=6), ScoreDistribution(points=6)
+        first.extend([0, 3, 6])
+        second.extend([6, 6])
+        merged = merge_distributions(
+            ScoreDistribution.loads(d.dumps()) for d in (first, second)
+        )
+        self.assertEqual((merged.attempts, merged.points), (5, 6))
+        self.assertEqual(merged.histogram.tolist(), [1, 0, 0, 0, 0, 1, 0, 0, 0, 3])
+        self.assertEqual(merged.to_dict([0.5])["quantiles"][0]["score"], 6)
+        merged.merge(ScoreDistribution(points=4))
+        self.assertIsNone(merged.to_dict([0.5])["points"])
+        with self.assertRaises(ValueError):
+            merged.merge(ScoreDistribution(bins=4))
+        self.assertEqual(merge_distributions([]).attempts, 0)
+
+    def record(self, attempts):
+        """record (user id, score) attempts as the submissions do"""
+        session = self.storage.session
+        for user_id, score in attempts:
+            self.storage.new(
+                QuizAttempt(
+                    score=score,
+                    full_score=score == 6,
+                    quiz_id=self.quiz.id,
+                    user_id=user_id,
+                )
+            )
+            session.flush()
+            QuizStats.record(session, self.quiz.id, score, score == 6, user_id, 6)
+        self.storage.save()
+
+    def totals(self):
+        self.storage.session.expire_all()
+        stats = self.storage.search(QuizStats, quiz_id=self.quiz.id)[0]
+        state = stats.column_state()
+        for key in ("id", "created_at", "updated_at", "distribution"):
+            del state[key]
+        return state, stats.score_distribution.to_dict([0.25, 0.5, 0.75])
+
+    def test_record(self):
+        """recorded attempts match a rebuild from the stored scores"""
+        self.record((1, score) for score in (6, 4, 0, 4))
+        recorded = self.totals()
+        self.assertEqual((recorded[1]["attempts"], recorded[1]["median"]), (4, 4))
+
+        QuizStats.rebuild_distributions(self.storage.session, self.quiz.id)
+        self.storage.save()
+        self.assertEqual(self.totals(), recorded)
+
+    def test_record_matches_rebuild(self):
+        """every rollup column of recorded attempts matches a rebuild"""
+        self.storage.new(User(email="v@x.com", password=b"pw", user_name="v"))
+        self.storage.save()
+        self.record([(1, 6), (2, 3), (1, 0), (2, 6), (1, 4)])
+        recorded = self.totals()
+        self.assertEqual(
+            recorded[0],
+            {
+                "quiz_id": self.quiz.id,
+                "attempts": 5,
+                "users": 2,
+                "full_scores": 2,
+                "score_sum": 19,
+                "score_sq_sum": 97,
+                "min_score": 0,
+                "max_score": 6,
+            },
+        )
+        self.assertEqual(QuizStats.rebuild(self.storage.session, self.quiz.id), 1)
+        self.storage.save()
+        self.assertEqual(self.totals(), recorded)
+
+
+class TestTrigramIndex(unittest.TestCase):
+    """Check the autocomplete lookups of the trigram index"""
+
+    def setUp(self):
+        self.index = TrigramIndex(10)
+        self.index.load(
+            [(1, "alice"), (2, "Malik"), (3, "alicia"), (4, "bob"), (5, "Ali")]
+        )
+
+    @parameterized.expand(
+        [
+            ("al", [5, 1, 3]),
+            ("ALI", [5, 1, 3, 2]),
+            ("lic", [1, 3]),
+            ("zzz", []),
+        ]
+    )
+    def test_search(self, text, expected):
+        """prefix matches rank first, then earlier and shorter matches"""
+        self.assertEqual([id for id, _ in self.index.search(text)], expected)
+
+    def test_incremental_updates(self):
+        """added, renamed and removed names are found accordingly"""
+        self.index.add(6, "Alina")
+        self.index.add(1, "carol")
+        self.index.remove(3)
+        self.assertEqual([id for id, _ in self.index.search("ali")], [5, 6, 2])
+        self.assertEqual(self.index.search("car"), [(1, "carol")])
+
+    def test_bound(self):
+        """going over the bound empties the index and flags it"""
+        for id in range(6, 12):
+            self.index.add(id, f"user{id}")
+        self.assertFalse(self.index.complete)
+        self.assertEqual(self.index.stats()["entries"], 0)
+
+
+class TestAutocompleteRefresh(unittest.TestCase):
+    """Check the background rebuild of the autocomplete indexes"""
+
+    def setUp(self):
+        path = os.path.join(tempfile.mkdtemp(), "autocomplete.db")
+        self.storage = RelationalStorage(f"sqlite:///{path}")
+        self.storage.reload(reset=True)
+        self.storage.new(User(email="a@x.com", password=b"pw", user_name="alice"))
+        self.storage.save()
+        self.autocomplete = Autocomplete(max_entries=10, refresh=0.01)
+        self.autocomplete.build(self.storage)
+
+    def tearDown(self):
+        for name, fn in (
+            ("after_flush", self.autocomplete._collect),
+            ("after_commit", self.autocomplete._apply),
+            ("after_soft_rollback", self.autocomplete._discard),
+        ):
+            sa.event.remove(Session, name, fn)
+        self.storage.dispose()
+
+    def test_stale_search_serves_old_index(self):
+        """a stale search starts one rebuild, answers from the old indexes
+        and commits made during the rebuild survive the swap"""
+        loading, resume = threading.Event(), threading.Event()
+        query = self.storage.query
+
+        def slow_query(*args, **kwargs):
+            loading.set()
+            resume.wait(5)
+            return query(*args, **kwargs)
+
+        sleep(0.02)
+        with unittest.mock.patch.object(self.storage, "query", slow_query):
+            self.assertEqual(self.autocomplete.search("users", "ali"), [(1, "alice")])
+            self.assertTrue(loading.wait(5))
+            old = self.autocomplete.indexes
+            self.assertTrue(self.autocomplete._refreshing.locked())
+            self.autocomplete.search("users", "ali")
+            self.storage.new(User(email="b@x.com", password=b"pw", user_name="alina"))
+            self.storage.save()
+            resume.set()
+            for _ in range(100):
+                if not self.autocomplete._refreshing.locked():
+                    break
+                sleep(0.05)
+        self.assertIsNot(self.autocomplete.indexes, old)
+        self.assertEqual(
+            self.autocomplete.search("users", "ali"), [(1, "alice"), (2, "alina")]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
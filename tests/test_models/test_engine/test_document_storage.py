@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Tests for the DocumentStorage engine
+"""
+import unittest
+
+import mongomock
+from pymongo.errors import BulkWriteError
+
+from models import Quiz, User
+from models.engine.document_storage import DocumentStorage
+
+
+class TestDocumentStorage(unittest.TestCase):
+    """Tests for the MongoDB storage engine, on a mongomock client"""
+
+    def setUp(self):
+        self.client = mongomock.MongoClient()
+        self.storage = DocumentStorage(self.client)
+        self.storage.reload(reset=True)
+        self.written = []
+        self.storage.add_write_listener(self.written.append)
+
+    def user(self, i):
+        return User(email=f"u{i}@x.com", password=b"pw", user_name=f"user{i}")
+
+    def test_new_and_get(self):
+        """added objects get their id at once and are written on save"""
+        user = self.storage.new(self.user(0))
+        self.assertEqual(user.id, 1)
+        self.assertIsNone(self.storage.get(User, user.id))
+        self.storage.save()
+        self.assertEqual(self.written, [["user"]])
+        stored = self.storage.get(User, user.id)
+        self.assertEqual((stored.id, stored.user_name), (1, "user0"))
+        self.assertIsNotNone(stored.created_at)
+        self.assertIsNone(self.storage.get(User, 404))
+
+    def test_insert_many_reserves_ids_once(self):
+        """a batch reserves consecutive ids with a single counter update"""
+        users = self.storage.insert_many([self.user(i) for i in range(3)])
+        self.storage.save()
+        self.assertEqual([u.id for u in users], [1, 2, 3])
+        counters = self.storage._db["counters"]
+        self.assertEqual(counters.find_one({"_id": "user"})["seq"], 3)
+        self.assertEqual(self.storage.new(self.user(3)).id, 4)
+
+    def test_get_many_and_search(self):
+        """lookups keep input order and project the requested fields"""
+        self.storage.insert_many([self.user(i) for i in range(3)])
+        self.storage.save()
+        users = self.storage.get_many(User, [3, 404, 1], fields=["id", "user_name"])
+        self.assertEqual(users[0].user_name, "user2")
+        self.assertIsNone(users[0].email)
+        self.assertEqual([u and u.id for u in users], [3, None, 1])
+        self.assertEqual(
+            [u.id for u in self.storage.search(User, user_name="user1")], [2]
+        )
+        self.assertEqual(len(self.storage.search(User, id=3)), 1)
+        self.assertEqual((self.storage.count(User), self.storage.count(Quiz)), (3, 0))
+        self.assertEqual(sorted(self.storage.all(User)), ["User.1", "User.2", "User.3"])
+
+    def test_update_and_delete(self):
+        """updates and deletes are buffered until save"""
+        user = self.storage.new(self.user(0))
+        self.storage.save()
+        user.user_name = "renamed"
+        self.storage.update(user)
+        self.storage.save()
+        self.assertEqual(self.storage.get(User, user.id).user_name, "renamed")
+        self.storage.delete(user)
+        self.assertIsNotNone(self.storage.get(User, user.id))
+        self.storage.save()
+        self.assertIsNone(self.storage.get(User, user.id))
+
+    def test_transaction(self):
+        """a failing block writes nothing, a passing one saves on exit"""
+        with self.assertRaises(RuntimeError):
+            with self.storage.transaction():
+                self.storage.new(self.user(0))
+                raise RuntimeError
+        self.assertEqual(self.storage.count(User), 0)
+        with self.storage.transaction():
+            self.storage.new(self.user(1))
+        self.assertEqual(self.storage.count(User), 1)
+
+    def test_unique_indexes(self):
+        """unique model columns are enforced by the collection indexes"""
+        self.storage.new(self.user(0))
+        self.storage.save()
+        self.storage.new(self.user(0))
+        with self.assertRaises(BulkWriteError):
+            self.storage.save()
+        names = self.storage._db["quiz"].index_information()
+        self.assertIn("ix_quiz_group_id_title", names)
+
+
+if __name__ == "__main__":
+    unittest.main()